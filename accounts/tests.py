@@ -1,3 +1,160 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.base import UpdateError
+from django.contrib.sessions.models import Session
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from moviestore import sessions
+
+from perf.seeding import SEED_PASSWORD
+from perf.testing import ViewBudgetTestCase
+
+
+class AccountViewBudgetTests(ViewBudgetTestCase):
+    def heaviest_customer(self):
+        # The user with the most orders is the worst case for the order history page.
+        counts = {}
+        for order in self.seeded.orders:
+            counts[order.user_id] = counts.get(order.user_id, 0) + 1
+        return User.objects.get(pk=max(counts, key=counts.get))
+
+    def test_signup(self):
+        self.assertViewBudget('accounts.signup[get]', 0, reverse('accounts.signup'), status=200)
+        self.assertViewBudget('accounts.signup[post]', 8, reverse('accounts.signup'), method='post', data={
+            'username': 'budget_signup', 'password1': 'Sup3r-secret-pw', 'password2': 'Sup3r-secret-pw',
+            'security_question': 'fav_color', 'security_answer': 'blue',
+        }, status=302)
+
+    def test_login_logout(self):
+        user = self.seeded.users[0]
+        self.assertViewBudget('accounts.login[get]', 0, reverse('accounts.login'), status=200)
+        self.assertViewBudget('accounts.login[post]', 9, reverse('accounts.login'), method='post',
+                              data={'username': user.username, 'password': SEED_PASSWORD}, status=302)
+        self.assertViewBudget('accounts.logout', 4, reverse('accounts.logout'), status=302)
+
+    def test_orders(self):
+        self.login(self.heaviest_customer())
+        # Session, user, one page of orders and one prefetch for all their items and movies.
+        response = self.assertViewBudget('accounts.orders', 4, reverse('accounts.orders'),
+                                         data={'page_size': 3}, status=200)
+        page = response.context['template_data']['page']
+        older = self.assertViewBudget('accounts.orders[next]', 4, reverse('accounts.orders'),
+                                      data={'page_size': 3, 'cursor': page.next_cursor}, status=200)
+        newest, oldest_on_next = page.items[-1], older.context['template_data']['orders'][0]
+        self.assertGreater((newest.date, newest.id), (oldest_on_next.date, oldest_on_next.id))
+
+    def test_settings(self):
+        self.login()
+        self.assertViewBudget('accounts.settings[get]', 3, reverse('accounts.settings'), status=200)
+        self.assertViewBudget('accounts.settings[post]', 5, reverse('accounts.settings'), method='post',
+                              data={'first_name': 'Ada', 'security_question': 'fav_color', 'security_answer': 'blue'},
+                              status=200)
+
+    def test_forgot_password_flow(self):
+        user = self.seeded.users[1]
+        self.assertViewBudget('accounts.forgot_password[get]', 0, reverse('accounts.forgot_password'), status=200)
+        self.assertViewBudget('accounts.forgot_password[post]', 1, reverse('accounts.forgot_password'),
+                              method='post', data={'username': user.username}, status=302)
+        url = reverse('accounts.verify_security') + f'?username={user.username}'
+        self.assertViewBudget('accounts.verify_security[get]', 2, url, status=200)
+        self.assertViewBudget('accounts.verify_security[post]', 10, url, method='post',
+                              data={'username': user.username, 'security_answer': 'blue'}, status=302)
+
+
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        sessions.get_cache().clear()
+        self.store = sessions.SessionStore()
+        self.store['cart'] = {'1': 2}
+        self.store.create()
+
+    def reopen(self):
+        return sessions.SessionStore(self.store.session_key)
+
+    def test_reads_come_from_the_lru_and_unchanged_writes_are_skipped(self):
+        store = self.reopen()
+        with self.assertNumQueries(0):
+            self.assertEqual(store['cart'], {'1': 2})
+            store['cart'] = {'1': 2}
+            store.save()
+        store['cart'] = {'1': 3}
+        with self.assertNumQueries(1):  # one conditional UPDATE, no savepoint
+            store.save()
+        self.assertEqual(Session.objects.get().get_decoded(), {'cart': {'1': 3}})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.reopen()['cart'], {'1': 3})
+
+    def test_expired_lru_entries_and_stale_expiry_go_to_the_database(self):
+        with override_settings(SESSION_LRU_TTL=0):
+            with self.assertNumQueries(1):
+                store = self.reopen()
+                self.assertEqual(store['cart'], {'1': 2})
+        Session.objects.update(expire_date=timezone.now() + timedelta(days=1))
+        store = self.reopen()
+        store.modified = True
+        store.save()
+        self.assertGreater(Session.objects.get().expire_date, timezone.now() + timedelta(days=7))
+
+    def test_delete_is_seen_at_once(self):
+        self.reopen().delete()
+        self.assertEqual(self.reopen().load(), {})
+        self.assertFalse(Session.objects.exists())
+
+    def as_worker(self, cache):
+        # Each worker process has its own LRU; swapping the module's cache simulates switching process.
+        self.enterContext(mock.patch.object(sessions, '_cache', cache))
+
+    def test_stale_copy_in_another_worker_does_not_overwrite_newer_writes(self):
+        worker_a, worker_b = sessions.SessionCache(), sessions.SessionCache()
+        for worker in (worker_a, worker_b):
+            self.as_worker(worker)
+            self.reopen().load()
+        self.as_worker(worker_a)
+        store = self.reopen()
+        store['cart'] = {'1': 2, '2': 1}
+        store.save()
+        # Worker B still has the original cart cached and adds a different movie to it.
+        self.as_worker(worker_b)
+        store = self.reopen()
+        store['cart'] = {'1': 2, '3': 1}
+        with self.assertRaises(UpdateError):
+            store.save()
+        self.assertEqual(Session.objects.get().get_decoded(), {'cart': {'1': 2, '2': 1}})
+        # The stale copy was dropped, so B's next request sees A's cart.
+        self.assertEqual(self.reopen()['cart'], {'1': 2, '2': 1})
+
+    def test_changes_to_different_keys_are_merged(self):
+        worker_a, worker_b = sessions.SessionCache(), sessions.SessionCache()
+        for worker in (worker_a, worker_b):
+            self.as_worker(worker)
+            self.reopen().load()
+        self.as_worker(worker_a)
+        store = self.reopen()
+        store['cart'] = {'1': 5}
+        store.save()
+        self.as_worker(worker_b)
+        store = self.reopen()
+        store['theme'] = 'dark'
+        store.save()
+        self.assertEqual(Session.objects.get().get_decoded(), {'cart': {'1': 5}, 'theme': 'dark'})
+
+    def test_signed_in_sessions_are_not_cached(self):
+        store = self.reopen()
+        store[SESSION_KEY] = '1'
+        store.save()
+        # A logout handled by another worker deletes the row; this worker must not keep serving it.
+        Session.objects.all().delete()
+        self.assertEqual(self.reopen().load(), {})
+
+    def test_clear_expired_deletes_in_batches(self):
+        past = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create([Session(session_key=f'old-{n}', session_data='', expire_date=past)
+                                     for n in range(5)])
+        with self.assertNumQueries(4 + 3):  # three batches of up to two, then one empty SELECT
+            self.assertEqual(sessions.SessionStore.clear_expired(batch_size=2), 5)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [self.store.session_key])
@@ -6,6 +6,10 @@ from django.contrib.auth import authenticate, login as auth_login, logout as aut
 from .forms import CustomUserCreationForm, CustomErrorList, ProfileForm
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.conf import settings as django_settings
+from django.db.models import Prefetch
+from cart.models import Item
+from moviestore.pagination import paginate_keyset, parse_page_size
 
 #We import login_required, which is a decorator to ensure that only authenticated users can access specific view functions. A Django decorator is a function that wraps another function or method to modify its behavior. Decorators are commonly used for things such as authentication, permissions, and logging.
 @login_required
@@ -90,8 +94,15 @@ def orders(request):
     #We define the template_data variable and assign it a title.
     #We retrieve all orders belonging to the currently logged-in user (request.user). The order_set attribute is used to access the related orders associated with the user through their relationship. Remember that there is a ForeignKey relationship between the User model and the Order model.
     
+    #We show the newest orders first, one page at a time (keyset pagination on date and id, see moviestore/pagination.py). The items of the whole page and their movies are loaded with one extra query through prefetch_related, instead of one query per order and one per item.
+    items = Item.objects.select_related('movie')
+    orders = request.user.order_set.prefetch_related(Prefetch('item_set', queryset=items))
+    page = paginate_keyset(orders, ('-date', '-id'), request.GET.get('cursor'),
+                           parse_page_size(request.GET.get('page_size'), django_settings.ORDERS_PAGE_SIZE))
+
     #Finally, we pass the orders to the template and render it.
-    template_data['orders'] = request.user.order_set.all()
+    template_data['orders'] = page.items
+    template_data['page'] = page
     return render(request, 'accounts/orders.html',
         {'template_data': template_data})
 
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class CartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cart'
+
+    def ready(self):
+        # Any change to a movie may change its name or price, which invalidates the snapshots kept in carts.
+        from movies.models import Movie
+        from .store import bump_catalog_version
+        post_save.connect(bump_catalog_version, sender=Movie, dispatch_uid='cart.catalog_version.save')
+        post_delete.connect(bump_catalog_version, sender=Movie, dispatch_uid='cart.catalog_version.delete')
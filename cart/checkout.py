@@ -0,0 +1,111 @@
+"""
+The checkout write path.
+
+place_order() turns a session cart into an Order and its Items as a single
+transaction with a fixed number of queries, however many titles are in the
+cart:
+
+1. one SELECT that snapshots the current price of every movie in the cart,
+2. one INSERT for the order,
+3. one bulk INSERT for all line items,
+4. the rollup updates from rollups.record_order(), the co-purchase
+   updates from recommendations.copurchase.record_order() (a fixed number
+   of queries each), one UPDATE of the movies' trending scores and, for
+   addresses not in the geocoding cache, one GeocodeJob INSERT.
+
+On SQLite every autocommitted write is its own fsync, so saving items one by
+one made a 30-title checkout cost 31 commits; now it costs one. If anything
+fails half way, nothing is written.
+
+Quantities are validated before the transaction starts; parse_quantities()
+raises InvalidCart for anything that is not a positive whole number.
+"""
+from dataclasses import dataclass
+
+from django.db import transaction
+
+from movies import trending
+from movies.models import Movie
+from recommendations import copurchase
+
+from . import jobs, rollups
+from .models import Item, Order
+from .store import InvalidQuantity, parse_quantity
+
+
+class InvalidCart(ValueError):
+    """The cart cannot be checked out as it is (bad quantity, empty cart)."""
+
+
+@dataclass
+class PlacedOrder:
+    order: Order
+    items: list
+
+
+def parse_quantities(cart):
+    """
+    Return {movie_id: quantity} with integer keys and values.
+
+    The cart store already keeps integers, but checkout does not rely on
+    that: every entry is checked again before anything is written.
+    """
+    quantities = {}
+    for movie_id, quantity in cart.items():
+        try:
+            quantities[int(movie_id)] = parse_quantity(quantity)
+        except (TypeError, ValueError) as exc:
+            message = str(exc) if isinstance(exc, InvalidQuantity) else f'"{movie_id}" is not a movie.'
+            raise InvalidCart(message) from None
+    if not quantities:
+        raise InvalidCart('Your cart is empty.')
+    return quantities
+
+
+def snapshot_prices(movie_ids):
+    """Current price of each movie, read in one query. Movies deleted since they were added are left out."""
+    return dict(Movie.objects.filter(id__in=movie_ids).values_list('id', 'price'))
+
+
+def place_order(user, quantities, city='', state='', country='', location=None, locate_later=False):
+    """
+    Create the order for quantities ({movie_id: int}) in one transaction.
+
+    location is an optional GeocodeResult for the shipping address; with
+    locate_later the order is queued for the geocoding worker instead (see
+    cart/jobs.py). Returns a PlacedOrder; raises InvalidCart if none of the
+    movies exist any more.
+    """
+    with transaction.atomic():
+        prices = snapshot_prices(quantities)
+        if not prices:
+            raise InvalidCart('None of the movies in your cart are available any more.')
+
+        order = Order(
+            user=user,
+            total=sum(prices[movie_id] * quantities[movie_id] for movie_id in prices),
+            city=city,
+            state=state,
+            country=country,
+        )
+        if location is not None:
+            order.latitude = location.latitude
+            order.longitude = location.longitude
+        order.save()
+
+        # Iterate in cart order so line items keep the order the customer added them in.
+        items = Item.objects.bulk_create([
+            Item(order=order, movie_id=movie_id, price=prices[movie_id], quantity=quantity)
+            for movie_id, quantity in quantities.items()
+            if movie_id in prices
+        ])
+
+        # Count this order in the regional popularity rollup that feeds the trends map.
+        rollups.record_order(order, list(prices))
+        # Count the movies bought together for "customers who bought this also bought".
+        copurchase.record_order(list(prices))
+        # Bump the trending score of every movie in the order (one UPDATE).
+        trending.record_purchase(list(prices))
+        if locate_later:
+            jobs.enqueue(order)
+    return PlacedOrder(order=order, items=items)
@@ -0,0 +1,143 @@
+"""
+Server-side clustering of the regional popularity rollup for the trends map.
+
+Instead of sending every (region, movie) row to the browser, the map asks
+for the rows inside its viewport at its zoom level. We snap each rollup row
+to a grid cell whose size follows the zoom (CELL_PX screen pixels at that
+zoom, in degrees of longitude and latitude), and return one cluster per cell:
+
+* its purchase-weighted centre,
+* the total purchases and number of distinct movies in it,
+* the REGIONAL_TRENDS_TOP_K most purchased movies.
+
+Grouping and ranking happen in SQL (see moviestore/topk.py): the query
+returns at most top rows per cell, each carrying its cell's totals, ordered
+by cell. Titles and posters are then read for those movies only, so the
+ranking query never joins the catalog. clusters() is a generator and the
+view streams its output.
+Latitude cells are the same size in degrees as longitude cells, which is
+close enough to Web Mercator at the latitudes people shop from.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import F, FloatField, IntegerField, Q, Sum, Window
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from movies.models import Movie
+from moviestore.topk import PartitionCount, PartitionSum, top_k
+
+from .models import RegionalPopularity
+
+CELL_PX = 64
+TILE_PX = 256
+MAX_ZOOM = 21
+
+
+class InvalidViewport(ValueError):
+    pass
+
+
+def parse_bbox(value):
+    """Parse "west,south,east,north" in degrees. west > east means the box crosses the antimeridian."""
+    try:
+        west, south, east, north = (float(part) for part in (value or '').split(','))
+    except ValueError:
+        raise InvalidViewport('bbox must be "west,south,east,north".') from None
+    if not (-90 <= south <= north <= 90) or not (-180 <= west <= 180 and -180 <= east <= 180):
+        raise InvalidViewport('bbox is out of range.')
+    return west, south, east, north
+
+
+def parse_zoom(value):
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        raise InvalidViewport('zoom must be an integer.') from None
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise InvalidViewport(f'zoom must be between 0 and {MAX_ZOOM}.')
+    return zoom
+
+
+def cell_size(zoom):
+    """Width of a cluster cell in degrees at this zoom level."""
+    return 360.0 / (2 ** zoom * (TILE_PX // CELL_PX))
+
+
+def _viewport_filter(west, south, east, north):
+    lng = Q(longitude__gte=west, longitude__lte=east) if west <= east else \
+        Q(longitude__gte=west) | Q(longitude__lte=east)
+    return Q(latitude__gte=south, latitude__lte=north) & lng
+
+
+def clusters(bbox, zoom, days=None, top=None):
+    """Yield one dict per non-empty cell in the viewport, in cell order."""
+    top = top or settings.REGIONAL_TRENDS_TOP_K
+    size = cell_size(zoom)
+    buckets = RegionalPopularity.objects.filter(_viewport_filter(*bbox))
+    if days:
+        buckets = buckets.filter(day__gte=timezone.now().date() - timedelta(days=days - 1))
+
+    # Shifting by +180/+90 makes both offsets non-negative, so CAST AS INTEGER is floor().
+    cell = [F('cx'), F('cy')]
+    grouped = (
+        buckets
+        .annotate(
+            cx=Cast((F('longitude') + 180.0) / size, IntegerField()),
+            cy=Cast((F('latitude') + 90.0) / size, IntegerField()),
+        )
+        .values('cx', 'cy', 'movie_id')
+        .annotate(total=Sum('purchases'))
+        .annotate(
+            cell_purchases=Window(PartitionSum(Sum('purchases'), output_field=IntegerField()), partition_by=cell),
+            cell_movies=Window(PartitionCount(), partition_by=cell),
+            lat_weighted=Window(PartitionSum(Sum(F('latitude') * F('purchases')), output_field=FloatField()),
+                                partition_by=cell),
+            lng_weighted=Window(PartitionSum(Sum(F('longitude') * F('purchases')), output_field=FloatField()),
+                                partition_by=cell),
+        )
+    )
+    rows = list(top_k(grouped, cell, (F('total').desc(), F('movie_id').asc()), top).order_by('cx', 'cy', 'rank'))
+    movies = {movie_id: (name, image) for movie_id, name, image in
+              Movie.objects.filter(id__in={row['movie_id'] for row in rows}).values_list('id', 'name', 'image')}
+
+    cluster = None
+    for row in rows:
+        title, image = movies[row['movie_id']]
+        key = (row['cx'], row['cy'])
+        if cluster is None or cluster['key'] != key:
+            if cluster is not None:
+                yield _finish(cluster, zoom)
+            cluster = {'key': key, 'purchases': row['cell_purchases'], 'movies': row['cell_movies'],
+                       'lat': row['lat_weighted'], 'lng': row['lng_weighted'], 'top': []}
+        cluster['top'].append({
+            'movie_id': row['movie_id'],
+            'title': title,
+            'poster_url': default_storage.url(image) if image else None,
+            'purchases': row['total'],
+        })
+    if cluster is not None:
+        yield _finish(cluster, zoom)
+
+
+def _finish(cluster, zoom):
+    purchases = cluster['purchases'] or 1
+    return {
+        'cell': '%d/%d/%d' % ((zoom,) + cluster['key']),
+        'latitude': round(cluster['lat'] / purchases, 5),
+        'longitude': round(cluster['lng'] / purchases, 5),
+        'purchases': cluster['purchases'],
+        'movies': cluster['movies'],
+        'top': cluster['top'],
+    }
+
+
+def as_feature(cluster):
+    return {
+        'type': 'Feature',
+        'id': cluster['cell'],
+        'geometry': {'type': 'Point', 'coordinates': [cluster['longitude'], cluster['latitude']]},
+        'properties': {key: cluster[key] for key in ('purchases', 'movies', 'top')},
+    }
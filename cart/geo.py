@@ -0,0 +1,178 @@
+"""
+Spatial and regional keys for orders.
+
+Order.latitude/longitude are plain floats, so "orders in this area" used to
+mean a full table scan. Every order now also stores
+
+* geohash: the standard base-32 geohash of its coordinates, GEOHASH_PRECISION
+  characters long (a cell of roughly 38 m x 19 m). Nearby points share a
+  prefix, and every point inside a cell sorts between the cell's prefix and
+  the prefix followed by '~', so a cell is one range scan on the index.
+* region_key: the shipping city/state/country normalized (case, accents,
+  punctuation, whitespace) into one string, so "St. Louis, MO" and
+  "st louis,  mo" are the same region.
+
+Both are filled in by Order.save(), by the geocoding worker when it adds
+coordinates later, and for existing rows by `manage.py backfill_order_geo`.
+
+in_bbox() and within_radius() turn a query area into at most MAX_CELLS
+geohash prefixes and filter on them, so only the index ranges for those
+cells are read; the exact coordinate test then runs on that small set.
+"""
+import math
+import re
+import unicodedata
+
+from django.db.models import Q
+
+GEOHASH_PRECISION = 8
+MAX_CELLS = 32
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0088
+
+# Sorts after every geohash character, so [prefix, prefix + '~') holds exactly the hashes starting with prefix.
+_AFTER = '~'
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a point, precision characters long."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        span, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (span[0] + span[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def _normalize(part):
+    # Strip accents (Bogotá -> bogota), then reduce punctuation and runs of whitespace to single spaces.
+    text = unicodedata.normalize('NFKD', part or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def region_key(city, state, country):
+    """Canonical "city|state|country" key; '' when the order has no address."""
+    parts = [_normalize(part) for part in (city, state, country)]
+    return '|'.join(parts) if any(parts) else ''
+
+
+def geohash_for(latitude, longitude):
+    """Geohash for an order's coordinates; '' while it has none."""
+    return encode(latitude, longitude) if latitude is not None and longitude is not None else ''
+
+
+def _split_antimeridian(west, south, east, north):
+    if west <= east:
+        return [(west, south, east, north)]
+    return [(west, south, 180.0, north), (-180.0, south, east, north)]
+
+
+def _cells_for(box, precision):
+    west, south, east, north = box
+    height, width = cell_size(precision)
+    # Snap the box to the cell grid and take the centre of every cell it touches.
+    rows = range(math.floor((south + 90) / height), math.floor((min(north, 90 - 1e-9) + 90) / height) + 1)
+    cols = range(math.floor((west + 180) / width), math.floor((min(east, 180 - 1e-9) + 180) / width) + 1)
+    return {
+        encode(-90 + (row + 0.5) * height, -180 + (col + 0.5) * width, precision)
+        for row in rows for col in cols
+    }
+
+
+def covering_cells(west, south, east, north, max_cells=MAX_CELLS):
+    """
+    The geohash prefixes of the cells covering a bounding box.
+
+    Picks the finest precision (up to GEOHASH_PRECISION) whose cover has at
+    most max_cells cells. west > east means the box crosses the antimeridian.
+    """
+    boxes = _split_antimeridian(west, south, east, north)
+    cells = {''}
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(precision)
+        estimate = sum(((b[3] - b[1]) / height + 2) * ((b[2] - b[0]) / width + 2) for b in boxes)
+        if estimate > max_cells * 4:
+            break
+        candidate = set().union(*(_cells_for(box, precision) for box in boxes))
+        if len(candidate) > max_cells:
+            break
+        cells = candidate
+    return sorted(cells)
+
+
+def cells_filter(cells, field='geohash'):
+    """Q matching rows whose geohash lies in any of cells, as index range scans."""
+    if cells == ['']:
+        return ~Q(**{field: ''})
+    condition = Q()
+    for prefix in cells:
+        condition |= Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + _AFTER})
+    return condition
+
+
+def in_bbox(queryset, west, south, east, north):
+    """Rows of queryset (Orders, or anything with geohash/latitude/longitude) inside the box."""
+    longitude = Q(longitude__gte=west, longitude__lte=east) if west <= east else \
+        Q(longitude__gte=west) | Q(longitude__lte=east)
+    return queryset.filter(cells_filter(covering_cells(west, south, east, north)),
+                           longitude, latitude__gte=south, latitude__lte=north)
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance by the haversine formula."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(latitude, longitude, km):
+    """A bounding box (west, south, east, north) that contains the circle."""
+    dlat = math.degrees(km / EARTH_RADIUS_KM)
+    south, north = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+    if south == -90.0 or north == 90.0:
+        return -180.0, south, 180.0, north
+    dlng = math.degrees(km / (EARTH_RADIUS_KM * math.cos(math.radians(max(abs(south), abs(north))))))
+    if dlng >= 180:
+        return -180.0, south, 180.0, north
+    west = (longitude - dlng + 540) % 360 - 180
+    east = (longitude + dlng + 540) % 360 - 180
+    return west, south, east, north
+
+
+def within_radius(queryset, latitude, longitude, km):
+    """
+    Rows of queryset within km of the point, nearest first, as a list.
+
+    The database narrows the rows down to the covering cells of the
+    circle's bounding box; the exact distance is then checked here.
+    """
+    candidates = in_bbox(queryset, *radius_bbox(latitude, longitude, km))
+    found = []
+    for row in candidates.iterator():
+        distance = distance_km(latitude, longitude, row.latitude, row.longitude)
+        if distance <= km:
+            row.distance_km = distance
+            found.append(row)
+    found.sort(key=lambda row: row.distance_km)
+    return found
@@ -0,0 +1,235 @@
+"""
+Geocoding for checkout addresses, with a two-level cache in front of the API.
+
+Most customers ship to a few thousand distinct city/state/country
+combinations, so almost every lookup is a repeat. geocode() normalizes the
+address and checks, in order:
+
+1. an in-process LRU (no I/O at all),
+2. the GeocodeCacheEntry table (one indexed read, shared by all workers),
+3. the configured geocoder backend (a network call for Google Maps).
+
+Answers are cached for GEOCODE_CACHE_TTL seconds. Addresses the backend
+could not resolve are cached too ("negative caching"), for the shorter
+GEOCODE_NEGATIVE_TTL, so a typo does not hit the API on every checkout.
+Backend errors (timeouts, quota) are never cached.
+
+Checkout itself only calls peek(), which answers from the two caches and
+never from the backend; cache misses are queued as GeocodeJob rows and
+resolved by the worker in cart/jobs.py.
+
+The backend is chosen with the GEOCODER_BACKEND setting. StubGeocoder
+answers locally and is meant for tests, load tests and offline development.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class GeocodeResult:
+    latitude: float
+    longitude: float
+    formatted_address: str = ''
+
+
+class GeocoderError(Exception):
+    """The backend failed (network, quota, bad key); the address itself may be fine."""
+
+
+def normalize_address(city, state, country):
+    """Canonical cache key: lowercased, whitespace collapsed, empty parts dropped."""
+    parts = (' '.join((part or '').split()).lower() for part in (city, state, country))
+    return ', '.join(part for part in parts if part)
+
+
+class GoogleMapsGeocoder:
+    """Geocodes through the Google Maps API. The client is created once, on first use."""
+
+    def __init__(self):
+        self._client = None
+
+    def geocode(self, address):
+        import googlemaps
+
+        try:
+            if self._client is None:
+                self._client = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+            results = self._client.geocode(address)
+        except (ValueError, googlemaps.exceptions.ApiError,
+                googlemaps.exceptions.TransportError, googlemaps.exceptions.Timeout) as exc:
+            raise GeocoderError(str(exc)) from exc
+        if not results:
+            return None
+        location = results[0]['geometry']['location']
+        return GeocodeResult(location['lat'], location['lng'], results[0].get('formatted_address', ''))
+
+
+class StubGeocoder:
+    """
+    Local geocoder that never touches the network.
+
+    With a results table it answers only the addresses in it (keys are
+    normalized addresses, values GeocodeResult or None). Without one it makes
+    up stable coordinates for any address from a hash, which is enough for
+    load tests and offline development. Every call is recorded in .calls.
+    """
+    results = None
+
+    def __init__(self, results=None):
+        if results is not None:
+            self.results = results
+        self.calls = []
+
+    def geocode(self, address):
+        self.calls.append(address)
+        if self.results is not None:
+            return self.results.get(address)
+        digest = hashlib.sha1(address.encode()).digest()
+        latitude = int.from_bytes(digest[:4], 'big') / 2 ** 32 * 140 - 60
+        longitude = int.from_bytes(digest[4:8], 'big') / 2 ** 32 * 360 - 180
+        return GeocodeResult(round(latitude, 4), round(longitude, 4), address.title())
+
+
+_MISSING = object()
+
+
+class GeocodingCache:
+    """In-process LRU backed by the GeocodeCacheEntry table, in front of a geocoder backend."""
+
+    def __init__(self, backend, maxsize=4096, ttl=30 * 86400, negative_ttl=86400):
+        self.backend = backend
+        self.maxsize = maxsize
+        self.ttl = timedelta(seconds=ttl)
+        self.negative_ttl = timedelta(seconds=negative_ttl)
+        self._entries = OrderedDict()  # address -> (GeocodeResult | None, expires_at)
+        self._lock = threading.Lock()
+
+    def _get_local(self, address, now):
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is None:
+                return _MISSING
+            if entry[1] <= now:
+                del self._entries[address]
+                return _MISSING
+            self._entries.move_to_end(address)
+            return entry[0]
+
+    def _put_local(self, address, result, expires_at):
+        with self._lock:
+            self._entries[address] = (result, expires_at)
+            self._entries.move_to_end(address)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _get_persistent(self, address, now):
+        from .models import GeocodeCacheEntry
+
+        entry = GeocodeCacheEntry.objects.filter(address=address, expires_at__gt=now).first()
+        if entry is None:
+            return _MISSING
+        result = entry.as_result()
+        self._put_local(address, result, entry.expires_at)
+        return result
+
+    def _store(self, address, result, now):
+        from .models import GeocodeCacheEntry
+
+        expires_at = now + (self.ttl if result is not None else self.negative_ttl)
+        GeocodeCacheEntry.objects.update_or_create(address=address, defaults={
+            'found': result is not None,
+            'latitude': result.latitude if result else None,
+            'longitude': result.longitude if result else None,
+            'formatted_address': result.formatted_address if result else '',
+            'expires_at': expires_at,
+        })
+        self._put_local(address, result, expires_at)
+
+    def peek(self, address):
+        """
+        Answer from the caches only, never from the backend.
+
+        Returns (hit, result): hit is False when the address has to be sent
+        to the backend; otherwise result is the cached GeocodeResult, or None
+        for a cached "no such place".
+        """
+        if not address:
+            return True, None
+        now = timezone.now()
+        result = self._get_local(address, now)
+        if result is _MISSING:
+            result = self._get_persistent(address, now)
+        if result is _MISSING:
+            return False, None
+        return True, result
+
+    def resolve(self, address):
+        """Like lookup(), but backend failures raise GeocoderError so callers can retry."""
+        hit, result = self.peek(address)
+        if hit:
+            return result
+        now = timezone.now()
+        result = self.backend.geocode(address)
+        self._store(address, result, now)
+        return result
+
+    def lookup(self, address):
+        """Return a GeocodeResult, or None when the address cannot be resolved (or the backend is failing)."""
+        try:
+            return self.resolve(address)
+        except GeocoderError as exc:
+            logger.warning("Geocoding %r failed: %s", address, exc)
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = GeocodingCache(
+                    import_string(settings.GEOCODER_BACKEND)(),
+                    maxsize=settings.GEOCODE_LRU_SIZE,
+                    ttl=settings.GEOCODE_CACHE_TTL,
+                    negative_ttl=settings.GEOCODE_NEGATIVE_TTL,
+                )
+    return _cache
+
+
+def reset_cache(**kwargs):
+    # Drop the process-wide cache (and backend) so the next lookup picks up new settings.
+    global _cache
+    if kwargs.get('setting', 'GEOCODE').startswith('GEOCOD'):
+        _cache = None
+
+
+setting_changed.connect(reset_cache)
+
+
+def geocode(city, state, country):
+    """Geocode a shipping address through the cache. Returns a GeocodeResult or None."""
+    return get_cache().lookup(normalize_address(city, state, country))
+
+
+def peek(city, state, country):
+    """Cache-only lookup for a shipping address; see GeocodingCache.peek()."""
+    return get_cache().peek(normalize_address(city, state, country))
@@ -0,0 +1,93 @@
+"""
+The database-backed geocoding queue behind GeocodeJob.
+
+Workers (manage.py process_geocode_jobs) claim due jobs with a conditional
+UPDATE, so several workers can share the queue without handing the same job
+out twice. A claimed job is leased for LEASE seconds; if the worker dies, the
+job becomes due again when the lease runs out. Failed attempts are retried
+with exponential backoff until GEOCODE_JOB_MAX_ATTEMPTS is reached.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import geocoding, rollups
+from .models import GeocodeJob, Order
+
+logger = logging.getLogger(__name__)
+
+LEASE = timedelta(minutes=5)
+BACKOFF_BASE = 30  # seconds before the first retry; doubles on every further failure
+BACKOFF_MAX = 6 * 60 * 60
+
+
+def enqueue(order):
+    """Queue geocoding for order. Safe to call twice for the same order; it is a single INSERT either way."""
+    GeocodeJob.objects.bulk_create([GeocodeJob(order=order, run_after=timezone.now())], ignore_conflicts=True)
+
+
+def is_pending(order):
+    """True while the worker may still fill in the order's coordinates."""
+    return GeocodeJob.objects.filter(
+        order=order, status__in=(GeocodeJob.PENDING, GeocodeJob.RUNNING)).exists()
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX))
+
+
+def claim(batch_size=20, now=None):
+    """Claim up to batch_size due jobs for this worker and return them."""
+    now = now or timezone.now()
+    due = (
+        GeocodeJob.objects
+        .filter(Q(status=GeocodeJob.PENDING) | Q(status=GeocodeJob.RUNNING), run_after__lte=now)
+        .order_by('run_after', 'id')
+        .values_list('id', 'status', 'run_after')[:batch_size]
+    )
+    claimed = []
+    for job_id, status, run_after in due:
+        # The WHERE on status and run_after makes the claim fail if another worker got there first.
+        won = GeocodeJob.objects.filter(id=job_id, status=status, run_after=run_after).update(
+            status=GeocodeJob.RUNNING, run_after=now + LEASE, attempts=F('attempts') + 1)
+        if won:
+            claimed.append(job_id)
+    return list(GeocodeJob.objects.filter(id__in=claimed).select_related('order'))
+
+
+def run(job):
+    """Geocode one claimed job's order. Returns the job's new status."""
+    order = job.order
+    address = geocoding.normalize_address(order.city, order.state, order.country)
+    try:
+        result = geocoding.get_cache().resolve(address)
+    except geocoding.GeocoderError as exc:
+        max_attempts = settings.GEOCODE_JOB_MAX_ATTEMPTS
+        status = GeocodeJob.FAILED if job.attempts >= max_attempts else GeocodeJob.PENDING
+        logger.warning("Geocoding order %s failed (attempt %s/%s): %s", order.id, job.attempts, max_attempts, exc)
+        GeocodeJob.objects.filter(pk=job.pk).update(
+            status=status, run_after=timezone.now() + backoff(job.attempts), last_error=str(exc))
+        return status
+
+    with transaction.atomic():
+        if result is not None:
+            order.latitude, order.longitude = result.latitude, result.longitude
+            # A queryset update() skips Order.save(), so the geohash is computed here.
+            order.update_geo_keys()
+            Order.objects.filter(pk=order.pk).update(
+                latitude=order.latitude, longitude=order.longitude, geohash=order.geohash)
+            rollups.record_location(order)
+        GeocodeJob.objects.filter(pk=job.pk).update(status=GeocodeJob.DONE, last_error='')
+    return GeocodeJob.DONE
+
+
+def process_due(batch_size=20):
+    """Claim and run one batch. Returns the number of jobs processed."""
+    jobs = claim(batch_size)
+    for job in jobs:
+        run(job)
+    return len(jobs)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from cart import rollups
+from cart.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the geohash and region key of every order, e.g. after bulk imports that bypassed "
+        "Order.save(). With --rebuild-rollup the regional rollup is regrouped afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Orders written per UPDATE batch.")
+        parser.add_argument('--rebuild-rollup', action='store_true',
+                            help="Rebuild the regional rollup once the keys are up to date.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ('id', 'city', 'state', 'country', 'latitude', 'longitude', 'geohash', 'region_key')
+        scanned, updated, changed = 0, 0, []
+        for order in Order.objects.only(*fields).order_by('id').iterator(chunk_size=batch_size):
+            scanned += 1
+            # Only orders whose keys are missing or stale are written back.
+            if order.update_geo_keys():
+                changed.append(order)
+            if len(changed) >= batch_size:
+                Order.objects.bulk_update(changed, ['geohash', 'region_key'])
+                updated += len(changed)
+                changed = []
+        if changed:
+            Order.objects.bulk_update(changed, ['geohash', 'region_key'])
+            updated += len(changed)
+        self.stdout.write(self.style.SUCCESS(f"Updated geo keys for {updated} of {scanned} order(s)."))
+
+        if options['rebuild_rollup']:
+            count = rollups.rebuild(batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt regional rollup with {count} rows."))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cart import jobs
+
+
+class Command(BaseCommand):
+    help = "Work through the queue of orders waiting to be geocoded."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Process the jobs that are due now, then exit.")
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help="Seconds to wait when the queue is empty.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = jobs.process_due(options['batch_size'])
+            total += processed
+            if processed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} geocoding job(s)."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cart import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the RegionalPopularity rollup table from the full purchase history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rollups.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt regional rollup with {count} rows."))
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_rollup(apps, schema_editor):
+    # Same aggregation as cart.rollups.rebuild(), written against the historical models.
+    from datetime import timezone
+    from django.db.models import Count, Max
+    from django.db.models.functions import TruncDate
+
+    Item = apps.get_model('cart', 'Item')
+    RegionalPopularity = apps.get_model('cart', 'RegionalPopularity')
+    rows = (
+        Item.objects
+        .annotate(day=TruncDate('order__date', tzinfo=timezone.utc))
+        .values('order__city', 'order__state', 'order__country', 'movie_id', 'day')
+        .annotate(purchases=Count('id'), lat=Max('order__latitude'), lng=Max('order__longitude'))
+        .order_by()
+    )
+    buckets = {}
+    for row in rows:
+        key = (row['order__city'] or '', row['order__state'] or '', row['order__country'] or '',
+               row['movie_id'], row['day'])
+        if key in buckets:
+            buckets[key].purchases += row['purchases']
+        else:
+            buckets[key] = RegionalPopularity(
+                city=key[0], state=key[1], country=key[2], movie_id=key[3], day=key[4],
+                purchases=row['purchases'], latitude=row['lat'], longitude=row['lng'])
+    RegionalPopularity.objects.bulk_create(buckets.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_order_user_date_id_idx'),
+        ('movies', '0012_petition_vote_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionalPopularity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(blank=True, default='', max_length=100)),
+                ('state', models.CharField(blank=True, default='', max_length=100)),
+                ('country', models.CharField(blank=True, default='', max_length=100)),
+                ('day', models.DateField()),
+                ('purchases', models.PositiveIntegerField(default=0)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.movie')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='regional_popularity_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('city', 'state', 'country', 'movie', 'day'), name='regional_popularity_unique_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
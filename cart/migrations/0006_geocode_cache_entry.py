@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0005_regional_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=320, unique=True)),
+                ('found', models.BooleanField(default=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('formatted_address', models.CharField(blank=True, default='', max_length=255)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
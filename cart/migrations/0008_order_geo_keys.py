@@ -0,0 +1,116 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:27
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Frozen copies of cart.geo.encode/region_key as they were when this migration was written, so later
+# changes to that module cannot change what this migration does.
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 8
+BATCH_SIZE = 1000
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def geohash_for(latitude, longitude):
+    if latitude is None or longitude is None:
+        return ''
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < GEOHASH_PRECISION:
+        span, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (span[0] + span[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def _normalize(part):
+    text = unicodedata.normalize('NFKD', part or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def region_key(city, state, country):
+    parts = [_normalize(part) for part in (city, state, country)]
+    return '|'.join(parts) if any(parts) else ''
+
+
+def backfill_keys(apps, schema_editor):
+    # Orders get their keys; rollup buckets that now share a region key are merged into one.
+    Order = apps.get_model('cart', 'Order')
+    RegionalPopularity = apps.get_model('cart', 'RegionalPopularity')
+
+    # Orders are written back a batch at a time, so the whole table is never held in memory.
+    orders = []
+    fields = ('id', 'city', 'state', 'country', 'latitude', 'longitude')
+    for order in Order.objects.only(*fields).order_by('id').iterator(chunk_size=BATCH_SIZE):
+        order.geohash = geohash_for(order.latitude, order.longitude)
+        order.region_key = region_key(order.city, order.state, order.country)
+        orders.append(order)
+        if len(orders) >= BATCH_SIZE:
+            Order.objects.bulk_update(orders, ['geohash', 'region_key'])
+            orders = []
+    if orders:
+        Order.objects.bulk_update(orders, ['geohash', 'region_key'])
+
+    buckets, duplicates = {}, []
+    for bucket in RegionalPopularity.objects.order_by('id').iterator():
+        bucket.region_key = region_key(bucket.city, bucket.state, bucket.country)
+        key = (bucket.region_key, bucket.movie_id, bucket.day)
+        kept = buckets.get(key)
+        if kept is None:
+            buckets[key] = bucket
+            continue
+        kept.purchases += bucket.purchases
+        if kept.latitude is None:
+            kept.latitude, kept.longitude = bucket.latitude, bucket.longitude
+        duplicates.append(bucket.id)
+    RegionalPopularity.objects.filter(id__in=duplicates).delete()
+    RegionalPopularity.objects.bulk_update(
+        buckets.values(), ['region_key', 'purchases', 'latitude', 'longitude'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0007_geocode_job'),
+        ('movies', '0014_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='regionalpopularity',
+            name='regional_popularity_unique_bucket',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='region_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=320),
+        ),
+        migrations.AddField(
+            model_name='regionalpopularity',
+            name='region_key',
+            field=models.CharField(blank=True, default='', max_length=320),
+        ),
+        migrations.RunPython(backfill_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='regionalpopularity',
+            constraint=models.UniqueConstraint(fields=('region_key', 'movie', 'day'), name='regional_popularity_unique_bucket'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:18
+
+from django.db import migrations, models
+
+
+def create_row(apps, schema_editor):
+    apps.get_model('cart', 'CatalogVersion').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0008_order_geo_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_row, migrations.RunPython.noop),
+    ]
@@ -31,9 +31,40 @@ class Order(models.Model):
     #longitude: Optional FloatField to store the longitude coordinate for Google Maps or other mapping API integration.
     longitude = models.FloatField(blank=True, null=True)
 
+    #geohash: Geohash of latitude/longitude ('' until the order is geocoded). Indexed so area queries read only the matching cells; see cart/geo.py.
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True)
+
+    #region_key: city/state/country normalized into one "city|state|country" string, so regions group regardless of spelling details.
+    region_key = models.CharField(max_length=320, blank=True, default='', db_index=True)
+
+    def update_geo_keys(self):
+        """Recompute geohash and region_key from the address and coordinates. Returns the fields that changed."""
+        from .geo import geohash_for, region_key
+
+        values = {
+            'geohash': geohash_for(self.latitude, self.longitude),
+            'region_key': region_key(self.city, self.state, self.country),
+        }
+        changed = [name for name, value in values.items() if getattr(self, name) != value]
+        for name in changed:
+            setattr(self, name, values[name])
+        return changed
+
+    def save(self, *args, **kwargs):
+        changed = self.update_geo_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and changed:
+            kwargs['update_fields'] = set(update_fields) | set(changed)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return str(self.id) + ' - ' + self.user.username
+
+    class Meta:
+        # The order history lists a user's orders newest first and is keyset-paginated on (date, id).
+        indexes = [
+            models.Index(fields=['user', 'date', 'id'], name='order_user_date_id_idx'),
+        ]
     
 class Item(models.Model):
     #id: This is an AutoField, which automatically increments its value for each new record added to the database. The primary_key=True parameter specifies that this field is the primary key for the table, uniquely identifying each record.
@@ -51,4 +82,122 @@ class Item(models.Model):
     #movie: This is a foreign key relationship with the Movie model, which defines a foreign key relating each item to a specific movie.
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
     def __str__(self):
-        return str(self.id) + ' - ' + self.movie.name
\ No newline at end of file
+        return str(self.id) + ' - ' + self.movie.name
+
+class RegionalPopularity(models.Model):
+    """
+    Pre-aggregated purchase counts per (region, movie, day).
+
+    The regional trends map used to group every Item by order city/state on
+    each page view. Instead, checkout bumps the matching row here as each order
+    commits (see cart/rollups.py), and the map sums a handful of rows per
+    region. `manage.py rebuild_regional_rollup` recreates the table from the
+    full purchase history.
+    """
+    #region_key: the normalized region (see Order.region_key) that buckets are grouped by; '' for orders without an address.
+    region_key = models.CharField(max_length=320, blank=True, default='')
+
+    #Region text as entered on the first order counted in the bucket, for display only.
+    city = models.CharField(max_length=100, blank=True, default='')
+    state = models.CharField(max_length=100, blank=True, default='')
+    country = models.CharField(max_length=100, blank=True, default='')
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+
+    #day: the UTC calendar day the purchases happened on, so the map can show "last N days" windows.
+    day = models.DateField()
+
+    #purchases: number of orders in this region on this day that included the movie.
+    purchases = models.PositiveIntegerField(default=0)
+
+    #Coordinates of the region (from the first geocoded order), used to place the map marker.
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['region_key', 'movie', 'day'],
+                                    name='regional_popularity_unique_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='regional_popularity_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.city}, {self.state} - {self.movie_id} @ {self.day}: {self.purchases}'
+
+
+class GeocodeCacheEntry(models.Model):
+    """
+    Persistent geocoding cache shared by every worker (see cart/geocoding.py).
+
+    found=False rows are negative entries: the geocoder had no answer for the
+    address, and we remember that until expires_at instead of asking again.
+    """
+    #address: the normalized "city, state, country" string used as the cache key.
+    address = models.CharField(max_length=320, unique=True)
+    found = models.BooleanField(default=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    formatted_address = models.CharField(max_length=255, blank=True, default='')
+    expires_at = models.DateTimeField(db_index=True)
+
+    def as_result(self):
+        from .geocoding import GeocodeResult
+        if not self.found:
+            return None
+        return GeocodeResult(self.latitude, self.longitude, self.formatted_address)
+
+    def __str__(self):
+        return self.address
+
+
+class GeocodeJob(models.Model):
+    """
+    A queued request to geocode an order's shipping address.
+
+    Checkout never waits on the geocoding API: when the address is not
+    already cached it saves the order without coordinates and adds a job
+    here. `manage.py process_geocode_jobs` works through the queue, retrying
+    failures with exponential backoff (see cart/jobs.py).
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='geocode_job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    #run_after: when the job may next be picked up. For a running job it is the end of the worker's lease, after which a crashed worker's job is picked up again.
+    run_after = models.DateTimeField()
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='geocode_job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'Geocode order {self.order_id} ({self.status})'
+
+
+class CatalogVersion(models.Model):
+    """
+    A single row counting changes to the catalog's names and prices.
+
+    Carts keep a price snapshot tagged with the version it was taken at (see
+    cart/store.py). The counter lives in the database rather than the cache
+    so that a change saved by one worker, or by a management command, makes
+    the snapshots stale in every process.
+    """
+    version = models.PositiveBigIntegerField(default=0)
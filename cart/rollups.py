@@ -0,0 +1,156 @@
+"""
+Incremental maintenance of the RegionalPopularity rollup table.
+
+record_order() is called by checkout once an order's items are saved. It
+costs a fixed number of queries per order regardless of how many movies are
+in it: one INSERT ... ON CONFLICT DO NOTHING to make sure every bucket row
+exists, one UPDATE ... SET purchases = purchases + 1 over all of them, and
+(only when the order is geocoded) one UPDATE to fill in missing coordinates.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, Max, Sum, Window
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from movies.models import Movie
+from moviestore.topk import PartitionCount, PartitionSum, top_k
+
+from .models import Item, RegionalPopularity
+
+# Time windows offered on the map, in days. None means all time.
+WINDOWS = (7, 30, 90)
+
+
+def region_of(order):
+    """Display names for the order's region; buckets themselves are keyed on order.region_key."""
+    return {
+        'city': order.city or '',
+        'state': order.state or '',
+        'country': order.country or '',
+    }
+
+
+def record_order(order, movie_ids):
+    """Count one purchase of each movie in movie_ids for the order's region and day."""
+    movie_ids = list(set(movie_ids))
+    if not movie_ids:
+        return
+    region = region_of(order)
+    day = timezone.localdate(order.date, dt_timezone.utc) if order.date else timezone.now().date()
+
+    RegionalPopularity.objects.bulk_create([
+        RegionalPopularity(region_key=order.region_key, movie_id=movie_id, day=day, purchases=0,
+                           latitude=order.latitude, longitude=order.longitude, **region)
+        for movie_id in movie_ids
+    ], ignore_conflicts=True)
+    buckets = RegionalPopularity.objects.filter(region_key=order.region_key, day=day, movie_id__in=movie_ids)
+    buckets.update(purchases=F('purchases') + 1)
+    if order.latitude is not None and order.longitude is not None:
+        buckets.filter(latitude__isnull=True).update(latitude=order.latitude, longitude=order.longitude)
+
+
+def record_location(order):
+    """Fill in coordinates for the order's region once the order has been geocoded."""
+    if order.latitude is None or order.longitude is None:
+        return
+    RegionalPopularity.objects.filter(latitude__isnull=True, region_key=order.region_key).update(
+        latitude=order.latitude, longitude=order.longitude)
+
+
+def rebuild(batch_size=1000):
+    """Recreate the whole rollup table from Item/Order. Returns the number of rows written."""
+    rows = (
+        Item.objects
+        .annotate(day=TruncDate('order__date', tzinfo=dt_timezone.utc))
+        .values('order__region_key', 'movie_id', 'day')
+        .annotate(
+            purchases=Count('id'),
+            city=Max('order__city'),
+            state=Max('order__state'),
+            country=Max('order__country'),
+            latitude=Max('order__latitude'),
+            longitude=Max('order__longitude'),
+        )
+        .order_by()
+    )
+    buckets = {}
+    for row in rows.iterator(chunk_size=batch_size):
+        buckets[(row['order__region_key'], row['movie_id'], row['day'])] = RegionalPopularity(
+            region_key=row['order__region_key'], movie_id=row['movie_id'], day=row['day'],
+            city=row['city'] or '', state=row['state'] or '', country=row['country'] or '',
+            purchases=row['purchases'], latitude=row['latitude'], longitude=row['longitude'])
+
+    with transaction.atomic():
+        RegionalPopularity.objects.all().delete()
+        RegionalPopularity.objects.bulk_create(buckets.values(), batch_size=batch_size)
+    return len(buckets)
+
+
+def located_buckets(days=None):
+    """Rollup rows that can be plotted (they have coordinates), limited to the last N days when days is set."""
+    buckets = RegionalPopularity.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    if days:
+        since = timezone.now().date() - timedelta(days=days - 1)
+        buckets = buckets.filter(day__gte=since)
+    return buckets
+
+
+def regional_totals(days=None):
+    """
+    Purchases per (region, movie) from the rollup, most popular first.
+
+    This is every (region, movie) pair, so it grows with regions x catalog;
+    use top_movies_per_region() when only the leaders are shown.
+    `manage.py bench_regional_trends` compares the two.
+    """
+    return (
+        located_buckets(days)
+        .values('region_key', 'movie__name', 'movie__image')
+        .annotate(
+            city=Max('city'),
+            state=Max('state'),
+            total_purchases=Sum('purchases'),
+            lat=Max('latitude'),
+            lng=Max('longitude'),
+        )
+        .order_by('-total_purchases')
+    )
+
+
+def top_movies_per_region(k=None, days=None):
+    """
+    The k most purchased movies of every region (REGIONAL_TRENDS_TOP_K by default).
+
+    Returns a list with one dict per (region, movie) and rank 1..k, ordered
+    by region and rank, so it holds at most regions x k rows. Each row also
+    carries its region's totals over all movies (region_purchases,
+    region_movies). Movie names and posters are read afterwards for the
+    winners only, so the ranking query never joins the catalog.
+    """
+    k = k or settings.REGIONAL_TRENDS_TOP_K
+    region = [F('region_key')]
+    grouped = (
+        located_buckets(days)
+        .values('region_key', 'movie_id')
+        .annotate(
+            city=Max('city'),
+            state=Max('state'),
+            total_purchases=Sum('purchases'),
+            lat=Max('latitude'),
+            lng=Max('longitude'),
+        )
+        .annotate(
+            region_purchases=Window(PartitionSum(Sum('purchases'), output_field=IntegerField()), partition_by=region),
+            region_movies=Window(PartitionCount(), partition_by=region),
+        )
+    )
+    rows = list(top_k(grouped, region, (F('total_purchases').desc(), F('movie_id').asc()), k)
+                .order_by('region_key', 'rank'))
+    movies = {movie_id: (name, image) for movie_id, name, image in
+              Movie.objects.filter(id__in={row['movie_id'] for row in rows}).values_list('id', 'name', 'image')}
+    for row in rows:
+        row['movie__name'], row['movie__image'] = movies[row['movie_id']]
+    return rows
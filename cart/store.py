@@ -0,0 +1,275 @@
+"""
+The shopping cart: typed lines, a price snapshot and pluggable storage.
+
+A Cart holds one CartLine per movie with an integer quantity and a snapshot
+of the movie's name and price taken when the line was added. The running
+total is kept up to date as lines are added or removed, so nothing has to be
+recomputed on render.
+
+The snapshot carries the catalog version it was taken at. The version is a
+counter row in the database (CatalogVersion), bumped in the same transaction
+whenever a Movie is saved or deleted (see CartConfig.ready()), so every
+worker sees the change and the cart page only re-reads prices when the
+catalog has actually changed; checking costs one primary-key SELECT. Checkout never trusts the snapshot:
+cart.checkout.place_order() always re-reads prices inside its transaction.
+Note that queryset.update() on Movie.price bypasses the signal; call
+bump_catalog_version() after such bulk changes.
+
+Where the cart is kept is chosen with the CART_BACKEND setting:
+
+* SessionCartBackend (default) stores it in the Django session,
+* SignedCookieCartBackend stores it in a signed cookie (no server state),
+* CacheCartBackend stores it in the cache, keyed by a cart id kept in the session.
+
+Views use get_cart(request) to read the cart and save_cart(request, response,
+cart) to write it back; nothing is written when the cart did not change.
+"""
+import uuid
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+# A sanity limit per line, so a tampered form cannot create absurd orders.
+MAX_QUANTITY = 99
+
+
+class InvalidQuantity(ValueError):
+    pass
+
+
+def parse_quantity(value):
+    """Turn a posted quantity into an int between 1 and MAX_QUANTITY, or raise InvalidQuantity."""
+    try:
+        quantity = int(str(value).strip())
+    except (TypeError, ValueError):
+        raise InvalidQuantity(f'"{value}" is not a valid quantity.') from None
+    if not 1 <= quantity <= MAX_QUANTITY:
+        raise InvalidQuantity(f'Quantities must be between 1 and {MAX_QUANTITY}.')
+    return quantity
+
+
+def catalog_version():
+    from .models import CatalogVersion
+
+    return CatalogVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+def bump_catalog_version(**kwargs):
+    from .models import CatalogVersion
+
+    if not CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+@dataclass
+class CartLine:
+    movie_id: int
+    quantity: int
+    price: int
+    name: str
+
+    @property
+    def subtotal(self):
+        return self.price * self.quantity
+
+
+class Cart:
+    def __init__(self, lines=(), version=None):
+        self.lines = {line.movie_id: line for line in lines}
+        self.version = version
+        self.total = sum(line.subtotal for line in self.lines.values())
+        self.modified = False
+        # The catalog version read by is_fresh(), so refresh() does not read it again.
+        self._catalog_version = None
+
+    def __iter__(self):
+        return iter(self.lines.values())
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __contains__(self, movie_id):
+        return int(movie_id) in self.lines
+
+    def quantity(self, movie_id):
+        line = self.lines.get(int(movie_id))
+        return line.quantity if line else 0
+
+    def quantities(self):
+        return {movie_id: line.quantity for movie_id, line in self.lines.items()}
+
+    def set(self, movie, quantity):
+        """Put quantity copies of movie in the cart, replacing any earlier quantity. movie needs id, name and price."""
+        quantity = parse_quantity(quantity)
+        if not self.lines:
+            self.version = catalog_version()
+        self.remove(movie.id)
+        line = CartLine(movie.id, quantity, movie.price, movie.name)
+        self.lines[movie.id] = line
+        self.total += line.subtotal
+        self.modified = True
+        return line
+
+    def remove(self, movie_id):
+        line = self.lines.pop(int(movie_id), None)
+        if line is not None:
+            self.total -= line.subtotal
+            self.modified = True
+        return line
+
+    def clear(self):
+        if self.lines:
+            self.modified = True
+        self.lines = {}
+        self.total = 0
+        self.version = None
+
+    def is_fresh(self):
+        if not self.lines:
+            return True
+        self._catalog_version = catalog_version()
+        return self.version == self._catalog_version
+
+    def refresh(self):
+        """Re-read names and prices in one query; movies that no longer exist are dropped."""
+        from movies.models import Movie
+
+        version = self._catalog_version if self._catalog_version is not None else catalog_version()
+        current = {
+            movie_id: (name, price)
+            for movie_id, name, price in
+            Movie.objects.filter(id__in=list(self.lines)).values_list('id', 'name', 'price')
+        }
+        lines = [
+            CartLine(line.movie_id, line.quantity, current[line.movie_id][1], current[line.movie_id][0])
+            for line in self.lines.values() if line.movie_id in current
+        ]
+        self.__init__(lines, version)
+        self.modified = True
+
+    def to_data(self, snapshot=True):
+        """Compact, JSON-friendly form: {'v': version, 'l': [[id, qty, price, name], ...]}."""
+        if not snapshot:
+            return {'v': None, 'l': [[line.movie_id, line.quantity] for line in self]}
+        return {'v': self.version, 'l': [[line.movie_id, line.quantity, line.price, line.name] for line in self]}
+
+    @classmethod
+    def from_data(cls, data):
+        if not isinstance(data, dict):
+            return cls()
+        if 'l' not in data:
+            # Carts saved before the store existed are {"movie_id": "quantity"}; they have no snapshot yet.
+            return cls._from_legacy(data)
+        lines, version = [], data.get('v')
+        for row in data['l']:
+            try:
+                if len(row) == 4:
+                    lines.append(CartLine(int(row[0]), int(row[1]), int(row[2]), str(row[3])))
+                else:
+                    lines.append(CartLine(int(row[0]), int(row[1]), 0, ''))
+                    version = None
+            except (TypeError, ValueError, IndexError):
+                continue
+        return cls(lines, version)
+
+    @classmethod
+    def _from_legacy(cls, data):
+        lines = []
+        for movie_id, quantity in data.items():
+            try:
+                lines.append(CartLine(int(movie_id), parse_quantity(quantity), 0, ''))
+            except ValueError:
+                continue
+        return cls(lines, None)
+
+
+class SessionCartBackend:
+    key = 'cart'
+
+    def load(self, request):
+        return request.session.get(self.key)
+
+    def save(self, request, response, data):
+        request.session[self.key] = data
+
+
+class SignedCookieCartBackend:
+    """Keeps the cart in a signed cookie, so it needs no server-side storage at all."""
+    salt = 'cart.store'
+    # Browsers cap a cookie at about 4 KB; bigger carts drop the snapshot and re-price on the next render.
+    max_size = 3800
+
+    @property
+    def cookie_name(self):
+        return settings.CART_COOKIE_NAME
+
+    def load(self, request):
+        value = request.COOKIES.get(self.cookie_name)
+        if not value:
+            return None
+        try:
+            return signing.loads(value, salt=self.salt, max_age=settings.CART_MAX_AGE)
+        except signing.BadSignature:
+            return None
+
+    def save(self, request, response, data):
+        value = signing.dumps(data, salt=self.salt, compress=True)
+        if len(value) > self.max_size:
+            value = signing.dumps(Cart.from_data(data).to_data(snapshot=False), salt=self.salt, compress=True)
+        response.set_cookie(self.cookie_name, value, max_age=settings.CART_MAX_AGE,
+                            httponly=True, samesite='Lax', secure=request.is_secure())
+
+
+class CacheCartBackend:
+    """
+    Keeps the cart in the cache, so adding to the cart does not rewrite the session row.
+
+    The cache entry is keyed by a random cart id kept in the session, not by
+    the session key: login() cycles the session key, and the guest's cart
+    has to survive signing in to check out.
+    """
+    prefix = 'cart:'
+    session_key = 'cart_id'
+
+    def load(self, request):
+        cart_id = request.session.get(self.session_key)
+        if cart_id is None:
+            return None
+        return cache.get(self.prefix + cart_id)
+
+    def save(self, request, response, data):
+        cart_id = request.session.get(self.session_key)
+        if cart_id is None:
+            cart_id = request.session[self.session_key] = uuid.uuid4().hex
+        cache.set(self.prefix + cart_id, data, settings.CART_MAX_AGE)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None or _backend.__class__.__module__ + '.' + _backend.__class__.__name__ != settings.CART_BACKEND:
+        _backend = import_string(settings.CART_BACKEND)()
+    return _backend
+
+
+def get_cart(request):
+    """Return the request's Cart, loading it from the backend once per request."""
+    if not hasattr(request, '_cart'):
+        request._cart = Cart.from_data(get_backend().load(request))
+    return request._cart
+
+
+def save_cart(request, response, cart=None):
+    """Write the cart back through the backend if it changed. Returns response."""
+    if cart is None:
+        cart = get_cart(request)
+    if cart.modified:
+        get_backend().save(request, response, cart.to_data())
+        cart.modified = False
+    return response
@@ -6,10 +6,15 @@ We use the @register.filter(name='get_quantity') decorator to register the get_c
 
 We define the get_cart_quantity function, which takes two arguments: the cart session dictionary, and the ID of the movie for which the quantity is needed.
 
-We access the quantity value by using the cart dictionary and movie_id as the key. We convert movie_id to a string to ensure compatibility with the cart keys.
-Finally, we return the corresponding quantity value."""
+The cart is normally a cart.store.Cart, which keeps quantities as integers, so we ask it with cart.quantity(movie_id) (0 when the movie is not in the cart).
+A plain dictionary (the cart format used before cart/store.py) still works: we convert movie_id to a string to match its keys and the quantity to an integer."""
 register = template.Library()
 
 @register.filter(name='get_quantity')
 def get_cart_quantity(cart, movie_id):
-    return cart[str(movie_id)]
\ No newline at end of file
+    if hasattr(cart, 'quantity'):
+        return cart.quantity(movie_id)
+    try:
+        return int(cart.get(str(movie_id), 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0
\ No newline at end of file
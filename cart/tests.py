@@ -1,3 +1,446 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from movies.models import Movie
+from perf.seeding import SEED_PASSWORD
+from perf.testing import ViewBudgetTestCase
+
+from . import checkout, clusters, geo, geocoding, jobs, rollups, store
+from .models import CatalogVersion, GeocodeCacheEntry, GeocodeJob, Item, Order, RegionalPopularity
+
+
+class FixedGeocoder(geocoding.StubGeocoder):
+    results = {
+        'caracas, venezuela': geocoding.GeocodeResult(10.5, -66.9, 'Caracas, Venezuela'),
+        'atlanta, ga, usa': geocoding.GeocodeResult(33.749, -84.388, 'Atlanta, GA, USA'),
+    }
+
+
+class CartViewBudgetTests(ViewBudgetTestCase):
+    def fill_cart(self, count=5):
+        for movie in self.seeded.movies[:count]:
+            self.client.post(reverse('cart.add', args=[movie.id]), {'quantity': '2'})
+
+    def test_cart_pages(self):
+        movie = self.seeded.movies[0]
+        # Putting the first movie in a cart also reads the catalog version the price snapshot is taken at.
+        self.assertViewBudget('cart.add', 6, reverse('cart.add', args=[movie.id]), method='post',
+                              data={'quantity': '2'}, status=302)
+        self.fill_cart()
+        # The cart carries its own price snapshot, so rendering it only reads the session and the catalog version.
+        self.assertViewBudget('cart.index', 2, reverse('cart.index'), status=200)
+        self.assertViewBudget('cart.remove', 4, reverse('cart.remove', args=[movie.id]), method='post', status=302)
+        self.assertViewBudget('cart.clear', 1, reverse('cart.clear'), status=302)
+
+    def test_purchase(self):
+        self.login()
+        self.fill_cart(30)
+        # Checkout bulk-inserts the line items in one transaction, so the budget does not depend on the cart size.
+        # The co-purchase counts add three: one upsert for all pairs, one ranking query, one neighbours upsert.
+        # The trending scores of all thirty movies are bumped with one more UPDATE.
+        self.assertViewBudget('cart.purchase', 18, reverse('cart.purchase'), method='post',
+                              data={'city': 'Atlanta', 'state': 'GA', 'country': 'USA'}, status=200)
+        self.assertEqual(Order.objects.latest('id').item_set.count(), 30)
+
+
+class CheckoutTests(ViewBudgetTestCase):
+    seed_options = {'movies': 10, 'users': 3, 'orders': 0}
+
+    def test_quantities_are_validated_as_integers(self):
+        self.assertEqual(checkout.parse_quantities({'3': '2', 7: 1}), {3: 2, 7: 1})
+        for bad in ({'3': 'two'}, {'3': '1.5'}, {'3': '0'}, {'3': '-1'}, {'3': '1000'}, {}):
+            with self.assertRaises(checkout.InvalidCart):
+                checkout.parse_quantities(bad)
+
+    def test_invalid_quantities_never_reach_the_cart(self):
+        movie = self.seeded.movies[0]
+        self.login()
+        self.client.post(reverse('cart.add', args=[movie.id]), {'quantity': 'lots'})
+        response = self.client.post(reverse('cart.purchase'), {'city': 'Atlanta'})
+        self.assertRedirects(response, reverse('cart.index'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+    def test_items_snapshot_current_prices(self):
+        movies = self.seeded.movies[:3]
+        placed = checkout.place_order(self.seeded.users[0], {movies[0].id: 2, movies[1].id: 1, 999999: 4})
+        # Movies that no longer exist are dropped; the rest are priced from the database.
+        self.assertEqual(
+            sorted((item.movie_id, item.price, item.quantity) for item in placed.order.item_set.all()),
+            sorted([(movies[0].id, movies[0].price, 2), (movies[1].id, movies[1].price, 1)]),
+        )
+        self.assertEqual(placed.order.total, movies[0].price * 2 + movies[1].price)
+
+    def test_failed_checkout_rolls_back(self):
+        movie = self.seeded.movies[0]
+        with mock.patch.object(rollups, 'record_order', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                checkout.place_order(self.seeded.users[0], {movie.id: 1})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Item.objects.exists())
+
+
+class CartStoreTests(ViewBudgetTestCase):
+    seed_options = {'movies': 5, 'users': 2, 'orders': 0}
+
+    def add(self, movie, quantity):
+        return self.client.post(reverse('cart.add', args=[movie.id]), {'quantity': quantity})
+
+    def cart_page(self):
+        return self.client.get(reverse('cart.index')).context['template_data']
+
+    def test_total_is_maintained_on_add_and_remove(self):
+        first, second = self.seeded.movies[:2]
+        self.add(first, '2')
+        self.add(second, '1')
+        self.add(first, '3')
+        self.assertEqual(self.cart_page()['cart_total'], first.price * 3 + second.price)
+        self.client.post(reverse('cart.remove', args=[first.id]))
+        page = self.cart_page()
+        self.assertEqual(page['cart_total'], second.price)
+        self.assertEqual([(line.movie_id, line.quantity) for line in page['cart_lines']], [(second.id, 1)])
+
+    def test_catalog_changes_reprice_the_snapshot(self):
+        movie = self.seeded.movies[0]
+        self.add(movie, '2')
+        movie.price += 5
+        # Marking the poster variants as done keeps the save from resizing the seeded poster into MEDIA_ROOT.
+        movie.image_variants = {'source': movie.image.name, 'formats': {}}
+        movie.save()
+        # Reading the catalog version, one re-pricing SELECT and saving the session (one conditional
+        # UPDATE); the session itself was cached by this process when the cart was last saved.
+        with self.assertNumQueries(3):
+            page = self.cart_page()
+        self.assertEqual(page['cart_total'], movie.price * 2)
+
+    def test_bulk_price_changes_reprice_after_a_bump(self):
+        movie = self.seeded.movies[0]
+        self.add(movie, '1')
+        # What import_catalog does from another process: a bulk UPDATE and one bump of the shared version.
+        Movie.objects.filter(pk=movie.pk).update(price=movie.price + 3)
+        self.assertEqual(self.cart_page()['cart_total'], movie.price)
+        store.bump_catalog_version()
+        self.assertEqual(self.cart_page()['cart_total'], movie.price + 3)
+        self.assertEqual(CatalogVersion.objects.get().version, store.catalog_version())
+
+    def test_carts_from_before_the_store_are_upgraded(self):
+        movie = self.seeded.movies[0]
+        session = self.client.session
+        session['cart'] = {str(movie.id): '2', 'junk': 'x'}
+        session.save()
+        page = self.cart_page()
+        self.assertEqual([(line.name, line.quantity) for line in page['cart_lines']], [(movie.name, 2)])
+
+    def test_alternative_backends_round_trip(self):
+        movie = self.seeded.movies[0]
+        for backend in ('cart.store.SignedCookieCartBackend', 'cart.store.CacheCartBackend'):
+            with self.subTest(backend=backend), self.settings(CART_BACKEND=backend):
+                self.client.cookies.clear()
+                self.add(movie, '4')
+                self.assertNotIn('cart', self.client.session)
+                self.assertEqual(self.cart_page()['cart_total'], movie.price * 4)
+
+    def test_guest_cart_survives_signing_in(self):
+        movie = self.seeded.movies[0]
+        user = self.seeded.users[0]
+        for backend in ('cart.store.SessionCartBackend', 'cart.store.CacheCartBackend'):
+            with self.subTest(backend=backend), self.settings(CART_BACKEND=backend):
+                self.client.logout()
+                self.add(movie, '2')
+                # Signing in cycles the session key.
+                self.client.post(reverse('accounts.login'), {'username': user.username, 'password': SEED_PASSWORD})
+                self.assertEqual(self.cart_page()['cart_total'], movie.price * 2)
+
+    def test_tampered_cookie_is_ignored(self):
+        with self.settings(CART_BACKEND='cart.store.SignedCookieCartBackend'):
+            self.client.cookies['cart'] = 'not-a-signed-value'
+            self.assertEqual(self.cart_page()['cart_lines'], [])
+
+
+class RegionalRollupTests(ViewBudgetTestCase):
+    seed_options = {'movies': 20, 'users': 10, 'orders': 60}
+
+    def test_rebuild_matches_item_history(self):
+        self.assertEqual(RegionalPopularity.objects.aggregate(total=Sum('purchases'))['total'], Item.objects.count())
+        rollups.rebuild()
+        self.assertEqual(RegionalPopularity.objects.aggregate(total=Sum('purchases'))['total'], Item.objects.count())
+
+    def test_top_movies_per_region_keeps_k_leaders(self):
+        expected = {}
+        for row in rollups.regional_totals():
+            expected.setdefault(row['region_key'], []).append(row['total_purchases'])
+        # One ranking query, and one for the winning movies' names and posters.
+        with self.assertNumQueries(2):
+            rows = rollups.top_movies_per_region(k=2)
+
+        by_region = {}
+        for row in rows:
+            by_region.setdefault(row['region_key'], []).append(row)
+        self.assertEqual(by_region.keys(), expected.keys())
+        for key, leaders in by_region.items():
+            self.assertEqual([row['rank'] for row in leaders], [1, 2][:len(expected[key])])
+            self.assertEqual([row['total_purchases'] for row in leaders], expected[key][:2])
+            # Region totals cover every movie bought there, not only the leaders.
+            self.assertEqual(leaders[0]['region_purchases'], sum(expected[key]))
+            self.assertEqual(leaders[0]['region_movies'], len(expected[key]))
+
+    @override_settings(GEOCODER_BACKEND='cart.tests.FixedGeocoder')
+    def test_checkout_bumps_rollup_and_map_reads_it(self):
+        movie = self.seeded.movies[0]
+        self.login()
+        for _ in range(2):
+            self.client.post(reverse('cart.add', args=[movie.id]), {'quantity': '1'})
+            self.client.post(reverse('cart.purchase'), {'city': 'Caracas', 'country': 'Venezuela'})
+        jobs.process_due()
+
+        response = self.client.get(reverse('movies.regional_trends_clusters'),
+                                   {'bbox': '-67.5,10,-66.5,11', 'zoom': 12, 'days': 7})
+        features = json.loads(b''.join(response.streaming_content))['features']
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features[0]['geometry']['coordinates'], [-66.9, 10.5])
+        self.assertEqual(features[0]['properties']['top'][0]['title'], movie.name)
+        self.assertEqual(features[0]['properties']['top'][0]['purchases'], 2)
+
+
+class ClusterTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('buyer')
+        self.movies = [Movie.objects.create(name=f'Movie {n}', price=5, description='', image='movie_images/x.jpg',
+                                            image_variants={'source': 'movie_images/x.jpg'}) for n in range(4)]
+        day = timezone.now().date()
+        rows = [
+            # Two Atlanta suburbs a few km apart, and Caracas.
+            ('Atlanta', 33.75, -84.39, self.movies[0], 5),
+            ('Decatur', 33.77, -84.30, self.movies[1], 3),
+            ('Decatur', 33.77, -84.30, self.movies[0], 1),
+            ('Caracas', 10.5, -66.9, self.movies[2], 2),
+            ('Suva', -18.1, 178.4, self.movies[3], 1),
+        ]
+        RegionalPopularity.objects.bulk_create([
+            RegionalPopularity(region_key=geo.region_key(city, '', ''), city=city, latitude=lat, longitude=lng,
+                               movie=movie, day=day, purchases=purchases)
+            for city, lat, lng, movie, purchases in rows
+        ])
+        self.client.force_login(user)
+
+    def fetch(self, bbox, zoom, **params):
+        response = self.client.get(reverse('movies.regional_trends_clusters'), {'bbox': bbox, 'zoom': zoom, **params})
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        return json.loads(b''.join(response.streaming_content))['features']
+
+    def test_nearby_regions_merge_at_low_zoom_and_split_when_zoomed_in(self):
+        world = self.fetch('-180,-85,180,85', 2)
+        self.assertEqual(len(world), 3)
+        atlanta = max(world, key=lambda f: f['properties']['purchases'])
+        self.assertEqual((atlanta['properties']['purchases'], atlanta['properties']['movies']), (9, 2))
+        # Top movies are ranked by purchases within the cluster.
+        self.assertEqual([m['title'] for m in atlanta['properties']['top']], ['Movie 0', 'Movie 1'])
+
+        close_up = self.fetch('-84.5,33.6,-84.2,33.9', 12)
+        self.assertEqual(sorted(f['properties']['purchases'] for f in close_up), [4, 5])
+
+    def test_viewport_crossing_the_antimeridian(self):
+        features = self.fetch('170,-30,-170,0', 4)
+        self.assertEqual([f['properties']['top'][0]['title'] for f in features], ['Movie 3'])
+
+    def test_invalid_viewports_are_rejected(self):
+        url = reverse('movies.regional_trends_clusters')
+        for params in ({'zoom': 3}, {'bbox': '1,2,3', 'zoom': 3}, {'bbox': '0,0,1,1', 'zoom': 40},
+                       {'bbox': '0,95,1,1', 'zoom': 3}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+    def test_top_movies_are_capped_per_cluster(self):
+        [atlanta] = clusters.clusters((-85, 33, -84, 34), 2, top=1)
+        self.assertEqual((atlanta['movies'], [m['title'] for m in atlanta['top']]), (2, ['Movie 0']))
+
+
+@override_settings(GEOCODER_BACKEND='cart.tests.FixedGeocoder')
+class GeocodingCacheTests(TestCase):
+    def setUp(self):
+        # The process-wide LRU outlives each test's database rollback, so every test starts cold.
+        geocoding.reset_cache()
+
+    def backend(self):
+        return geocoding.get_cache().backend
+
+    def test_repeat_addresses_are_served_from_the_process_cache(self):
+        first = geocoding.geocode(' Atlanta', 'ga ', 'USA')
+        second = geocoding.geocode('atlanta', 'GA', 'usa')
+        self.assertEqual(first, geocoding.GeocodeResult(33.749, -84.388, 'Atlanta, GA, USA'))
+        self.assertEqual(second, first)
+        self.assertEqual(self.backend().calls, ['atlanta, ga, usa'])
+        with self.assertNumQueries(0):
+            geocoding.geocode('Atlanta', 'GA', 'USA')
+
+    def test_persistent_table_survives_a_cold_process_cache(self):
+        geocoding.geocode('Atlanta', 'GA', 'USA')
+        geocoding.get_cache().clear()
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(geocoding.geocode('Atlanta', 'GA', 'USA'))
+        self.assertEqual(len(self.backend().calls), 1)
+
+    def test_unknown_addresses_are_negatively_cached(self):
+        self.assertIsNone(geocoding.geocode('Atlantis', '', 'Ocean'))
+        self.assertIsNone(geocoding.geocode('Atlantis', '', 'Ocean'))
+        self.assertEqual(self.backend().calls, ['atlantis, ocean'])
+        self.assertFalse(GeocodeCacheEntry.objects.get(address='atlantis, ocean').found)
+
+    def test_expired_entries_are_refetched(self):
+        geocoding.geocode('Atlanta', 'GA', 'USA')
+        GeocodeCacheEntry.objects.update(expires_at=timezone.now())
+        geocoding.get_cache().clear()
+        geocoding.geocode('Atlanta', 'GA', 'USA')
+        self.assertEqual(len(self.backend().calls), 2)
+
+    def test_backend_errors_are_not_cached(self):
+        class FailingGeocoder:
+            def geocode(self, address):
+                raise geocoding.GeocoderError('quota exceeded')
+
+        cache = geocoding.GeocodingCache(FailingGeocoder())
+        self.assertIsNone(cache.lookup('atlanta, ga, usa'))
+        self.assertFalse(GeocodeCacheEntry.objects.exists())
+
+
+@override_settings(GEOCODER_BACKEND='cart.tests.FixedGeocoder')
+class GeocodeJobTests(ViewBudgetTestCase):
+    seed_options = {'movies': 5, 'users': 3, 'orders': 0}
+
+    def setUp(self):
+        geocoding.reset_cache()
+        self.user = self.login()
+
+    def checkout(self, city, state, country):
+        self.client.post(reverse('cart.add', args=[self.seeded.movies[0].id]), {'quantity': '1'})
+        response = self.client.post(reverse('cart.purchase'), {'city': city, 'state': state, 'country': country})
+        return response, Order.objects.latest('id')
+
+    def test_checkout_queues_unknown_addresses_instead_of_calling_the_backend(self):
+        response, order = self.checkout('Atlanta', 'GA', 'USA')
+        self.assertTrue(response.context['template_data']['locating'])
+        self.assertIsNone(order.latitude)
+        self.assertEqual(geocoding.get_cache().backend.calls, [])
+        self.assertEqual(order.geocode_job.status, GeocodeJob.PENDING)
+
+        location = self.client.get(reverse('cart.order_location', args=[order.id])).json()
+        self.assertEqual((location['latitude'], location['pending']), (None, True))
+
+        call_command('process_geocode_jobs', '--once', stdout=StringIO())
+        order.refresh_from_db()
+        self.assertEqual((order.latitude, order.longitude), (33.749, -84.388))
+        self.assertEqual(order.geohash, geo.encode(33.749, -84.388))
+        self.assertEqual(GeocodeJob.objects.get(order=order).status, GeocodeJob.DONE)
+        location = self.client.get(reverse('cart.order_location', args=[order.id])).json()
+        self.assertEqual((location['latitude'], location['pending']), (33.749, False))
+
+    def test_cached_addresses_are_filled_in_at_checkout(self):
+        geocoding.geocode('Atlanta', 'GA', 'USA')
+        response, order = self.checkout('atlanta', 'ga', 'usa')
+        self.assertFalse(response.context['template_data']['locating'])
+        self.assertEqual((order.latitude, order.longitude), (33.749, -84.388))
+        self.assertFalse(GeocodeJob.objects.filter(order=order).exists())
+
+    def test_backend_failures_back_off_and_eventually_give_up(self):
+        class FailingGeocoder:
+            def geocode(self, address):
+                raise geocoding.GeocoderError('quota exceeded')
+
+        _, order = self.checkout('Atlanta', 'GA', 'USA')
+        with self.settings(GEOCODE_JOB_MAX_ATTEMPTS=2):
+            geocoding.get_cache().backend = FailingGeocoder()
+            self.assertEqual(jobs.process_due(), 1)
+            job = GeocodeJob.objects.get(order=order)
+            self.assertEqual((job.status, job.attempts, job.last_error), (GeocodeJob.PENDING, 1, 'quota exceeded'))
+            self.assertGreater(job.run_after, timezone.now())
+            # Not due again until the backoff has passed.
+            self.assertEqual(jobs.process_due(), 0)
+
+            GeocodeJob.objects.update(run_after=timezone.now())
+            jobs.process_due()
+            self.assertEqual(GeocodeJob.objects.get(order=order).status, GeocodeJob.FAILED)
+
+    def test_expired_leases_are_reclaimed(self):
+        _, order = self.checkout('Atlanta', 'GA', 'USA')
+        self.assertEqual(len(jobs.claim()), 1)
+        # A second worker cannot take the job while the first one holds the lease...
+        self.assertEqual(jobs.claim(), [])
+        # ...but it can once the lease has run out, e.g. because the first worker crashed.
+        claimed = jobs.claim(now=timezone.now() + jobs.LEASE + timedelta(seconds=1))
+        self.assertEqual([job.order_id for job in claimed], [order.id])
+
+    def test_location_is_only_visible_to_the_order_owner(self):
+        _, order = self.checkout('Atlanta', 'GA', 'USA')
+        self.client.force_login(self.seeded.users[1])
+        self.assertEqual(self.client.get(reverse('cart.order_location', args=[order.id])).status_code, 404)
+
+
+class OrderGeoTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+
+    def order(self, city='', state='', country='', latitude=None, longitude=None):
+        return Order.objects.create(user=self.user, total=1, city=city, state=state, country=country,
+                                    latitude=latitude, longitude=longitude)
+
+    def test_geohash_matches_the_reference_encoding(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(self.order(latitude=57.64911, longitude=10.40744).geohash, 'u4pruydq')
+        self.assertEqual(self.order().geohash, '')
+
+    def test_region_key_ignores_spelling_details(self):
+        first = self.order('St. Louis', 'MO', 'USA')
+        second = self.order('  st louis', 'mo.', 'usa ')
+        self.assertEqual(first.region_key, 'st louis|mo|usa')
+        self.assertEqual(first.region_key, second.region_key)
+        self.assertEqual(geo.region_key('Bogotá', '', 'Colombia'), 'bogota||colombia')
+
+    def test_rollup_groups_by_region_key(self):
+        movie = Movie.objects.create(name='Movie', price=5, description='')
+        for city in ('Atlanta', 'atlanta ', 'ATLANTA'):
+            checkout.place_order(self.user, {movie.id: 1}, city=city, state='GA')
+        self.assertEqual(list(RegionalPopularity.objects.values_list('region_key', 'purchases')),
+                         [('atlanta|ga|', 3)])
+        rollups.rebuild()
+        self.assertEqual(list(RegionalPopularity.objects.values_list('region_key', 'purchases')),
+                         [('atlanta|ga|', 3)])
+
+    def test_bbox_and_radius_queries(self):
+        atlanta = self.order(latitude=33.749, longitude=-84.388)
+        decatur = self.order(latitude=33.7748, longitude=-84.2963)
+        self.order(latitude=10.5, longitude=-66.9)
+        suva = self.order(latitude=-18.1, longitude=178.4)
+        self.order()
+
+        self.assertEqual(set(geo.in_bbox(Order.objects.all(), -85, 33, -84, 34)), {atlanta, decatur})
+        self.assertEqual(list(geo.in_bbox(Order.objects.all(), 170, -30, -170, 0)), [suva])
+        self.assertEqual(geo.within_radius(Order.objects.all(), 33.75, -84.39, 5), [atlanta])
+        self.assertEqual(geo.within_radius(Order.objects.all(), 33.75, -84.39, 15), [atlanta, decatur])
+
+    def test_area_queries_only_read_the_covering_cells(self):
+        cells = geo.covering_cells(-84.5, 33.6, -84.2, 33.9)
+        self.assertLessEqual(len(cells), geo.MAX_CELLS)
+        self.assertTrue(any(geo.encode(33.749, -84.388).startswith(cell) for cell in cells))
+        sql, params = geo.in_bbox(Order.objects.all(), -84.5, 33.6, -84.2, 33.9).query.sql_with_params()
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('geohash', plan)
+        self.assertNotIn('SCAN cart_order', plan.replace('USING INDEX', ''))
+
+    def test_backfill_command_fills_missing_keys(self):
+        order = self.order('Atlanta', 'GA', 'USA', 33.749, -84.388)
+        Order.objects.update(geohash='', region_key='')
+        out = StringIO()
+        call_command('backfill_order_geo', stdout=out)
+        order.refresh_from_db()
+        self.assertEqual((order.geohash, order.region_key), (geo.encode(33.749, -84.388), 'atlanta|ga|usa'))
+        self.assertIn('Updated geo keys for 1 of 1', out.getvalue())
@@ -3,6 +3,8 @@ from . import views
 urlpatterns = [
     path('', views.index, name='cart.index'),
     path('<int:id>/add/', views.add, name='cart.add'),
+    path('<int:id>/remove/', views.remove, name='cart.remove'),
     path('clear/', views.clear, name='cart.clear'),
     path('purchase/', views.purchase, name='cart.purchase'),
+    path('orders/<int:id>/location/', views.order_location, name='cart.order_location'),
 ]
\ No newline at end of file
@@ -1,3 +1,57 @@
-from django.test import TestCase
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from movies.models import Movie
+from perf.testing import ViewBudgetTestCase
+
+
+class HomeViewBudgetTests(ViewBudgetTestCase):
+    def test_home(self):
+        # "Trending Now" is one indexed read of the top trending scores.
+        self.assertViewBudget('home.index', 1, reverse('home.index'), status=200)
+        self.login()
+        self.assertViewBudget('home.index[authenticated]', 3, reverse('home.index'), status=200)
+
+    def test_trending_now_lists_the_top_scores(self):
+        hot, warm = self.seeded.movies[:2]
+        Movie.objects.update(trending_score=0)
+        Movie.objects.filter(pk=hot.pk).update(trending_score=5)
+        Movie.objects.filter(pk=warm.pk).update(trending_score=2)
+        response = self.client.get(reverse('home.index'))
+        self.assertEqual(response.context['template_data']['trending'], [hot, warm])
+        self.assertContains(response, reverse('movies.show', args=[hot.id]))
+
+    def test_about(self):
+        self.assertViewBudget('home.about', 0, reverse('home.about'), status=200)
+
+
+class StaticAssetCachingTests(TestCase):
+    def setUp(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'moviestore.storage.HashedStaticFilesStorage'}}
+        self.enterContext(override_settings(STATIC_ROOT=static_root, STORAGES=storages))
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_collected_assets_are_fingerprinted_and_immutable(self):
+        url = static('css/style.css')
+        self.assertRegex(url, r'/css/style\.[0-9a-f]{12}\.css$')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+        revalidation = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidation.status_code, 304)
+        self.assertEqual(revalidation.content, b'')
+
+    def test_templates_link_the_hashed_names(self):
+        html = self.client.get(reverse('home.index')).content.decode()
+        self.assertRegex(html, r'css/style\.[0-9a-f]{12}\.css')
+        self.assertRegex(html, r'img/backgroundMS\.[0-9a-f]{12}\.jpg')
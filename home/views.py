@@ -1,4 +1,7 @@
 from django.shortcuts import render
+
+from movies import trending
+from recommendations import als
 # this creates more of the connection beteen the url home and the actual rendering 
 def index(request):
 
@@ -8,6 +11,12 @@ def index(request):
     #title is the key
     template_data['title'] = 'Movies Store'
 
+    # For signed-in users we add "Recommended for you": the recommender scores the whole catalog for this user from a memory-mapped model file (no query), and only the winning movies are read from the database.
+    template_data['recommended'] = als.recommended_for(request.user)
+
+    # "Trending Now" is the top of the trending-score index (one query); scores are bumped by checkout and reviews, so nothing is aggregated here.
+    template_data['trending'] = trending.trending()
+
     # extending the return to have more than two variables, where 'index will have access to template_data variable'
     return render(request, 'home/index.html', {
         'template_data': template_data
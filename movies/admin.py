@@ -1,4 +1,7 @@
 from django.contrib import admin
+from django.db import transaction
+
+from . import petitions, ratings
 from .models import Movie, Review, Petition, PetitionVote
 
 # We created a MovieAdmin class that inherits from admin.ModelAdmin. This defines a custom admin class that allows you to customize the behavior of the admin interface for the Movie model.
@@ -12,7 +15,66 @@ class MovieAdmin(admin.ModelAdmin):
 #Finally, we registered the Movie model with the custom admin class, MovieAdmin. This tells Django to use the MovieAdmin class to customize the admin interface for the Movie model.
 admin.site.register(Movie, MovieAdmin)
 
-admin.site.register(Review)
+# Reviews changed in the admin go through the same helpers as the review views (movies/ratings.py), in the same transaction as the write, so the rating aggregates on Movie stay in step.
+class ReviewAdmin(admin.ModelAdmin):
+    list_display = ['movie', 'user', 'rating', 'date']
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if not change:
+                obj.save()
+                ratings.record_rating(obj.movie_id, obj.rating)
+                return
+            #We re-read the stored row under a lock, so the rating we take back out of the aggregates is the one actually stored.
+            old = Review.objects.select_for_update().only('movie_id', 'rating').get(pk=obj.pk)
+            obj.save()
+            if old.movie_id != obj.movie_id:
+                ratings.remove_rating(old.movie_id, old.rating)
+                ratings.record_rating(obj.movie_id, obj.rating)
+            else:
+                ratings.change_rating(obj.movie_id, old.rating, obj.rating)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Review.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            removed = list(queryset.select_for_update().values_list('movie_id', 'rating'))
+            queryset.delete()
+            for movie_id, rating in removed:
+                ratings.remove_rating(movie_id, rating)
+
+admin.site.register(Review, ReviewAdmin)
 
 admin.site.register(Petition)
-admin.site.register(PetitionVote)
+
+# Votes changed in the admin adjust the petition's yes/no counters through movies/petitions.py, just like vote_petition does.
+class PetitionVoteAdmin(admin.ModelAdmin):
+    list_display = ['petition', 'user', 'vote']
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if not change:
+                obj.save()
+                petitions.add_vote(obj.petition_id, obj.vote)
+                return
+            #We re-read the stored row under a lock, so the vote we take back out of the counters is the one actually stored.
+            old = PetitionVote.objects.select_for_update().only('petition_id', 'vote').get(pk=obj.pk)
+            obj.save()
+            if old.petition_id != obj.petition_id:
+                petitions.remove_vote(old.petition_id, old.vote)
+                petitions.add_vote(obj.petition_id, obj.vote)
+            else:
+                petitions.change_vote(obj.petition_id, old.vote, obj.vote)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, PetitionVote.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            removed = list(queryset.select_for_update().values_list('petition_id', 'vote'))
+            queryset.delete()
+            for petition_id, vote in removed:
+                petitions.remove_vote(petition_id, vote)
+
+admin.site.register(PetitionVote, PetitionVoteAdmin)
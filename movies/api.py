@@ -0,0 +1,214 @@
+"""
+Read-only JSON API for the catalog, mounted at /api/v1/.
+
+    GET /api/v1/movies/                    keyset-paginated catalog (?cursor=, ?page_size=, ?fields=)
+    GET /api/v1/movies/bulk/?ids=1,2,3     up to MAX_BULK_IDS movies in one request
+    GET /api/v1/movies/<id>/               one movie
+    GET /api/v1/movies/<id>/reviews/       keyset-paginated reviews, oldest first
+    GET /api/v1/movies/<id>/aggregates/    review count, average and star histogram
+
+?fields=id,name,price limits the movie fields returned (and the columns read).
+
+Every response carries an ETag derived from the updated_at columns on Movie
+and Review. The validator is computed with one small query before anything
+else is loaded, so a client that sends it back (If-None-Match) and gets a
+304 costs us almost nothing. Counts are part of the ETag on the collection
+endpoints so deletions change it too. Only single-movie responses also send
+Last-Modified: a delete never moves Max(updated_at), so a date alone cannot
+tell a client its copy of a list is stale.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from moviestore.pagination import paginate_keyset, parse_page_size
+
+from .models import Movie, Review
+
+MAX_BULK_IDS = 100
+
+# Every field a client can ask for, and the model columns needed to produce it.
+MOVIE_FIELDS = {
+    'id': ('id',),
+    'name': ('name',),
+    'description': ('description',),
+    'price': ('price',),
+    'image': ('image',),
+    'review_count': ('review_count',),
+    'avg_rating': ('review_count', 'rating_sum'),
+    'rating_histogram': tuple(f'rating_{r}_count' for r in range(1, 6)),
+    'updated_at': ('updated_at',),
+}
+DEFAULT_MOVIE_FIELDS = ('id', 'name', 'price', 'image', 'review_count', 'avg_rating', 'updated_at')
+CATALOG_ORDERING = ('name', 'id')
+REVIEW_ORDERING = ('date', 'id')
+
+
+class BadRequest(Exception):
+    pass
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def parse_fields(request):
+    raw = request.GET.get('fields')
+    if not raw:
+        return DEFAULT_MOVIE_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in MOVIE_FIELDS]
+    if unknown or not fields:
+        raise BadRequest(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(MOVIE_FIELDS)}.")
+    return fields
+
+
+def movie_columns(fields):
+    # id and updated_at are always read: keyset pagination and the validators need them.
+    columns = {'id', 'updated_at'}
+    for field in fields:
+        columns.update(MOVIE_FIELDS[field])
+    return sorted(columns)
+
+
+def serialize_movie(movie, fields):
+    values = {}
+    for field in fields:
+        if field == 'image':
+            values['image'] = movie.image.url if movie.image else None
+        elif field == 'updated_at':
+            values['updated_at'] = movie.updated_at.isoformat()
+        elif field == 'rating_histogram':
+            values['rating_histogram'] = {str(stars): count for stars, count, _ in movie.rating_histogram}
+        else:
+            values[field] = getattr(movie, field)
+    return values
+
+
+def serialize_review(review):
+    return {
+        'id': review.id,
+        'user': review.user.username,
+        'rating': review.rating,
+        'comment': review.comment,
+        'date': review.date.isoformat(),
+        'updated_at': review.updated_at.isoformat(),
+    }
+
+
+def conditional_json(request, last_modified, validator, build):
+    """
+    Answer with 304 when the client's copy is current, otherwise with build()'s JSON.
+
+    validator is anything that identifies the representation (timestamps,
+    counts, query parameters); it is hashed into a strong ETag. Pass
+    last_modified=None where a date alone cannot prove the copy is current;
+    then If-Modified-Since is ignored and no Last-Modified is sent.
+    """
+    etag = '"%s"' % hashlib.sha1(repr((validator, sorted(request.GET.lists()))).encode()).hexdigest()[:20]
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = JsonResponse(build())
+        if timestamp is not None:
+            response.headers['Last-Modified'] = http_date(timestamp)
+    response.headers['ETag'] = etag
+    # Clients may keep the payload but must revalidate before reusing it.
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+
+def api_view(view):
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as exc:
+            return error(str(exc))
+    return wrapper
+
+
+@api_view
+def movie_list(request):
+    fields = parse_fields(request)
+    state = Movie.objects.aggregate(last=Max('updated_at'), count=Count('id'))
+
+    def build():
+        page = paginate_keyset(
+            Movie.objects.only(*movie_columns(fields)), CATALOG_ORDERING, request.GET.get('cursor'),
+            parse_page_size(request.GET.get('page_size'), settings.MOVIES_PAGE_SIZE))
+        return {
+            'results': [serialize_movie(movie, fields) for movie in page.items],
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
+
+    return conditional_json(request, None, (state['last'], state['count']), build)
+
+
+@api_view
+def movie_bulk(request):
+    try:
+        ids = list(dict.fromkeys(int(value) for value in request.GET.get('ids', '').split(',') if value.strip()))
+    except ValueError:
+        raise BadRequest('ids must be a comma-separated list of integers.')
+    if not ids:
+        raise BadRequest('Pass the movies to fetch as ?ids=1,2,3.')
+    if len(ids) > MAX_BULK_IDS:
+        raise BadRequest(f'At most {MAX_BULK_IDS} ids per request.')
+    fields = parse_fields(request)
+    state = Movie.objects.filter(id__in=ids).aggregate(last=Max('updated_at'), count=Count('id'))
+
+    def build():
+        found = Movie.objects.only(*movie_columns(fields)).in_bulk(ids)
+        return {
+            'results': [serialize_movie(found[pk], fields) for pk in ids if pk in found],
+            'missing': [pk for pk in ids if pk not in found],
+        }
+
+    return conditional_json(request, None, (state['last'], state['count']), build)
+
+
+@api_view
+def movie_detail(request, id):
+    fields = parse_fields(request)
+    movie = get_object_or_404(Movie.objects.only(*movie_columns(fields)), id=id)
+    return conditional_json(request, movie.updated_at, movie.updated_at,
+                            lambda: serialize_movie(movie, fields))
+
+
+@api_view
+def movie_reviews(request, id):
+    if not Movie.objects.filter(id=id).exists():
+        return error('Movie not found.', status=404)
+    reviews = Review.objects.filter(movie_id=id)
+    state = reviews.aggregate(last=Max('updated_at'), count=Count('id'))
+
+    def build():
+        page = paginate_keyset(
+            reviews.select_related('user').only('id', 'rating', 'comment', 'date', 'updated_at', 'user__username'),
+            REVIEW_ORDERING, request.GET.get('cursor'),
+            parse_page_size(request.GET.get('page_size'), settings.REVIEWS_PAGE_SIZE))
+        return {
+            'results': [serialize_review(review) for review in page.items],
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
+
+    return conditional_json(request, None, (state['last'], state['count']), build)
+
+
+@api_view
+def movie_aggregates(request, id):
+    fields = ('id', 'review_count', 'avg_rating', 'rating_histogram', 'updated_at')
+    movie = get_object_or_404(Movie.objects.only(*movie_columns(fields)), id=id)
+    return conditional_json(request, movie.updated_at, movie.updated_at,
+                            lambda: serialize_movie(movie, fields))
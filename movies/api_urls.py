@@ -0,0 +1,9 @@
+from django.urls import path
+from . import api
+urlpatterns = [
+    path('movies/', api.movie_list, name='api.movies'),
+    path('movies/bulk/', api.movie_bulk, name='api.movies_bulk'),
+    path('movies/<int:id>/', api.movie_detail, name='api.movie'),
+    path('movies/<int:id>/reviews/', api.movie_reviews, name='api.movie_reviews'),
+    path('movies/<int:id>/aggregates/', api.movie_aggregates, name='api.movie_aggregates'),
+]
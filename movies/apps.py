@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save
+
+
+def ensure_search_index(sender, using='default', **kwargs):
+    # SQLite table rebuilds during migrate drop the FTS sync triggers, so we put them back once migrate is done.
+    from django.db import connections
+    from . import search
+    search.install(connections[using])
+
+
+def make_poster_variants(sender, instance, raw=False, **kwargs):
+    # Loading fixtures (raw) should not write files; the backfill command covers those movies.
+    if raw:
+        return
+    from . import images
+    images.update_variants(instance)
 
 
 class MoviesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'movies'
+
+    def ready(self):
+        post_migrate.connect(ensure_search_index, sender=self)
+        post_save.connect(make_poster_variants, sender=self.get_model('Movie'), dispatch_uid='movies.poster_variants')
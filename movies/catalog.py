@@ -0,0 +1,311 @@
+"""
+Streaming catalog import and export (`manage.py import_catalog` / `export_catalog`).
+
+A catalog feed is JSON Lines or CSV with one movie per record:
+
+    {"external_id": "tt0499549", "name": "Avatar", "price": 12, "description": "...", "image": "posters/avatar.jpg"}
+
+external_id is the feed's own key for the movie (Movie.external_id), so
+importing the same feed again updates the movies instead of duplicating
+them. image is optional: an http(s) URL, or a path relative to the images
+directory given to the importer; without it the movie keeps its poster.
+
+import_records() reads the feed as a stream and handles it a batch at a time,
+so memory stays bounded however long the feed is. For each batch:
+
+1. the posters are fetched and stored by a thread pool (the work is file and
+   network I/O); identical files are stored once, see moviestore/storage.py,
+2. one SELECT reads the batch's existing movies (to keep unchanged posters'
+   variants), and
+3. one INSERT ... ON CONFLICT (external_id) DO UPDATE upserts the whole
+   batch, in its own transaction, which also bumps the catalog version that
+   cart price snapshots are checked against (cart/store.py), so carts in
+   every worker re-price as soon as the batch is committed.
+
+After every committed batch the byte offset reached in the feed is reported
+to a checkpoint callback, so an interrupted import can be resumed from there
+instead of starting again (see the command's --resume). Invalid records are
+skipped and reported, not fatal.
+
+Poster variants are not made during the import (bulk writes bypass the
+post_save signal); run `manage.py generate_poster_variants` afterwards.
+"""
+import csv
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.request import urlopen
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from cart.store import bump_catalog_version
+
+from .models import Movie
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('external_id', 'name', 'price', 'description', 'image')
+UPDATE_FIELDS = ['name', 'price', 'description', 'image', 'image_variants', 'updated_at']
+POSTER_DIR = 'movie_images'
+FETCH_TIMEOUT = 30
+# How many bad records are described in ImportStats.errors; the rest are only counted.
+MAX_REPORTED_ERRORS = 50
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+@dataclass
+class ImportStats:
+    records: int = 0
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    images: int = 0
+    image_failures: int = 0
+    errors: list = field(default_factory=list)
+
+    def error(self, position, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'record {position}: {message}')
+
+
+def feed_format(path, fmt=None):
+    """'jsonl' or 'csv', from fmt or else the file extension."""
+    if fmt:
+        return fmt
+    return 'csv' if str(path).lower().endswith('.csv') else 'jsonl'
+
+
+def _lines(stream, offset):
+    # Decoded lines with the byte offset just past each one; counted here because tell() is not
+    # available while iterating, or at all on pipes.
+    while True:
+        raw = stream.readline()
+        if not raw:
+            return
+        offset += len(raw)
+        yield raw.decode('utf-8'), offset
+
+
+def read_records(stream, fmt, offset=0):
+    """
+    Yield (record dict, byte offset after it) from a binary stream.
+
+    offset is where reading starts; for CSV the header is always read from
+    the start of the stream, so resuming needs a seekable stream.
+    """
+    if fmt == 'csv':
+        header_line = stream.readline()
+        header = next(csv.reader([header_line.decode('utf-8-sig')]), [])
+        if offset > len(header_line):
+            stream.seek(offset)
+        else:
+            offset = len(header_line)
+        lines = _lines(stream, offset)
+        position = {'offset': offset}
+
+        def text():
+            for line, end in lines:
+                position['offset'] = end
+                yield line
+
+        # csv.reader pulls one line at a time, so after each row the offset is the end of that row.
+        for row in csv.reader(text()):
+            if row:
+                yield dict(zip(header, row)), position['offset']
+        return
+
+    if offset:
+        stream.seek(offset)
+    for line, end in _lines(stream, offset):
+        line = line.lstrip('\ufeff').strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            record = InvalidRecord(f'not valid JSON ({exc})')
+        yield record, end
+
+
+def clean(record):
+    """The movie fields of a raw record; raises InvalidRecord."""
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise InvalidRecord('not an object')
+    external_id = str(record.get('external_id') or '').strip()
+    if not external_id:
+        raise InvalidRecord('external_id is missing')
+    if len(external_id) > Movie._meta.get_field('external_id').max_length:
+        raise InvalidRecord('external_id is too long')
+    name = str(record.get('name') or '').strip()
+    if not name or len(name) > Movie._meta.get_field('name').max_length:
+        raise InvalidRecord('name is missing or too long')
+    try:
+        price = int(str(record.get('price', '')).strip())
+    except ValueError:
+        raise InvalidRecord(f'price "{record.get("price")}" is not a whole number') from None
+    if price < 0:
+        raise InvalidRecord('price is negative')
+    return {
+        'external_id': external_id,
+        'name': name,
+        'price': price,
+        'description': str(record.get('description') or ''),
+        'image': str(record.get('image') or '').strip(),
+    }
+
+
+def store_poster(source, images_dir=None, storage=None):
+    """Copy a poster (URL or path under images_dir) into the media storage and return its stored name."""
+    storage = storage or default_storage
+    if source.startswith(('http://', 'https://')):
+        with urlopen(source, timeout=FETCH_TIMEOUT) as response:
+            content = response.read()
+        filename = os.path.basename(source.split('?', 1)[0]) or 'poster'
+    else:
+        root = os.path.realpath(images_dir or '.')
+        path = os.path.realpath(os.path.join(root, source))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(f'{source} is outside the images directory')
+        with open(path, 'rb') as fh:
+            content = fh.read()
+        filename = os.path.basename(path)
+    return storage.save(f'{POSTER_DIR}/{filename}', ContentFile(content))
+
+
+def _upsert(rows, posters):
+    existing = {
+        external_id: (image, variants)
+        for external_id, image, variants in Movie.objects.filter(external_id__in=list(rows))
+        .values_list('external_id', 'image', 'image_variants')
+    }
+    movies = []
+    for external_id, row in rows.items():
+        image, variants = existing.get(external_id, ('', {}))
+        stored = posters.get(row['image'])
+        if stored and stored != image:
+            image, variants = stored, {}
+        movies.append(Movie(external_id=external_id, name=row['name'], price=row['price'],
+                            description=row['description'], image=image, image_variants=variants))
+    with transaction.atomic():
+        Movie.objects.bulk_create(movies, update_conflicts=True, unique_fields=['external_id'],
+                                  update_fields=UPDATE_FIELDS)
+        # bulk_create() sends no post_save, so the snapshots are invalidated here.
+        bump_catalog_version()
+    return len(movies) - len(existing), len(existing)
+
+
+def import_records(records, images_dir=None, batch_size=1000, workers=8, checkpoint=None, stats=None):
+    """
+    Upsert (record, offset) pairs from read_records() in batches. Returns ImportStats.
+
+    checkpoint(offset, stats) is called after each committed batch.
+    """
+    stats = stats or ImportStats()
+
+    def fetch(source):
+        try:
+            return source, store_poster(source, images_dir)
+        except (OSError, ValueError) as exc:
+            return source, exc
+
+    def flush(rows, offset):
+        sources = {row['image'] for row in rows.values() if row['image']}
+        posters = {}
+        for source, result in pool.map(fetch, sources):
+            if isinstance(result, Exception):
+                stats.image_failures += 1
+                if len(stats.errors) < MAX_REPORTED_ERRORS:
+                    stats.errors.append(f'image {source}: {result}')
+            else:
+                stats.images += 1
+                posters[source] = result
+        created, updated = _upsert(rows, posters)
+        stats.created += created
+        stats.updated += updated
+        if checkpoint is not None:
+            checkpoint(offset, stats)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        rows, offset = {}, None
+        for record, offset in records:
+            stats.records += 1
+            try:
+                row = clean(record)
+            except InvalidRecord as exc:
+                stats.error(stats.records, exc)
+                continue
+            # A feed that lists a movie twice in one batch: the later record wins.
+            rows[row['external_id']] = row
+            if len(rows) >= batch_size:
+                flush(rows, offset)
+                rows = {}
+        if rows:
+            flush(rows, offset)
+        elif checkpoint is not None and offset is not None:
+            # The feed ended with invalid records; remember that they were read.
+            checkpoint(offset, stats)
+    return stats
+
+
+def export_records(stream, fmt, images_dir=None, chunk_size=2000, workers=8):
+    """
+    Write every movie to a text stream as JSON Lines or CSV, in id order. Returns the number written.
+
+    With images_dir the poster files are copied there by a thread pool and
+    the image field is the copied file's name, so the feed and directory
+    can be imported elsewhere with --images-dir; otherwise it is the name
+    in the media storage.
+    """
+    writer = csv.writer(stream) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(FIELDS)
+    if images_dir:
+        os.makedirs(images_dir, exist_ok=True)
+    copied = set()
+
+    def copy(name):
+        try:
+            with default_storage.open(name, 'rb') as source, \
+                    open(os.path.join(images_dir, os.path.basename(name)), 'wb') as target:
+                shutil.copyfileobj(source, target)
+        except OSError as exc:
+            logger.warning("Could not copy poster %s: %s", name, exc)
+
+    def write(chunk):
+        names = {movie.image.name for movie in chunk if movie.image and movie.image.name not in copied}
+        if images_dir and names:
+            list(pool.map(copy, names))
+            copied.update(names)
+        for movie in chunk:
+            image = movie.image.name if movie.image else ''
+            values = [movie.external_id or '', movie.name, movie.price, movie.description,
+                      os.path.basename(image) if images_dir and image else image]
+            if writer:
+                writer.writerow(values)
+            else:
+                stream.write(json.dumps(dict(zip(FIELDS, values)), ensure_ascii=False) + '\n')
+
+    written = 0
+    movies = Movie.objects.order_by('id').only(*FIELDS).iterator(chunk_size=chunk_size)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        chunk = []
+        for movie in movies:
+            chunk.append(movie)
+            if len(chunk) >= chunk_size:
+                write(chunk)
+                written += len(chunk)
+                chunk = []
+        write(chunk)
+        written += len(chunk)
+    return written
@@ -0,0 +1,124 @@
+"""
+Resized WebP/AVIF variants of movie posters.
+
+Uploaded posters are stored as-is, which is often far bigger than the 220px
+grid cell they are shown in. For every poster we also write smaller copies
+at the widths in POSTER_WIDTHS, in each modern format this Pillow build can
+encode (AVIF and WebP), next to the original:
+
+    movie_images/Avatar.jpg
+    movie_images/variants/Avatar-220w.avif
+    movie_images/variants/Avatar-220w.webp
+    ...
+
+(the default storage adds a content hash to each name, see moviestore/storage.py).
+Because of that, regenerating a variant writes a new file rather than
+replacing the old one, and movies with the same poster share variant files,
+so superseded variants are not deleted here.
+
+The result is recorded in Movie.image_variants as
+
+    {"source": "movie_images/Avatar.jpg", "width": 250, "height": 370,
+     "formats": {"avif": {"220": "movie_images/variants/Avatar-220w.avif", ...},
+                 "webp": {...}}}
+
+so templates can build srcset attributes without touching the filesystem
+(see the poster tag in movies/templatetags/posters.py). Variants are made
+when a movie is saved with a new image, and for existing posters by
+`manage.py generate_poster_variants`.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# Preferred first: browsers take the first <source> type they support.
+FORMATS = {
+    'avif': {'feature': 'avif', 'mime': 'image/avif', 'options': {'quality': 55, 'speed': 8}},
+    'webp': {'feature': 'webp', 'mime': 'image/webp', 'options': {'quality': 78, 'method': 4}},
+}
+
+
+def available_formats():
+    return [name for name, spec in FORMATS.items() if features.check(spec['feature'])]
+
+
+def target_widths(original_width, widths=None):
+    """The requested widths that do not upscale, plus the original width when it is smaller than the largest one."""
+    widths = sorted(set(widths or settings.POSTER_WIDTHS))
+    chosen = [width for width in widths if width < original_width]
+    if not chosen or widths[-1] > original_width:
+        chosen.append(min(widths[-1], original_width))
+    return sorted(set(chosen))
+
+
+def variant_name(source_name, width, fmt):
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'variants', f'{stem}-{width}w.{fmt}')
+
+
+def build_variants(source_name, storage=None, widths=None, formats=None):
+    """
+    Write all variants of the image stored at source_name and return the image_variants dict.
+
+    Touches only the storage, never the database, so it can run in a worker
+    process. A missing or unreadable image gives a dict with no formats,
+    which keeps us from retrying it on every save.
+    """
+    storage = storage or default_storage
+    result = {'source': source_name, 'formats': {}}
+    try:
+        with storage.open(source_name, 'rb') as fh:
+            image = Image.open(fh)
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (OSError, ValueError) as exc:
+        logger.warning("Could not read poster %s: %s", source_name, exc)
+        return result
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.mode in ('LA', 'PA') or 'transparency' in image.info else 'RGB')
+    result['width'], result['height'] = image.size
+
+    for width in target_widths(image.width, widths):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in formats or available_formats():
+            buffer = BytesIO()
+            resized.save(buffer, format=fmt.upper(), **FORMATS[fmt]['options'])
+            saved = storage.save(variant_name(source_name, width, fmt), ContentFile(buffer.getvalue()))
+            result['formats'].setdefault(fmt, {})[str(width)] = saved
+    return result
+
+
+def needs_variants(movie):
+    return bool(movie.image) and (movie.image_variants or {}).get('source') != movie.image.name
+
+
+def update_variants(movie):
+    """Regenerate movie's variants if its image changed since they were made. Returns True if it did."""
+    if not needs_variants(movie):
+        return False
+    movie.image_variants = build_variants(movie.image.name, storage=movie.image.storage)
+    # update() rather than save() so we do not fire post_save (and come back here) again.
+    type(movie).objects.filter(pk=movie.pk).update(image_variants=movie.image_variants)
+    return True
+
+
+def srcsets(variants, storage=None):
+    """[(mime type, "url 220w, url 440w")] for each format in image_variants, best format first."""
+    storage = storage or default_storage
+    sources = []
+    for fmt, spec in FORMATS.items():
+        by_width = (variants or {}).get('formats', {}).get(fmt)
+        if by_width:
+            entries = sorted(by_width.items(), key=lambda item: int(item[0]))
+            sources.append((spec['mime'], ', '.join(f'{storage.url(name)} {width}w' for width, name in entries)))
+    return sources
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from movies import catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Export every movie as a JSON Lines or CSV feed that import_catalog reads back, streamed in id order. "
+        "Movies without an external_id are exported with it empty and must be given one before re-importing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Output file, or - (default) for standard output.")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help="Default: from the file extension (.csv or JSON Lines).")
+        parser.add_argument('--images-dir', help="Also copy the poster files here; the feed then names them relative to it.")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Movies read per query.")
+        parser.add_argument('--workers', type=int, default=8, help="Threads copying posters.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = catalog.feed_format(path, options['format'])
+        stream = self.stdout if path == '-' else open(path, 'w', encoding='utf-8', newline='')
+        try:
+            written = catalog.export_records(stream, fmt, options['images_dir'], options['chunk_size'],
+                                             options['workers'])
+        finally:
+            if stream is not self.stdout:
+                stream.close()
+        if path != '-':
+            self.stdout.write(self.style.SUCCESS(f"Exported {written} movies to {path}."))
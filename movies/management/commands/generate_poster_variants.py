@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from movies import images
+from movies.models import Movie
+
+
+def _build(source_name):
+    # Runs in a worker process: only reads and writes files, the parent does all database work.
+    return source_name, images.build_variants(source_name)
+
+
+class Command(BaseCommand):
+    help = "Generate resized AVIF/WebP poster variants for movies that do not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (default: one per CPU). Use 1 to run in this process.")
+        parser.add_argument('--force', action='store_true', help="Regenerate variants even if they are up to date.")
+        parser.add_argument('--batch-size', type=int, default=200, help="Movies written per UPDATE batch.")
+
+    def handle(self, *args, **options):
+        movies = [movie for movie in Movie.objects.exclude(image='').only('id', 'image', 'image_variants')
+                  if options['force'] or images.needs_variants(movie)]
+        # Seeded and imported catalogs often reuse a poster; each distinct file is processed once.
+        by_source = {}
+        for movie in movies:
+            by_source.setdefault(movie.image.name, []).append(movie)
+        if not by_source:
+            self.stdout.write(self.style.SUCCESS("All posters already have variants."))
+            return
+
+        results = {}
+        if options['workers'] <= 1:
+            for source in by_source:
+                results[source] = images.build_variants(source)
+        else:
+            # Children must not inherit open database connections.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+                futures = [pool.submit(_build, source) for source in by_source]
+                for done, future in enumerate(as_completed(futures), 1):
+                    source, variants = future.result()
+                    results[source] = variants
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"[{done}/{len(futures)}] {source}")
+
+        updated = []
+        for source, variants in results.items():
+            for movie in by_source[source]:
+                movie.image_variants = variants
+                updated.append(movie)
+        Movie.objects.bulk_update(updated, ['image_variants'], batch_size=options['batch_size'])
+
+        failed = [source for source, variants in results.items() if not variants['formats']]
+        for source in failed:
+            self.stdout.write(self.style.WARNING(f"Could not read {source}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated variants for {len(results) - len(failed)} poster(s) used by {len(updated)} movie(s)."))
@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies import catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Import (insert or update) movies from a JSON Lines or CSV feed keyed by external_id, a batch at a "
+        "time. Posters are loaded by a thread pool from URLs or from --images-dir. Progress is checkpointed "
+        "after every batch so an interrupted import can be continued with --resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="The feed file, or - to read standard input.")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help="Default: from the file extension (.csv or JSON Lines).")
+        parser.add_argument('--images-dir', help="Directory that relative image paths in the feed are read from.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Movies upserted per transaction.")
+        parser.add_argument('--workers', type=int, default=8, help="Threads fetching and storing posters.")
+        parser.add_argument('--checkpoint', help="Checkpoint file (default: <path>.checkpoint.json).")
+        parser.add_argument('--resume', action='store_true', help="Continue from the checkpoint of an earlier run.")
+
+    def handle(self, *args, **options):
+        path, fmt = options['path'], catalog.feed_format(options['path'], options['format'])
+        if path == '-':
+            if options['resume']:
+                raise CommandError("--resume needs a file; standard input cannot be rewound.")
+            stats = catalog.import_records(catalog.read_records(sys.stdin.buffer, fmt), options['images_dir'],
+                                           options['batch_size'], options['workers'])
+            return self.report(stats)
+
+        checkpoint_path = options['checkpoint'] or path + '.checkpoint.json'
+        source = os.stat(path)
+        identity = {'path': os.path.abspath(path), 'size': source.st_size, 'mtime': source.st_mtime}
+        offset, stats = 0, catalog.ImportStats()
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as fh:
+                saved = json.load(fh)
+            if saved['feed'] != identity:
+                raise CommandError(f"{checkpoint_path} belongs to a different or changed feed; remove it to start over.")
+            offset, stats = saved['offset'], catalog.ImportStats(**saved['stats'])
+            self.stdout.write(f"Resuming after {stats.records} records (byte {offset}).")
+
+        def checkpoint(offset, stats):
+            # Written to a temporary file and renamed, so a crash never leaves a half-written checkpoint.
+            with open(checkpoint_path + '.tmp', 'w') as fh:
+                json.dump({'feed': identity, 'offset': offset, 'stats': vars(stats)}, fh)
+            os.replace(checkpoint_path + '.tmp', checkpoint_path)
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{stats.records} records, {stats.created} created, {stats.updated} updated")
+
+        with open(path, 'rb') as stream:
+            stats = catalog.import_records(catalog.read_records(stream, fmt, offset), options['images_dir'],
+                                           options['batch_size'], options['workers'], checkpoint, stats)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.report(stats)
+
+    def report(self, stats):
+        for error in stats.errors:
+            self.stdout.write(self.style.WARNING(error))
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats.records} records: {stats.created} movies created, {stats.updated} updated, "
+            f"{stats.failed} skipped; {stats.images} posters stored, {stats.image_failures} could not be loaded."))
+        if stats.images:
+            self.stdout.write("Run `manage.py generate_poster_variants` to make the resized poster variants.")
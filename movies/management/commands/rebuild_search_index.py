@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from movies import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over Movie.name and Movie.description."
+
+    def handle(self, *args, **options):
+        if search.rebuild():
+            self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
+        else:
+            self.stdout.write("FTS5 is not available on this database; search falls back to icontains.")
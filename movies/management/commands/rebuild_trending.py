@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from movies import trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every movie's trending score from the orders and reviews. Checkout and new reviews keep "
+        "the scores current; this is for data imported around them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help="Movies written per UPDATE batch.")
+
+    def handle(self, *args, **options):
+        scored = trending.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Scored {scored} trending movies."))
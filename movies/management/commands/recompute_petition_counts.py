@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from movies.models import Petition
+from movies import petitions
+
+
+class Command(BaseCommand):
+    help = "Recompute (or just verify) the yes/no vote counters stored on each Petition."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only report petitions whose stored counters are wrong; exit with an error if any are.")
+        parser.add_argument('--petition', type=int, action='append', dest='petition_ids',
+                            help="Limit to this petition id (can be given more than once).")
+
+    def handle(self, *args, **options):
+        petition_ids = options['petition_ids']
+        expected = petitions.compute_counts(petition_ids)
+        stored = petitions.stored_counts(petition_ids)
+
+        mismatched = {pk: values for pk, values in expected.items() if stored.get(pk) != values}
+        for pk, values in mismatched.items():
+            self.stdout.write(f"Petition {pk}: stored {stored.get(pk)} != actual {values}")
+
+        if options['verify']:
+            if mismatched:
+                raise CommandError(f"{len(mismatched)} of {len(expected)} petitions have stale vote counters.")
+            self.stdout.write(self.style.SUCCESS(f"All {len(expected)} petitions have correct vote counters."))
+            return
+
+        with transaction.atomic():
+            for pk, values in mismatched.items():
+                Petition.objects.filter(pk=pk).update(**values)
+        self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatched)} of {len(expected)} petitions."))
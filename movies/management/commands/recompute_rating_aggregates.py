@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from movies.models import Movie
+from movies import ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute (or just verify) the review count, rating sum and star histogram stored on each Movie."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only report movies whose stored aggregates are wrong; exit with an error if any are.")
+        parser.add_argument('--movie', type=int, action='append', dest='movie_ids',
+                            help="Limit to this movie id (can be given more than once).")
+
+    def handle(self, *args, **options):
+        movie_ids = options['movie_ids']
+        expected = ratings.compute_aggregates(movie_ids)
+        stored = ratings.stored_aggregates(movie_ids)
+
+        mismatched = {pk: values for pk, values in expected.items() if stored.get(pk) != values}
+        for pk, values in mismatched.items():
+            self.stdout.write(f"Movie {pk}: stored {stored.get(pk)} != actual {values}")
+
+        if options['verify']:
+            if mismatched:
+                raise CommandError(f"{len(mismatched)} of {len(expected)} movies have stale rating aggregates.")
+            self.stdout.write(self.style.SUCCESS(f"All {len(expected)} movies have correct rating aggregates."))
+            return
+
+        with transaction.atomic():
+            for pk, values in mismatched.items():
+                Movie.objects.filter(pk=pk).update(**values, updated_at=timezone.now())
+        self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatched)} of {len(expected)} movies."))
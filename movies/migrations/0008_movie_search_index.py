@@ -0,0 +1,25 @@
+# Creates the SQLite FTS5 index used by movies.search. It is a no-op on other
+# database backends, which fall back to icontains matching.
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from movies import search
+    search.install(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from movies import search
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_alter_review_unique_together'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
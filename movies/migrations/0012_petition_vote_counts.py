@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:07
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_vote_counts(apps, schema_editor):
+    Petition = apps.get_model('movies', 'Petition')
+    rows = Petition.objects.annotate(
+        yes=Count('votes', filter=Q(votes__vote='yes')),
+        no=Count('votes', filter=Q(votes__vote='no')),
+    ).values_list('pk', 'yes', 'no')
+    for pk, yes, no in rows:
+        Petition.objects.filter(pk=pk).update(yes_count=yes, no_count=no)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_review_movie_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='petition',
+            name='no_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='petition',
+            name='yes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_vote_counts, migrations.RunPython.noop),
+    ]
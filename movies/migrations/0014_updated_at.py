@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def backfill_review_updated_at(apps, schema_editor):
+    # A review has not changed since it was written as far as we know, so it starts out as its date.
+    Review = apps.get_model('movies', 'Review')
+    Review.objects.update(updated_at=F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0013_movie_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_review_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:50
+
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_trending_scores(apps, schema_editor):
+    # Same weights and decay as movies/trending.py, against an epoch of now: each order counts 1 per movie
+    # and each review 0.5, both halved every TRENDING_HALF_LIFE_HOURS.
+    Movie = apps.get_model('movies', 'Movie')
+    Review = apps.get_model('movies', 'Review')
+    Item = apps.get_model('cart', 'Item')
+    TrendingEpoch = apps.get_model('movies', 'TrendingEpoch')
+    now = timezone.now()
+    half_life = settings.TRENDING_HALF_LIFE_HOURS
+    tau = half_life * 3600 / math.log(2)
+    since = now - timedelta(hours=40 * half_life)
+    scores = {}
+    events = [
+        (1.0, Item.objects.filter(order__date__gte=since).values_list('movie_id', 'order__date', 'order_id').distinct()),
+        (0.5, Review.objects.filter(date__gte=since).values_list('movie_id', 'date', 'id')),
+    ]
+    for weight, rows in events:
+        for movie_id, when, _ in rows.iterator():
+            scores[movie_id] = scores.get(movie_id, 0.0) + weight * math.exp((when - now).total_seconds() / tau)
+    Movie.objects.bulk_update([Movie(id=pk, trending_score=score) for pk, score in scores.items()],
+                              ['trending_score'], batch_size=2000)
+    TrendingEpoch.objects.create(pk=1, epoch=now.timestamp())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0014_updated_at'),
+        ('cart', '0008_order_geo_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingEpoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-trending_score', 'id'], name='movie_trending_idx'),
+        ),
+        migrations.RunPython(backfill_trending_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0017_rating_aggregates_not_editable'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='petition',
+            name='no_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='petition',
+            name='yes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -11,6 +11,9 @@ class Movie(models.Model):
     #This is a CharField value that represents a string field with a maximum length of 255 characters. It stores the name of the movie.
     name = models.CharField(max_length=255)
 
+    #external_id is the movie's key in the catalog feeds it is imported from (see movies/catalog.py), so re-importing a feed updates movies instead of duplicating them. Movies added by hand can leave it empty (NULL), which the unique constraint allows any number of times.
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+
      #This is an IntegerField value that stores integer values. It represents the price of the movie.
     price = models.IntegerField()
 
@@ -20,11 +23,59 @@ class Movie(models.Model):
     #This is an ImageField value that stores image files. The upload_to parameter specifies the directory where uploaded images will be stored. In this case, uploaded images will be stored in the movie_images/ directory within the media directory of the Django project. The media directory is used to store user-uploaded files, such as images, documents, or other media files. This directory is specified in your Django project’s settings (we will configure it later in this chapter).
     image = models.ImageField(upload_to='movie_images/')
 
+    #Resized AVIF/WebP copies of the poster and their paths, used for srcset in the templates. They are generated when a new image is saved (see movies/images.py) and can be backfilled with `manage.py generate_poster_variants`.
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    #updated_at records the last change to the movie, including its rating aggregates (movies/ratings.py sets it in the same UPDATE). The JSON API uses it for ETag/Last-Modified, so clients can poll cheaply.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    #Rating aggregates are kept on the movie itself so the detail page never has to scan the Review table. They are maintained with F() expressions by the review views (see movies/ratings.py) and can be recomputed with `manage.py recompute_rating_aggregates`. They are not editable, so saving the movie's admin form cannot write stale counts over a concurrent increment.
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    #trending_score is the movie's time-decayed popularity, stored scaled against the global TrendingEpoch (see movies/trending.py). Checkout and new reviews bump it with one UPDATE, and the home page reads the top of its index.
+    trending_score = models.FloatField(default=0, editable=False)
+
 
     #This is a special method in Python classes that returns a string representation of an object. It concatenates the movie’s id value (converted into a string) with a hyphen and the movie’s name. This method will be useful when we display movies in the Django admin panel later.
     def __str__(self):
         return str(self.id) + ' - ' + self.name
 
+    @property
+    def avg_rating(self):
+        # Average star rating rounded to one decimal, or 0 when the movie has no reviews yet.
+        if not self.review_count:
+            return 0
+        return round(self.rating_sum / self.review_count, 1)
+
+    @property
+    def rating_histogram(self):
+        # List of (stars, count, percent) from 5 stars down to 1, ready for the template.
+        histogram = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'rating_{stars}_count')
+            percent = round(100 * count / self.review_count) if self.review_count else 0
+            histogram.append((stars, count, percent))
+        return histogram
+
+    class Meta:
+        # The catalog is listed (and keyset-paginated) by name with id as the tie-breaker, so that pair gets a composite index.
+        indexes = [
+            models.Index(fields=['name', 'id'], name='movie_name_id_idx'),
+            # "Trending now" is ORDER BY trending_score DESC, id LIMIT 20, read straight off this index.
+            models.Index(fields=['-trending_score', 'id'], name='movie_trending_idx'),
+        ]
+
+
+#The single row holding the epoch (a Unix timestamp) that every Movie.trending_score is scaled against. movies/trending.py moves it forward now and then, rescaling the scores at the same time.
+class TrendingEpoch(models.Model):
+    epoch = models.FloatField()
+
 #We define a Python class named Review, which inherits from models.Model. This means that Review is a Django model class.
 class Review(models.Model):
     #id is an AutoField, which automatically increments its value for each new record added to the database. The primary_key=True parameter specifies that this field is the primary key for the table, uniquely identifying each record.
@@ -47,10 +98,17 @@ class Review(models.Model):
     
     #user is another foreign key relationship but to the User model. A review is associated with a user (the person who wrote the review). Similar to the movie attribute, on_delete=models.CASCADE specifies that if the related user is deleted, the associated review will also be deleted.
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    #updated_at is set on every save, so an edited review changes the ETag of the movie's review list in the JSON API.
+    updated_at = models.DateTimeField(auto_now=True)
     def __str__(self):
         return str(self.id) + ' - ' + self.movie.name
     class Meta:
         unique_together = ('user', 'movie')
+        # Backs the keyset-paginated review list on the movie detail page: WHERE movie_id = ? ORDER BY date, id.
+        indexes = [
+            models.Index(fields=['movie', 'date', 'id'], name='review_movie_date_id_idx'),
+        ]
 
 class Petition(models.Model):
     id = models.AutoField(primary_key=True)
@@ -58,6 +116,10 @@ class Petition(models.Model):
     description = models.TextField(blank=True, null=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized vote tallies, kept in step with PetitionVote by the helpers in movies/petitions.py using F() expressions.
+    # They are not editable in forms (including the admin); repair them with manage.py recompute_petition_counts.
+    yes_count = models.PositiveIntegerField(default=0, editable=False)
+    no_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
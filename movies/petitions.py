@@ -0,0 +1,88 @@
+"""
+Incremental maintenance of the yes/no vote counters stored on Petition.
+
+Every change to a PetitionVote goes through record_vote (the voting view) or
+the helpers below (the admin), inside the same transaction as the vote
+write. Counters are adjusted with F() expressions, so concurrent voters
+cannot lose each other's increments.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+
+from .models import Petition, PetitionVote
+
+# Maps a vote value to the Petition counter column it is tallied in.
+VOTE_COUNTERS = {"yes": "yes_count", "no": "no_count"}
+COUNTER_FIELDS = tuple(VOTE_COUNTERS.values())
+
+
+def add_vote(petition_id, vote_value):
+    """A vote with this value was created."""
+    counter = VOTE_COUNTERS[vote_value]
+    Petition.objects.filter(pk=petition_id).update(**{counter: F(counter) + 1})
+
+
+def remove_vote(petition_id, vote_value):
+    """A vote with this value was deleted."""
+    counter = VOTE_COUNTERS[vote_value]
+    Petition.objects.filter(pk=petition_id).update(**{counter: F(counter) - 1})
+
+
+def change_vote(petition_id, old_value, new_value):
+    """An existing vote went from old_value to new_value."""
+    if old_value == new_value:
+        return
+    old, new = VOTE_COUNTERS[old_value], VOTE_COUNTERS[new_value]
+    Petition.objects.filter(pk=petition_id).update(**{old: F(old) - 1, new: F(new) + 1})
+
+
+def record_vote(petition_id, user, vote_value):
+    """
+    Store user's vote and keep the petition's yes/no counters in step.
+
+    Returns "created", "changed" or "unchanged". The vote row and the counter
+    update happen in one transaction.
+    """
+    with transaction.atomic():
+        existing = PetitionVote.objects.select_for_update().filter(petition_id=petition_id, user=user).first()
+        if existing is None:
+            try:
+                with transaction.atomic():
+                    PetitionVote.objects.create(petition_id=petition_id, user=user, vote=vote_value)
+            except IntegrityError:
+                # Another request from the same user won the race to create the vote; treat this one as an update.
+                existing = PetitionVote.objects.select_for_update().get(petition_id=petition_id, user=user)
+            else:
+                add_vote(petition_id, vote_value)
+                return "created"
+        if existing.vote == vote_value:
+            return "unchanged"
+        # Only flip the counters if the stored vote really was the one we read, so a concurrent flip is never counted twice.
+        flipped = PetitionVote.objects.filter(pk=existing.pk, vote=existing.vote).update(vote=vote_value)
+        if flipped:
+            change_vote(petition_id, existing.vote, vote_value)
+        return "changed"
+
+
+def compute_counts(petition_ids=None):
+    """
+    Recount the votes from the PetitionVote table.
+
+    Returns {petition_id: {field: value}} for every petition in petition_ids
+    (or every petition when petition_ids is None), including petitions
+    without votes.
+    """
+    petitions = Petition.objects.all()
+    if petition_ids is not None:
+        petitions = petitions.filter(pk__in=petition_ids)
+    rows = petitions.values('pk').annotate(
+        **{counter: Count('votes', filter=Q(votes__vote=value)) for value, counter in VOTE_COUNTERS.items()}
+    )
+    return {row.pop('pk'): row for row in rows}
+
+
+def stored_counts(petition_ids=None):
+    petitions = Petition.objects.all()
+    if petition_ids is not None:
+        petitions = petitions.filter(pk__in=petition_ids)
+    return {row.pop('pk'): row for row in petitions.values('pk', *COUNTER_FIELDS)}
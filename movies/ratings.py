@@ -0,0 +1,88 @@
+"""
+Incremental maintenance of the rating aggregates stored on Movie.
+
+Every change to a Review goes through one of the three helpers below, inside
+the same transaction as the review write. They issue a single UPDATE with
+F() expressions, so concurrent reviewers never overwrite each other's
+increments the way a read-modify-write in Python would. The same UPDATE
+bumps Movie.updated_at, because the aggregates are part of what the JSON
+API serves for a movie.
+"""
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import Movie, Review
+
+RATING_VALUES = (1, 2, 3, 4, 5)
+AGGREGATE_FIELDS = ('review_count', 'rating_sum') + tuple(f'rating_{r}_count' for r in RATING_VALUES)
+
+
+def _bucket(rating):
+    return f'rating_{rating}_count'
+
+
+def record_rating(movie_id, rating):
+    """A review with this rating was created."""
+    Movie.objects.filter(pk=movie_id).update(**{
+        'review_count': F('review_count') + 1,
+        'rating_sum': F('rating_sum') + rating,
+        _bucket(rating): F(_bucket(rating)) + 1,
+        'updated_at': timezone.now(),
+    })
+
+
+def remove_rating(movie_id, rating):
+    """A review with this rating was deleted."""
+    Movie.objects.filter(pk=movie_id).update(**{
+        'review_count': F('review_count') - 1,
+        'rating_sum': F('rating_sum') - rating,
+        _bucket(rating): F(_bucket(rating)) - 1,
+        'updated_at': timezone.now(),
+    })
+
+
+def change_rating(movie_id, old_rating, new_rating):
+    """An existing review went from old_rating to new_rating."""
+    if old_rating == new_rating:
+        return
+    Movie.objects.filter(pk=movie_id).update(**{
+        'rating_sum': F('rating_sum') + (new_rating - old_rating),
+        _bucket(old_rating): F(_bucket(old_rating)) - 1,
+        _bucket(new_rating): F(_bucket(new_rating)) + 1,
+        'updated_at': timezone.now(),
+    })
+
+
+def compute_aggregates(movie_ids=None):
+    """
+    Recalculate the aggregates from the Review table.
+
+    Returns {movie_id: {field: value}} for every movie in movie_ids (or every
+    movie when movie_ids is None), including movies without reviews.
+    """
+    reviews = Review.objects.all()
+    movies = Movie.objects.all()
+    if movie_ids is not None:
+        reviews = reviews.filter(movie_id__in=movie_ids)
+        movies = movies.filter(pk__in=movie_ids)
+
+    result = {pk: dict.fromkeys(AGGREGATE_FIELDS, 0) for pk in movies.values_list('pk', flat=True)}
+    rows = (
+        reviews.values('movie_id')
+        .annotate(
+            review_count=Count('id'),
+            rating_sum=Sum('rating'),
+            **{_bucket(r): Count('id', filter=Q(rating=r)) for r in RATING_VALUES},
+        )
+    )
+    for row in rows:
+        if row['movie_id'] in result:
+            result[row['movie_id']] = {f: row[f] or 0 for f in AGGREGATE_FIELDS}
+    return result
+
+
+def stored_aggregates(movie_ids=None):
+    movies = Movie.objects.all()
+    if movie_ids is not None:
+        movies = movies.filter(pk__in=movie_ids)
+    return {row.pop('pk'): row for row in movies.values('pk', *AGGREGATE_FIELDS)}
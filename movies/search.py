@@ -0,0 +1,219 @@
+"""
+Full-text search for the movie catalog.
+
+On SQLite we keep an FTS5 "external content" table (movies_movie_fts) that
+indexes Movie.name and Movie.description. The index itself never stores a
+second copy of the text: it points back at movies_movie through the rowid,
+and three triggers keep it in sync whenever a movie is inserted, updated or
+deleted. Results are ranked with BM25, weighting a hit in the title much
+higher than a hit in the description.
+
+Other database backends (or a SQLite build without FTS5) fall back to a
+case-insensitive containment search over both fields, so the view code never
+has to care which engine is answering.
+"""
+import re
+
+from django.db import connection as default_connection
+from django.db.models import Q
+
+from moviestore.pagination import (
+    DEFAULT_PAGE_SIZE, InvalidCursor, build_page, decode_cursor, paginate_keyset,
+)
+
+FTS_TABLE = 'movies_movie_fts'
+
+# BM25 column weights, in the same order as the indexed columns (name, description).
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TRIGGERS = {
+    'movies_movie_fts_ai': """
+        CREATE TRIGGER IF NOT EXISTS movies_movie_fts_ai AFTER INSERT ON movies_movie BEGIN
+            INSERT INTO movies_movie_fts(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END""",
+    'movies_movie_fts_ad': """
+        CREATE TRIGGER IF NOT EXISTS movies_movie_fts_ad AFTER DELETE ON movies_movie BEGIN
+            INSERT INTO movies_movie_fts(movies_movie_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END""",
+    'movies_movie_fts_au': """
+        CREATE TRIGGER IF NOT EXISTS movies_movie_fts_au AFTER UPDATE OF name, description ON movies_movie BEGIN
+            INSERT INTO movies_movie_fts(movies_movie_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO movies_movie_fts(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END""",
+}
+
+_fts5_available = {}
+
+
+def fts5_available(connection=default_connection):
+    # We only probe the database once per connection alias; compile options do not change at runtime.
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _fts5_available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            enabled = bool(cursor.fetchone()[0])
+            if not enabled:
+                # Some builds ship FTS5 as a loadable default without the compile flag; try it directly.
+                try:
+                    cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+                    cursor.execute("DROP TABLE temp.fts5_probe")
+                    enabled = True
+                except Exception:
+                    enabled = False
+        _fts5_available[connection.alias] = enabled
+    return _fts5_available[connection.alias]
+
+
+def install(connection=default_connection):
+    """
+    Create the FTS table and its sync triggers if they are missing.
+
+    This is idempotent. It runs from the migration that introduces the index
+    and again after every migrate, because SQLite migrations that rebuild
+    movies_movie (for example when a column with a default is added) drop the
+    triggers attached to the old table. When anything had to be (re)created
+    the index is rebuilt from movies_movie so it cannot drift.
+    """
+    if not fts5_available(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND tbl_name = 'movies_movie')",
+            [FTS_TABLE],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in (FTS_TABLE, *_TRIGGERS) if name not in existing]
+        if not missing:
+            return False
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, description, content='movies_movie', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        for sql in _TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def uninstall(connection=default_connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in _TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def rebuild(connection=default_connection):
+    # Re-reads every row of movies_movie. Only needed after writes that bypassed the triggers (e.g. raw SQL with triggers disabled).
+    if not fts5_available(connection):
+        return False
+    install(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def build_match_query(search_term):
+    """
+    Turn free text typed by a user into a safe FTS5 MATCH expression.
+
+    Every word is quoted (so characters like '-' or ':' can never be parsed as
+    FTS5 operators) and gets a prefix star, which keeps the old behaviour of
+    "iron" finding "Iron Man". Words are ANDed together. Returns None when the
+    input contains no searchable words.
+    """
+    words = re.findall(r'\w+', search_term or '')
+    if not words:
+        return None
+    return ' '.join('"%s"*' % word for word in words)
+
+
+def _fallback_queryset(search_term):
+    from .models import Movie
+    return Movie.objects.filter(Q(name__icontains=search_term) | Q(description__icontains=search_term))
+
+
+def search_movies(search_term):
+    """
+    Return the movies matching search_term, best match first.
+
+    The result is a RawQuerySet on SQLite/FTS5 and a regular QuerySet on the
+    fallback path; both iterate as Movie instances in ranked order.
+    """
+    from .models import Movie
+
+    match = build_match_query(search_term)
+    if match is None:
+        return Movie.objects.none()
+
+    if not fts5_available():
+        return _fallback_queryset(search_term).order_by('name', 'id')
+
+    return Movie.objects.raw(
+        f"SELECT movies_movie.* FROM {FTS_TABLE} "
+        f"JOIN movies_movie ON movies_movie.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s "
+        f"ORDER BY bm25({FTS_TABLE}, %s, %s), movies_movie.id",
+        [match, NAME_WEIGHT, DESCRIPTION_WEIGHT],
+    )
+
+
+def search_movies_page(search_term, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return one KeysetPage of search results.
+
+    FTS5 results are paged on (bm25 score, id) so relevance order survives
+    pagination; every Movie in the page carries its score as movie.score.
+    The icontains fallback has no score and is paged on (name, id) like the
+    plain catalog listing.
+    """
+    from .models import Movie
+
+    match = build_match_query(search_term)
+    if match is None:
+        return build_page([], ('score', 'id'), page_size, False, False)
+
+    if not fts5_available():
+        return paginate_keyset(_fallback_queryset(search_term), ('name', 'id'), cursor, page_size)
+
+    values, direction = None, 'n'
+    if cursor:
+        try:
+            values, direction = decode_cursor(cursor)
+        except InvalidCursor:
+            values = None
+        if values is not None and (len(values) != 2 or not all(isinstance(v, (int, float)) for v in values)):
+            values, direction = None, 'n'
+    forward = direction == 'n'
+
+    # bm25() can only be evaluated by the query that runs MATCH, so the scored
+    # matches go in a subquery and the keyset condition is applied around it.
+    sql = (
+        f"SELECT * FROM (SELECT movies_movie.*, bm25({FTS_TABLE}, %s, %s) AS score "
+        f"FROM {FTS_TABLE} JOIN movies_movie ON movies_movie.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s)"
+    )
+    params = [NAME_WEIGHT, DESCRIPTION_WEIGHT, match]
+    op, order = ('>', 'ASC') if forward else ('<', 'DESC')
+    if values is not None:
+        sql += f" WHERE score {op} %s OR (score = %s AND id {op} %s)"
+        params += [values[0], values[0], values[1]]
+    sql += f" ORDER BY score {order}, id {order} LIMIT %s"
+    params.append(page_size + 1)
+
+    rows = list(Movie.objects.raw(sql, params))
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not forward:
+        rows.reverse()
+    return build_page(rows, ('score', 'id'), page_size,
+                      has_next=has_more if forward else values is not None,
+                      has_previous=values is not None if forward else has_more)
@@ -0,0 +1,34 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from movies import images
+
+"""
+We register a poster tag that renders a movie's poster as a <picture> element.
+
+For every format in movie.image_variants (AVIF first, then WebP) we add a <source> with a srcset listing each resized copy and its width, so the browser downloads the smallest file that still looks sharp at the displayed size (given by sizes). Browsers that support neither format, and movies without variants, fall back to the original image in the <img> tag.
+
+Usage: {% poster movie sizes="220px" alt="..." style="..." %}. Any extra keyword arguments become attributes of the <img> tag.
+"""
+register = template.Library()
+
+
+@register.simple_tag
+def poster(movie, sizes='100vw', lazy=True, **attrs):
+    if not movie.image:
+        return ''
+    variants = movie.image_variants or {}
+    storage = movie.image.storage
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((mime, srcset, sizes) for mime, srcset in images.srcsets(variants, storage)),
+    )
+    attrs.setdefault('alt', f'{movie.name} poster')
+    if variants.get('width'):
+        attrs.setdefault('width', variants['width'])
+        attrs.setdefault('height', variants['height'])
+    if lazy:
+        attrs.setdefault('loading', 'lazy')
+        attrs.setdefault('decoding', 'async')
+    img_attrs = format_html_join(' ', '{}="{}"', sorted(attrs.items()))
+    return format_html('<picture>{}<img src="{}" {}></picture>', sources, movie.image.url, img_attrs)
@@ -1,3 +1,657 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from PIL import Image as PILImage
+
+from cart import checkout, store
+from moviestore.pagination import encode_cursor
+from perf.testing import ViewBudgetTestCase
+
+from .models import Movie, Petition, PetitionVote, Review, TrendingEpoch
+from . import catalog, images, petitions, ratings, search, trending, views
+
+
+def make_movie(name, description='', price=10):
+    # ImageField only needs a name for these tests; no file is written by create(). Marking the
+    # variants as done keeps the poster pipeline from trying to read the missing file.
+    return Movie.objects.create(name=name, description=description, price=price,
+                                image='movie_images/test.jpg',
+                                image_variants={'source': 'movie_images/test.jpg', 'formats': {}})
+
+
+class MovieSearchTests(TestCase):
+    def setUp(self):
+        self.iron_man = make_movie('Iron Man', 'A billionaire builds a suit of armor.')
+        self.lion_king = make_movie('The Lion King', 'A young lion prince flees his kingdom.')
+        self.avatar = make_movie('Avatar', 'A marine on an alien world meets the lion-like Na\'vi.')
+
+    def test_match_query_quotes_user_input(self):
+        self.assertEqual(search.build_match_query('iron-man:'), '"iron"* "man"*')
+        self.assertIsNone(search.build_match_query('  !!! '))
+
+    def test_search_ranks_title_hits_first(self):
+        results = list(search.search_movies('lion'))
+        self.assertEqual(results[0], self.lion_king)
+        self.assertIn(self.avatar, results)
+        self.assertNotIn(self.iron_man, results)
+
+    def test_prefix_search_matches_partial_words(self):
+        self.assertEqual(list(search.search_movies('bill')), [self.iron_man])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.iron_man.name = 'Iron Giant'
+        self.iron_man.save()
+        self.assertEqual(list(search.search_movies('giant')), [self.iron_man])
+        self.lion_king.delete()
+        self.assertEqual(list(search.search_movies('kingdom')), [])
+
+    def test_index_view_uses_search(self):
+        response = self.client.get(reverse('movies.index'), {'search': 'armor'})
+        self.assertContains(response, 'Iron Man')
+        self.assertNotContains(response, 'The Lion King')
+
+
+class CatalogPaginationTests(TestCase):
+    def setUp(self):
+        # Two movies share a name so the id tie-breaker is exercised.
+        for name in ['Alpha', 'Bravo', 'Bravo', 'Charlie', 'Delta', 'Echo', 'Foxtrot']:
+            make_movie(name, 'A lion story.')
+
+    def walk(self, params):
+        ids, cursor, pages = [], None, []
+        while True:
+            query = dict(params, page_size=2)
+            if cursor:
+                query['cursor'] = cursor
+            page = self.client.get(reverse('movies.index'), query).context['template_data']['page']
+            ids.extend(movie.id for movie in page.items)
+            pages.append(page)
+            if not page.has_next:
+                return ids, pages
+            cursor = page.next_cursor
+
+    def test_browse_walks_every_movie_once_in_name_order(self):
+        ids, pages = self.walk({})
+        expected = list(Movie.objects.order_by('name', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(pages), 4)
+        self.assertFalse(pages[0].has_previous)
+
+    def test_previous_cursor_returns_the_earlier_page(self):
+        first = self.client.get(reverse('movies.index'), {'page_size': 3}).context['template_data']['page']
+        second = self.client.get(reverse('movies.index'), {'page_size': 3, 'cursor': first.next_cursor}).context['template_data']['page']
+        back = self.client.get(reverse('movies.index'), {'page_size': 3, 'cursor': second.previous_cursor}).context['template_data']['page']
+        self.assertEqual(back.items, first.items)
+
+    def test_search_results_are_paginated_without_duplicates(self):
+        ids, pages = self.walk({'search': 'lion'})
+        self.assertEqual(sorted(ids), sorted(Movie.objects.values_list('id', flat=True)))
+
+    def test_garbage_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('movies.index'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['template_data']['page'].items[0].name, 'Alpha')
+
+    def test_wrongly_typed_cursor_values_fall_back_to_first_page(self):
+        bad = [encode_cursor(['a', 'x'], 'n'), encode_cursor([{'x': 1}, [1]], 'n'), encode_cursor([None, 1], 'p'),
+               encode_cursor(['a'], 'n')]
+        for cursor in bad:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('movies.index'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['template_data']['page'].items[0].name, 'Alpha')
+                self.assertEqual(self.client.get(reverse('api.movies'), {'cursor': cursor}).status_code, 200)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.movie = make_movie('Rio', 'Birds.')
+        self.alice = User.objects.create_user('alice', password='pw-alice-123')
+        self.bob = User.objects.create_user('bob', password='pw-bob-123')
+
+    def review(self, user, rating):
+        self.client.force_login(user)
+        self.client.post(reverse('movies.create_review', args=[self.movie.id]),
+                         {'comment': 'Nice', 'rating': rating})
+
+    def test_create_edit_delete_keep_aggregates_in_sync(self):
+        self.review(self.alice, 5)
+        self.review(self.bob, 2)
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.review_count, self.movie.rating_sum), (2, 7))
+        self.assertEqual(self.movie.avg_rating, 3.5)
+
+        bob_review = Review.objects.get(user=self.bob)
+        self.client.post(reverse('movies.edit_review', args=[self.movie.id, bob_review.id]),
+                         {'comment': 'Better on rewatch', 'rating': 4})
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.rating_sum, self.movie.rating_2_count, self.movie.rating_4_count), (9, 0, 1))
+
+        self.client.get(reverse('movies.delete_review', args=[self.movie.id, bob_review.id]))
+        self.client.get(reverse('movies.delete_review', args=[self.movie.id, bob_review.id]))
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.review_count, self.movie.rating_sum, self.movie.rating_4_count), (1, 5, 0))
+
+        call_command('recompute_rating_aggregates', '--verify', stdout=StringIO())
+
+    def test_delete_subtracts_the_rating_stored_at_delete_time(self):
+        self.review(self.alice, 5)
+        review = Review.objects.get(user=self.alice)
+        lookup = views.get_object_or_404
+
+        def edited_meanwhile(*args, **kwargs):
+            found = lookup(*args, **kwargs)
+            # An edit to 2 stars commits between the lookup and the delete.
+            Review.objects.filter(pk=review.pk).update(rating=2)
+            ratings.change_rating(self.movie.id, 5, 2)
+            return found
+
+        with mock.patch.object(views, 'get_object_or_404', side_effect=edited_meanwhile):
+            self.client.get(reverse('movies.delete_review', args=[self.movie.id, review.id]))
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.review_count, self.movie.rating_sum, self.movie.rating_2_count,
+                          self.movie.rating_5_count), (0, 0, 0, 0))
+
+    def test_admin_form_cannot_write_the_aggregates(self):
+        self.review(self.alice, 4)
+        self.client.force_login(User.objects.create_superuser('admin'))
+        response = self.client.get(reverse('admin:movies_movie_change', args=[self.movie.id]))
+        for field in ratings.AGGREGATE_FIELDS:
+            self.assertNotContains(response, f'name="{field}"')
+
+    def test_admin_review_changes_keep_aggregates_in_sync(self):
+        self.review(self.alice, 4)
+        self.review(self.bob, 2)
+        self.client.force_login(User.objects.create_superuser('admin'))
+        review = Review.objects.get(user=self.alice)
+        self.client.post(reverse('admin:movies_review_change', args=[review.id]), {
+            'comment': review.comment, 'rating': 1, 'movie': self.movie.id, 'user': self.alice.id})
+        self.client.post(reverse('admin:movies_review_changelist'), {
+            'action': 'delete_selected', '_selected_action': [Review.objects.get(user=self.bob).id], 'post': 'yes'})
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.review_count, self.movie.rating_sum, self.movie.rating_1_count), (1, 1, 1))
+        call_command('recompute_rating_aggregates', '--verify', stdout=StringIO())
+
+    def test_recompute_command_repairs_drift(self):
+        self.review(self.alice, 3)
+        Movie.objects.filter(pk=self.movie.pk).update(review_count=9, rating_sum=1)
+        with self.assertRaises(CommandError):
+            call_command('recompute_rating_aggregates', '--verify', stdout=StringIO())
+        call_command('recompute_rating_aggregates', stdout=StringIO())
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.review_count, self.movie.rating_sum, self.movie.rating_3_count), (1, 3, 1))
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.rio = make_movie('Rio')
+        self.up = make_movie('Up')
+        self.start = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        TrendingEpoch.objects.update_or_create(pk=1, defaults={'epoch': self.start.timestamp()})
+        trending._epoch_seen = None
+
+    def score(self, movie, now):
+        movie.refresh_from_db()
+        return trending.decayed(movie.trending_score, TrendingEpoch.objects.get().epoch, now)
+
+    def test_scores_decay_by_half_every_half_life(self):
+        half_life = timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+        trending.record_purchase([self.rio.id, self.up.id], now=self.start)
+        trending.record_review(self.up.id, now=self.start + half_life)
+        self.assertAlmostEqual(self.score(self.rio, self.start), 1.0)
+        self.assertAlmostEqual(self.score(self.rio, self.start + half_life), 0.5)
+        self.assertAlmostEqual(self.score(self.up, self.start + 2 * half_life), 0.25 + 0.5 / 2)
+
+        # A fresh purchase beats several old ones.
+        trending.record_purchase([self.up.id], now=self.start)
+        trending.record_purchase([self.up.id], now=self.start)
+        trending.record_purchase([self.rio.id], now=self.start + 3 * half_life)
+        self.assertEqual([m.name for m in trending.trending(now=self.start + 3 * half_life)], ['Rio', 'Up'])
+
+    def test_purchases_older_than_the_horizon_drop_out(self):
+        trending.record_purchase([self.rio.id], now=self.start)
+        trending.record_purchase([self.up.id], now=self.start + timedelta(seconds=trending.horizon() / 2))
+        past_horizon = self.start + timedelta(seconds=trending.horizon() + 60)
+        self.assertEqual([m.name for m in trending.trending(now=past_horizon)], ['Up'])
+        self.assertGreater(Movie.objects.get(id=self.rio.id).trending_score, 0)
+
+        # With nothing inside the horizon the home page falls back to the house picks.
+        with mock.patch.object(trending.timezone, 'now', return_value=past_horizon + timedelta(days=365)):
+            response = self.client.get(reverse('home.index'))
+        self.assertEqual(response.context['template_data']['trending'], [])
+
+    def test_lazy_rebase_keeps_scores(self):
+        trending.record_purchase([self.rio.id], now=self.start)
+        later = self.start + timedelta(seconds=trending.tau() * (trending.REBASE_AFTER + 1))
+        expected = self.score(self.rio, later) + 1.0
+        trending.record_purchase([self.rio.id], now=later)
+        self.assertEqual(TrendingEpoch.objects.get().epoch, later.timestamp())
+        self.assertAlmostEqual(self.score(self.rio, later), expected)
+
+    def test_checkout_and_reviews_bump_and_rebuild_agrees(self):
+        user = User.objects.create_user('fan', password='pw-fan-12345')
+        self.client.force_login(user)
+        self.client.post(reverse('movies.create_review', args=[self.up.id]), {'comment': 'Fun', 'rating': 5})
+        checkout.place_order(user, {self.rio.id: 3, self.up.id: 1})
+        bumped = {m.id: m.trending_score for m in Movie.objects.all()}
+        self.assertGreater(bumped[self.up.id], bumped[self.rio.id])
+
+        call_command('rebuild_trending', stdout=StringIO())
+        now = timezone.now()
+        self.assertAlmostEqual(self.score(self.rio, now), 1.0, places=3)
+        self.assertAlmostEqual(self.score(self.up, now), 1.5, places=3)
+        self.assertEqual([m.name for m in trending.trending(1)], ['Up'])
+
+
+class ReviewListTests(TestCase):
+    def setUp(self):
+        self.movie = make_movie('Avatar', 'Blue people.')
+        for i in range(25):
+            user = User.objects.create_user(f'user{i}')
+            Review.objects.create(movie=self.movie, user=user, comment=f'Review {i}', rating=4)
+
+    def test_first_page_is_bounded_and_loads_authors_in_one_query(self):
+        with self.assertNumQueries(3):
+            # One query for the movie, one for the first page of reviews joined with their authors,
+            # and one for the movie's precomputed "also bought" list.
+            response = self.client.get(reverse('movies.show', args=[self.movie.id]))
+        reviews = response.context['template_data']['reviews']
+        self.assertEqual(len(reviews), 10)
+        self.assertContains(response, 'Load more reviews')
+
+    def test_reviews_endpoint_pages_through_the_rest(self):
+        first = self.client.get(reverse('movies.show', args=[self.movie.id]))
+        cursor = first.context['template_data']['reviews_next_cursor']
+        comments = [r.comment for r in first.context['template_data']['reviews']]
+        while cursor:
+            data = self.client.get(reverse('movies.reviews', args=[self.movie.id]), {'cursor': cursor}).json()
+            comments.extend(r['comment'] for r in data['reviews'])
+            self.assertIn('Review by', data['html'])
+            cursor = data['next_cursor']
+        self.assertEqual(comments, [f'Review {i}' for i in range(25)])
+
+
+class PosterVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, POSTER_WIDTHS=(100, 200, 400)))
+
+    def upload(self, name='poster.png', size=(300, 450)):
+        buffer = BytesIO()
+        PILImage.new('RGB', size, (200, 30, 60)).save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_upload_generates_each_width_and_format(self):
+        movie = Movie.objects.create(name='Poster', description='', price=5, image=self.upload())
+        movie.refresh_from_db()
+        variants = movie.image_variants
+        self.assertEqual(variants['source'], movie.image.name)
+        self.assertEqual((variants['width'], variants['height']), (300, 450))
+        for fmt in images.available_formats():
+            # 400 would upscale, so the largest variant is the original width.
+            self.assertEqual(sorted(variants['formats'][fmt], key=int), ['100', '200', '300'])
+            with movie.image.storage.open(variants['formats'][fmt]['100']) as fh:
+                self.assertEqual(PILImage.open(fh).size, (100, 150))
+
+    def test_saving_without_a_new_image_does_not_regenerate(self):
+        movie = Movie.objects.create(name='Poster', description='', price=5, image=self.upload())
+        movie.refresh_from_db()
+        movie.price = 7
+        # The UPDATE and the cart's catalog version bump; no variants are read or written.
+        with self.assertNumQueries(2):
+            movie.save()
+
+    def test_poster_tag_renders_srcset_with_fallback(self):
+        movie = Movie.objects.create(name='Poster', description='', price=5, image=self.upload())
+        movie.refresh_from_db()
+        html = Template('{% load posters %}{% poster movie sizes="220px" %}').render(Context({'movie': movie}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(f'{movie.image_variants["formats"]["webp"]["100"]} 100w', html)
+        self.assertIn(f'src="{movie.image.url}"', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_backfill_command(self):
+        movie = Movie.objects.create(name='Poster', description='', price=5, image=self.upload())
+        Movie.objects.filter(pk=movie.pk).update(image_variants={})
+        call_command('generate_poster_variants', '--workers', '1', stdout=StringIO())
+        movie.refresh_from_db()
+        self.assertEqual(movie.image_variants['source'], movie.image.name)
+        self.assertTrue(movie.image_variants['formats'])
+
+
+class CatalogImportExportTests(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        media_root = os.path.join(self.workdir, 'media')
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.images = os.path.join(self.workdir, 'feed-images')
+        os.makedirs(self.images)
+        PILImage.new('RGB', (30, 45), (10, 20, 30)).save(os.path.join(self.images, 'rio.png'))
+
+    def feed(self, records, name='feed.jsonl'):
+        path = os.path.join(self.workdir, name)
+        with open(path, 'w') as fh:
+            fh.writelines(json.dumps(record) + '\n' for record in records)
+        return path
+
+    def load(self, path, *args):
+        out = StringIO()
+        call_command('import_catalog', path, '--images-dir', self.images, '--batch-size', 2, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_upserts_by_external_id(self):
+        output = self.load(self.feed([
+            {'external_id': 'rio', 'name': 'Rio', 'price': 12, 'image': 'rio.png'},
+            {'external_id': 'up', 'name': 'Up', 'price': '9', 'description': 'Balloons.'},
+            {'external_id': 'bad', 'name': 'Bad', 'price': 'free'},
+            {'name': 'No id', 'price': 1},
+            {'external_id': 'lost', 'name': 'Lost', 'price': 3, 'image': '../outside.png'},
+        ]))
+        self.assertIn('5 records: 3 movies created, 0 updated, 2 skipped; 1 posters stored, 1 could not be loaded', output)
+        rio = Movie.objects.get(external_id='rio')
+        self.assertRegex(rio.image.name, r'^movie_images/rio\.[0-9a-f]{12}\.png$')
+        rio.image_variants = {'source': rio.image.name, 'formats': {}}
+        Movie.objects.filter(pk=rio.pk).update(image_variants=rio.image_variants)
+
+        version = store.catalog_version()
+        self.load(self.feed([
+            {'external_id': 'rio', 'name': 'Rio 2', 'price': 14, 'image': 'rio.png'},
+            {'external_id': 'up', 'name': 'Up', 'price': 10},
+        ]))
+        self.assertEqual(Movie.objects.count(), 3)
+        # The one committed batch made every cart's price snapshot stale, in every process.
+        self.assertEqual(store.catalog_version(), version + 1)
+        rio.refresh_from_db()
+        self.assertEqual((rio.name, rio.price, rio.image_variants['source']), ('Rio 2', 14, rio.image.name))
+        self.assertEqual(Movie.objects.get(external_id='up').description, '')
+        self.assertEqual([m.name for m in search.search_movies('rio')], ['Rio 2'])
+
+    def test_resume_continues_after_the_last_committed_batch(self):
+        path = self.feed([{'external_id': f'm{n}', 'name': f'Movie {n}', 'price': n} for n in range(5)])
+        upsert = catalog._upsert
+        calls = []
+
+        def fail_second_batch(rows, posters):
+            calls.append(list(rows))
+            if len(calls) == 2:
+                raise RuntimeError('interrupted')
+            return upsert(rows, posters)
+
+        with mock.patch.object(catalog, '_upsert', fail_second_batch), self.assertRaises(RuntimeError):
+            self.load(path)
+        self.assertEqual(Movie.objects.count(), 2)
+        self.assertTrue(os.path.exists(path + '.checkpoint.json'))
+
+        output = self.load(path, '--resume')
+        self.assertIn('Resuming after 2 records', output)
+        self.assertIn('5 records: 5 movies created', output)
+        self.assertEqual(Movie.objects.count(), 5)
+        self.assertFalse(os.path.exists(path + '.checkpoint.json'))
+
+    def test_csv_export_imports_back(self):
+        self.load(self.feed([
+            {'external_id': 'rio', 'name': 'Rio, the "movie"', 'price': 12, 'description': 'Two\nlines', 'image': 'rio.png'},
+            {'external_id': 'up', 'name': 'Up', 'price': 9},
+        ]))
+        exported = os.path.join(self.workdir, 'export')
+        feed = os.path.join(exported, 'catalog.csv')
+        os.makedirs(exported)
+        call_command('export_catalog', feed, '--images-dir', exported, stdout=StringIO())
+        before = list(Movie.objects.order_by('external_id').values_list('external_id', 'name', 'price', 'description',
+                                                                          'image'))
+        Movie.objects.all().delete()
+
+        self.images = exported
+        self.load(feed)
+        after = list(Movie.objects.order_by('external_id').values_list('external_id', 'name', 'price', 'description',
+                                                                         'image'))
+        self.assertEqual(after, before)
+
+
+class PosterCachingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, POSTER_WIDTHS=(100,)))
+
+    def upload(self, name='poster.png', color=(10, 200, 90)):
+        buffer = BytesIO()
+        PILImage.new('RGB', (120, 180), color).save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_names_that_look_hashed_are_hashed_again(self):
+        first = Movie.objects.create(name='A', description='', price=5, image=self.upload('x.0123456789ab.png'))
+        second = Movie.objects.create(name='B', description='', price=5,
+                                      image=self.upload('x.0123456789ab.png', color=(200, 10, 90)))
+        self.assertRegex(first.image.name, r'^movie_images/x\.[0-9a-f]{12}\.png$')
+        self.assertNotIn('0123456789ab', first.image.name)
+        # Different bytes under the same claimed name are stored as a different file, not dropped.
+        self.assertNotEqual(first.image.name, second.image.name)
+        again = first.image.storage.save(first.image.name, self.upload())
+        self.assertEqual(again, first.image.name)
+
+    def test_uploads_get_content_hashed_names(self):
+        first = Movie.objects.create(name='A', description='', price=5, image=self.upload())
+        second = Movie.objects.create(name='B', description='', price=5, image=self.upload())
+        self.assertRegex(first.image.name, r'^movie_images/poster\.[0-9a-f]{12}\.png$')
+        # Identical bytes map to the same file instead of poster_XyZ123.png copies.
+        self.assertEqual(first.image.name, second.image.name)
+
+    def test_hashed_media_is_immutable_and_revalidates(self):
+        movie = Movie.objects.create(name='A', description='', price=5, image=self.upload())
+        response = self.client.get(movie.image.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(
+            self.client.get(movie.image.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_unhashed_media_gets_a_short_max_age(self):
+        with open(os.path.join(settings.MEDIA_ROOT, 'legacy.jpg'), 'wb') as fh:
+            fh.write(b'not really a jpeg')
+        response = self.client.get('/media/legacy.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn(f'max-age={settings.MEDIA_MUTABLE_MAX_AGE}', response['Cache-Control'])
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+
+class MovieViewBudgetTests(ViewBudgetTestCase):
+    def setUp(self):
+        self.movie = self.seeded.movies[0]
+        self.petition = self.seeded.petitions[0]
+
+    def test_catalog(self):
+        self.assertViewBudget('movies.index', 1, reverse('movies.index'), status=200)
+        self.assertViewBudget('movies.index[search]', 1, reverse('movies.index'), data={'search': 'lion'},
+                              status=200)
+
+    def test_movie_detail(self):
+        # The "also bought" list is one primary-key read plus one query for the movies in it.
+        self.assertViewBudget('movies.show', 4, reverse('movies.show', args=[self.movie.id]), status=200)
+        self.login()
+        self.assertViewBudget('movies.show[authenticated]', 7, reverse('movies.show', args=[self.movie.id]), status=200)
+
+    def test_reviews_page(self):
+        self.assertViewBudget('movies.reviews', 2, reverse('movies.reviews', args=[self.movie.id]), status=200)
+
+    def test_review_lifecycle(self):
+        user = User.objects.create_user('budget_reviewer')
+        self.client.force_login(user)
+        self.assertViewBudget('movies.create_review', 10, reverse('movies.create_review', args=[self.movie.id]),
+                              method='post', data={'comment': 'Great', 'rating': 4}, status=302)
+        review = Review.objects.get(user=user, movie=self.movie)
+        edit_url = reverse('movies.edit_review', args=[self.movie.id, review.id])
+        self.assertViewBudget('movies.edit_review[get]', 4, edit_url, status=200)
+        self.assertViewBudget('movies.edit_review[post]', 10, edit_url, method='post',
+                              data={'comment': 'Still great', 'rating': 5}, status=302)
+        self.assertViewBudget('movies.delete_review', 10, reverse('movies.delete_review', args=[self.movie.id, review.id]),
+                              status=302, repeats=1)
+
+    def test_petitions(self):
+        self.login()
+        self.assertViewBudget('movies.petition_list', 3, reverse('movies.petition_list'), status=200)
+        self.assertViewBudget('movies.petition_detail', 4, reverse('movies.petition_detail', args=[self.petition.id]),
+                              status=200)
+        self.assertViewBudget('movies.create_petition[get]', 2, reverse('movies.create_petition'), status=200)
+        self.assertViewBudget('movies.create_petition[post]', 6, reverse('movies.create_petition'), method='post',
+                              data={'title': 'Add Up', 'description': 'Balloons'}, status=302)
+        self.assertViewBudget('movies.vote_petition', 10, reverse('movies.vote_petition', args=[self.petition.id]),
+                              method='post', data={'vote': 'yes'}, status=302)
+
+    def test_regional_trends(self):
+        self.login()
+        self.assertViewBudget('movies.regional_trends', 3, reverse('movies.regional_trends'), status=200)
+        # The map data is one clustering query plus one for the winning movies, however many regions there are.
+        self.assertViewBudget('movies.regional_trends_clusters', 4, reverse('movies.regional_trends_clusters'),
+                              data={'bbox': '-180,-85,180,85', 'zoom': 3}, status=200)
+
+
+class PetitionVoteCounterTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.petition = Petition.objects.create(title='Add Up', created_by=self.owner)
+
+    def vote(self, user, value):
+        self.client.force_login(user)
+        self.client.post(reverse('movies.vote_petition', args=[self.petition.id]), {'vote': value})
+        return self.counts(self.petition)
+
+    def counts(self, petition):
+        petition.refresh_from_db()
+        return petition.yes_count, petition.no_count
+
+    def test_votes_and_flips_adjust_counters(self):
+        voter = User.objects.create_user('voter')
+        self.assertEqual(self.vote(self.owner, 'yes'), (1, 0))
+        self.assertEqual(self.vote(voter, 'yes'), (2, 0))
+        self.assertEqual(self.vote(voter, 'no'), (1, 1))
+        self.assertEqual(self.vote(voter, 'no'), (1, 1))
+        self.assertEqual(self.vote(voter, 'maybe'), (1, 1))
+
+    def test_list_and_detail_show_tallies(self):
+        self.vote(self.owner, 'no')
+        response = self.client.get(reverse('movies.petition_list'))
+        self.assertContains(response, '1 No')
+        response = self.client.get(reverse('movies.petition_detail', args=[self.petition.id]))
+        self.assertEqual((response.context['votes_yes'], response.context['votes_no']), (0, 1))
+        self.assertEqual(response.context['user_vote'], 'no')
+
+    def test_admin_form_cannot_write_the_counters(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        response = self.client.get(reverse('admin:movies_petition_change', args=[self.petition.id]))
+        for field in petitions.COUNTER_FIELDS:
+            self.assertNotContains(response, f'name="{field}"')
+
+    def test_admin_vote_changes_keep_counters_in_sync(self):
+        voter = User.objects.create_user('voter')
+        other = Petition.objects.create(title='Add Rio', created_by=self.owner)
+        self.vote(voter, 'yes')
+        self.client.force_login(User.objects.create_superuser('admin'))
+        self.client.post(reverse('admin:movies_petitionvote_add'), {
+            'petition': self.petition.id, 'user': self.owner.id, 'vote': 'no'})
+        self.assertEqual(self.counts(self.petition), (1, 1))
+
+        vote = PetitionVote.objects.get(user=voter)
+        self.client.post(reverse('admin:movies_petitionvote_change', args=[vote.id]), {
+            'petition': self.petition.id, 'user': voter.id, 'vote': 'no'})
+        self.assertEqual(self.counts(self.petition), (0, 2))
+        self.client.post(reverse('admin:movies_petitionvote_change', args=[vote.id]), {
+            'petition': other.id, 'user': voter.id, 'vote': 'yes'})
+        self.assertEqual((self.counts(self.petition), self.counts(other)), ((0, 1), (1, 0)))
+
+        self.client.post(reverse('admin:movies_petitionvote_changelist'), {
+            'action': 'delete_selected', '_selected_action': list(PetitionVote.objects.values_list('id', flat=True)),
+            'post': 'yes'})
+        self.assertEqual((self.counts(self.petition), self.counts(other)), ((0, 0), (0, 0)))
+        call_command('recompute_petition_counts', '--verify', stdout=StringIO())
+
+    def test_recompute_command_repairs_drift(self):
+        self.vote(self.owner, 'yes')
+        Petition.objects.filter(pk=self.petition.pk).update(yes_count=7, no_count=3)
+        with self.assertRaises(CommandError):
+            call_command('recompute_petition_counts', '--verify', stdout=StringIO())
+        call_command('recompute_petition_counts', stdout=StringIO())
+        self.assertEqual(self.counts(self.petition), (1, 0))
+
+
+class CatalogApiTests(ViewBudgetTestCase):
+    seed_options = {'movies': 30, 'users': 5, 'reviews_per_movie': 3, 'orders': 0, 'petitions': 0}
+
+    def setUp(self):
+        self.movie = self.seeded.movies[0]
+
+    def test_budgets(self):
+        self.assertViewBudget('api.movies', 2, reverse('api.movies'), status=200)
+        ids = ','.join(str(m.id) for m in self.seeded.movies[:20])
+        self.assertViewBudget('api.movies_bulk', 2, reverse('api.movies_bulk'), data={'ids': ids}, status=200)
+        self.assertViewBudget('api.movie', 1, reverse('api.movie', args=[self.movie.id]), status=200)
+        self.assertViewBudget('api.movie_reviews', 3, reverse('api.movie_reviews', args=[self.movie.id]), status=200)
+        self.assertViewBudget('api.movie_aggregates', 1, reverse('api.movie_aggregates', args=[self.movie.id]),
+                              status=200)
+
+    def test_catalog_pages_and_field_selection(self):
+        url = reverse('api.movies')
+        first = self.client.get(url, {'page_size': 20, 'fields': 'id,name'}).json()
+        self.assertEqual(set(first['results'][0]), {'id', 'name'})
+        second = self.client.get(url, {'page_size': 20, 'fields': 'id,name', 'cursor': first['next_cursor']}).json()
+        names = [m['name'] for m in first['results'] + second['results']]
+        self.assertEqual(names, sorted(m.name for m in self.seeded.movies))
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(self.client.get(url, {'fields': 'id,password'}).status_code, 400)
+
+    def test_bulk_fetch_keeps_request_order_and_reports_missing(self):
+        a, b = self.seeded.movies[3], self.seeded.movies[1]
+        data = self.client.get(reverse('api.movies_bulk'), {'ids': f'{a.id},999999,{b.id}', 'fields': 'id'}).json()
+        self.assertEqual(data, {'results': [{'id': a.id}, {'id': b.id}], 'missing': [999999]})
+        self.assertEqual(self.client.get(reverse('api.movies_bulk'), {'ids': 'x'}).status_code, 400)
+
+    def test_unchanged_resources_answer_304(self):
+        url = reverse('api.movie', args=[self.movie.id])
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((cached.status_code, cached.content), (304, b''))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_collections_revalidate_by_etag_only(self):
+        url = reverse('api.movie_reviews', args=[self.movie.id])
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        # Deleting a review leaves Max(updated_at) where it was; the copy must still count as stale.
+        Review.objects.filter(movie=self.movie).order_by('-updated_at').last().delete()
+        since = http_date(time.time() + 60)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertNotIn('Last-Modified', self.client.get(reverse('api.movies')))
+
+    def test_new_reviews_invalidate_movie_and_review_etags(self):
+        urls = [reverse(name, args=[self.movie.id]) for name in ('api.movie_aggregates', 'api.movie_reviews')]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.client.force_login(User.objects.create_user('late-reviewer', password='x'))
+        self.client.post(reverse('movies.create_review', args=[self.movie.id]), {'comment': 'Great', 'rating': '5'})
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+        aggregates = self.client.get(urls[0]).json()
+        self.assertEqual(aggregates['review_count'], self.movie.review_count + 1)
 
-# Create your tests here.
@@ -0,0 +1,167 @@
+"""
+"Trending now": an exponentially time-decayed popularity score per movie.
+
+A movie's trending score is the sum of its events (purchases, reviews), each
+weighted by exp(-age / tau), where tau = TRENDING_HALF_LIFE_HOURS / ln 2, so
+an event counts half as much after every half-life. Decaying every score on
+every tick would mean rewriting the whole catalog; instead Movie.trending_score
+stores the scores scaled by exp((now - epoch) / tau) against one global epoch
+(TrendingEpoch):
+
+    stored = sum(weight * exp((event_time - epoch) / tau))
+    actual = stored * exp(-(now - epoch) / tau)
+
+The factor exp(-(now - epoch) / tau) is the same for every movie, so ordering
+by the stored value is ordering by the decayed score, and "top 20 trending"
+is an ORDER BY ... LIMIT on an index instead of an aggregation over orders
+and reviews.
+
+* bump() is called by checkout and by create_review. It is one UPDATE for all
+  the movies of an event; the epoch is read by a subquery in that statement,
+  so a bump is never weighted against a stale epoch.
+* Stored values grow with exp((now - epoch) / tau). Before that can lose
+  precision, the next bump rebases lazily: one UPDATE multiplies every score
+  by exp(-(now - epoch) / tau) and moves the epoch to now. That happens about
+  once every REBASE_AFTER * tau (months with the default half-life).
+* rebuild() recomputes every score from the orders and reviews, for data that
+  was imported behind checkout's back (`manage.py rebuild_trending`).
+"""
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Subquery, Value
+from django.db.models.functions import Coalesce, Exp
+from django.utils import timezone
+
+from .models import Movie, Review, TrendingEpoch
+
+PURCHASE_WEIGHT = 1.0
+REVIEW_WEIGHT = 0.5
+# Rebase once the growth factor exp((now - epoch) / tau) reaches e^32 (about 8e13).
+REBASE_AFTER = 32.0
+# Events older than this many half-lives add less than 2^-40 of a fresh one; rebuild() skips them.
+HORIZON_HALF_LIVES = 40
+
+# The epoch as last seen by this process. It is only used to decide when to rebase; _maybe_rebase() re-reads it.
+_epoch_seen = None
+
+
+def tau():
+    """The decay time constant in seconds."""
+    return settings.TRENDING_HALF_LIFE_HOURS * 3600 / math.log(2)
+
+
+def _timestamp(now):
+    return (now or timezone.now()).timestamp()
+
+
+def decayed(stored, epoch, now=None):
+    """The actual score at now of a stored (epoch-scaled) trending score."""
+    return stored * math.exp(-(_timestamp(now) - epoch) / tau())
+
+
+def _epoch(now):
+    # The stored epoch as an SQL expression (a scalar subquery), or now while there is none yet.
+    return Coalesce(Subquery(TrendingEpoch.objects.filter(pk=1).values('epoch')[:1]), Value(now),
+                    output_field=FloatField())
+
+
+def horizon():
+    """Seconds after which an event no longer counts: HORIZON_HALF_LIVES half-lives."""
+    return HORIZON_HALF_LIVES * settings.TRENDING_HALF_LIFE_HOURS * 3600
+
+
+def bump(movie_ids, weight, now=None):
+    """Add an event of weight, happening at now, to each of movie_ids, in one UPDATE."""
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return
+    now = _timestamp(now)
+    Movie.objects.filter(id__in=movie_ids).update(
+        trending_score=F('trending_score') + Value(weight) * Exp((Value(now) - _epoch(now)) / Value(tau())))
+    if _epoch_seen is None or (now - _epoch_seen) / tau() > REBASE_AFTER:
+        _maybe_rebase(now)
+
+
+def _maybe_rebase(now):
+    # Reached on the first bump in a process (one read of the epoch) and when the epoch looks old enough to
+    # rebase; another process may have rebased already, so that is decided again under the row lock.
+    global _epoch_seen
+    epoch = TrendingEpoch.objects.filter(pk=1).values_list('epoch', flat=True).first()
+    if epoch is None or (now - epoch) / tau() > REBASE_AFTER:
+        with transaction.atomic():
+            epoch = TrendingEpoch.objects.select_for_update().filter(pk=1).values_list('epoch', flat=True).first()
+            if epoch is None:
+                TrendingEpoch.objects.create(pk=1, epoch=now)
+                epoch = now
+            elif (now - epoch) / tau() > REBASE_AFTER:
+                rebase(now, epoch)
+                epoch = now
+    _epoch_seen = epoch
+
+
+def rebase(now, epoch):
+    """Move the epoch from epoch to now, rescaling every stored score so the decayed scores do not change."""
+    global _epoch_seen
+    factor = math.exp(-(now - epoch) / tau())
+    with transaction.atomic():
+        Movie.objects.filter(trending_score__gt=0).update(trending_score=F('trending_score') * factor)
+        TrendingEpoch.objects.update_or_create(pk=1, defaults={'epoch': now})
+    _epoch_seen = now
+
+
+def record_purchase(movie_ids, now=None):
+    """An order with movie_ids was placed; each movie counts once however many copies were bought."""
+    bump(movie_ids, PURCHASE_WEIGHT, now)
+
+
+def record_review(movie_id, now=None):
+    """A review of movie_id was written."""
+    bump([movie_id], REVIEW_WEIGHT, now)
+
+
+def trending(count=None, now=None):
+    """
+    The count movies with the highest trending score, best first: one read of the trending index.
+
+    Scores decay but never reach zero, so a movie only counts while its
+    score is at least that of one purchase made horizon() ago, the same
+    cut-off rebuild() uses; with nothing that recent the list is empty.
+    """
+    now = _timestamp(now)
+    floor = Exp((Value(now - horizon()) - _epoch(now)) / Value(tau()))
+    return list(
+        Movie.objects.filter(trending_score__gte=floor)
+        .order_by('-trending_score', 'id')
+        .only('id', 'name', 'image', 'image_variants', 'price')[:count or settings.TRENDING_COUNT]
+    )
+
+
+def rebuild(now=None, batch_size=2000):
+    """Recompute every movie's trending score from the orders and reviews, against a fresh epoch at now."""
+    from cart.models import Item
+
+    global _epoch_seen
+    now = now or timezone.now()
+    epoch, scale = now.timestamp(), tau()
+    since = now - timedelta(seconds=horizon())
+    scores = {}
+    events = [
+        # An order counts once per movie, however many line items or copies it has.
+        (PURCHASE_WEIGHT, Item.objects.filter(order__date__gte=since)
+         .values_list('movie_id', 'order__date', 'order_id').distinct()),
+        (REVIEW_WEIGHT, Review.objects.filter(date__gte=since).values_list('movie_id', 'date', 'id')),
+    ]
+    for weight, rows in events:
+        for movie_id, when, _ in rows.iterator(chunk_size=batch_size):
+            scores[movie_id] = scores.get(movie_id, 0.0) + weight * math.exp((when.timestamp() - epoch) / scale)
+
+    with transaction.atomic():
+        Movie.objects.exclude(trending_score=0).update(trending_score=0)
+        movies = [Movie(id=movie_id, trending_score=score) for movie_id, score in scores.items()]
+        Movie.objects.bulk_update(movies, ['trending_score'], batch_size=batch_size)
+        TrendingEpoch.objects.update_or_create(pk=1, defaults={'epoch': epoch})
+    _epoch_seen = epoch
+    return len(scores)
@@ -4,6 +4,7 @@ urlpatterns = [
     path('', views.index, name='movies.index'),
     #Notice the int:id is now the path, this is cause of the dynamic changing between the different movies
     path('<int:id>/', views.show, name='movies.show'),
+    path('<int:id>/reviews/', views.reviews, name='movies.reviews'),
     path('<int:id>/review/create/', views.create_review, name='movies.create_review'),
     path('<int:id>/review/<int:review_id>/edit/', views.edit_review, name='movies.edit_review'),
     path('<int:id>/review/<int:review_id>/delete/', views.delete_review, name='movies.delete_review'),
@@ -14,4 +15,5 @@ urlpatterns = [
 
     # Route for displaying aggregated regional purchase data on a map
     path("regional-trends/", views.regional_trends, name="movies.regional_trends"),
+    path("regional-trends/clusters/", views.regional_trends_clusters, name="movies.regional_trends_clusters"),
 ]
\ No newline at end of file
@@ -1,46 +1,65 @@
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
 from .models import Movie, Review, Petition, PetitionVote
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.conf import settings
-from django.db.models import Avg
+from django.db import transaction
+from . import petitions, ratings, trending
+from .search import search_movies_page
+from moviestore.pagination import paginate_keyset, parse_page_size
+from recommendations import copurchase
+from django.http import JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+
+# Reviews are listed oldest first; id breaks ties between reviews posted in the same instant.
+REVIEW_ORDERING = ('date', 'id')
 """Now, it will retrieve all movies if the search parameter is not sent in the current request, or it will retrieve specific movies based on the search parameter. Let’s explain the previous code."""
 def index(request):
     #We retrieve the value of the search parameter by using the request.GET.get('search') method and assign that value to the search_term variable. Here, we capture the search input value submitted through the form defined in the previous section.
     search_term = request.GET.get('search')
 
-    #f search_term is not empty, we filter movies where the name contains search_term. The __icontains lookup is used for a case-insensitive containment search.
+    #The catalog is served one page at a time. The cursor parameter marks where the previous page stopped, and page_size can be overridden per request (bounded by MAX_PAGE_SIZE).
+    cursor = request.GET.get('cursor')
+    page_size = parse_page_size(request.GET.get('page_size'), settings.MOVIES_PAGE_SIZE)
+
+    #If search_term is not empty, we ask the full-text index (see movies/search.py) for movies whose name or description match it, best match first. This replaces the old name__icontains filter, which had to scan every row.
     if search_term:
-        movies = Movie.objects.filter(name__icontains=search_term)
+        page = search_movies_page(search_term, cursor, page_size)
     else:
-        #If search_term is empty, we retrieve all movies from the database without applying any filters.
-        movies = Movie.objects.all()
+        #If search_term is empty, we list the whole catalog ordered by name, seeking straight to the requested page with the (name, id) index.
+        page = paginate_keyset(Movie.objects.all(), ('name', 'id'), cursor, page_size)
     template_data = {}
     template_data['title'] = 'Movies'
-    
-
-    # We collect all movies from the database by using the Movie.objects.all() method. Movie.objects is a manager in Django that serves as the default interface to query the database table associated with the model. It provides various methods to perform database operations such as creating, updating, deleting, and retrieving objects. The all() method fetches all objects from the database table represented by the model. Remember that we previously collected the movie information by using the movies variable; now, we use the Movie Django model.
-    template_data['movies'] = movies
+    template_data['movies'] = page.items
+    template_data['page'] = page
+    template_data['search_term'] = search_term or ''
 
-    
     return render(request, 'movies/index.html',
                   {'template_data': template_data})
 
 def show(request, id):
     # We use the Movie.objects.get(id=id) method to retrieve a specific movie BASED ON ITS ID. Remember that id is passed by the URL and received as a parameter in the show function.
     movie = Movie.objects.get(id=id)
-    reviews = Review.objects.filter(movie=movie)
+    # Only the first page of reviews is rendered here; the rest are fetched on demand from the reviews view below. select_related('user') loads each author in the same query instead of one query per review.
+    reviews_page = paginate_keyset(
+        Review.objects.filter(movie=movie).select_related('user'),
+        REVIEW_ORDERING, page_size=settings.REVIEWS_PAGE_SIZE)
     template_data = {}
 
-    # ✅ Calculate the average rating (using Django ORM aggregation)
-    avg_rating = reviews.aggregate(Avg('rating'))['rating__avg']
-    avg_rating = round(avg_rating, 1) if avg_rating else 0  # round to one decimal
+    # ✅ The average rating and star distribution come from the aggregate columns kept on Movie, so no query over the reviews is needed.
+    avg_rating = movie.avg_rating
 
     # We now access movie.name as an OBJECT ATTRIBUTE. Previously, we accessed the name as a key (movie['name']), since the dummy data variable stored dictionaries.
     template_data['title'] = movie.name
     template_data['movie'] = movie
-    template_data['reviews'] = reviews
+    template_data['reviews'] = reviews_page.items
+    template_data['reviews_next_cursor'] = reviews_page.next_cursor
     template_data['avg_rating']= avg_rating  # ✅ pass to template
+    template_data['rating_histogram'] = movie.rating_histogram
+    # "Customers who bought this also bought" is precomputed per movie from past orders, so it costs two small indexed reads.
+    template_data['also_bought'] = copurchase.also_bought(movie.id)
     user_review = None
     if request.user.is_authenticated:
         user_review = Review.objects.filter(user=request.user, movie=movie).first()
@@ -49,6 +68,27 @@ def show(request, id):
     return render(request, 'movies/show.html',
                   {'template_data': template_data})
 
+def reviews(request, id):
+    # Returns the next page of a movie's reviews for the "Load more reviews" button on the detail page. The response carries both the rendered list items (html) and the raw review data, plus the cursor for the page after this one.
+    movie = get_object_or_404(Movie, id=id)
+    page = paginate_keyset(
+        Review.objects.filter(movie=movie).select_related('user'),
+        REVIEW_ORDERING, request.GET.get('cursor'),
+        parse_page_size(request.GET.get('page_size'), settings.REVIEWS_PAGE_SIZE))
+    html = render_to_string('movies/review_items.html',
+                            {'reviews': page.items, 'movie': movie}, request=request)
+    return JsonResponse({
+        'html': html,
+        'reviews': [{
+            'id': review.id,
+            'user': review.user.username,
+            'rating': review.rating,
+            'comment': review.comment,
+            'date': review.date.isoformat(),
+        } for review in page.items],
+        'next_cursor': page.next_cursor,
+    })
+
  #We import login_required, which is used to verify that only logged users can access the create_review function. If a guest user attempts to access this function via the corresponding URL, they will be redirected to the login page.
 @login_required
 def create_review(request, id):
@@ -86,7 +126,12 @@ def create_review(request, id):
         except (TypeError, ValueError):
             rating = 1
         review.rating = rating
-        review.save()
+        # The review and the movie's rating aggregates are written in one transaction so they can never disagree.
+        # A new review also bumps the movie's trending score.
+        with transaction.atomic():
+            review.save()
+            ratings.record_rating(movie.id, rating)
+            trending.record_review(movie.id)
         return redirect('movies.show', id=id)
     else:
         return redirect('movies.show', id=id)
@@ -108,8 +153,6 @@ def edit_review(request, id, review_id):
             {'template_data': template_data})
     #If the request method is POST and the comment field in the request’s POST data is not empty, the function proceeds to update the review and redirects the user to the movie show page.
     elif request.method == 'POST' and request.POST['comment'] != '':
-        review = Review.objects.get(id=review_id)
-        review.comment = request.POST['comment']
         # Retrieve and validate rating
         rating_str = request.POST.get('rating')
         try:
@@ -118,8 +161,14 @@ def edit_review(request, id, review_id):
                 rating = 1
         except (TypeError, ValueError):
             rating = 1
-        review.rating = rating
-        review.save()
+        with transaction.atomic():
+            # We re-read the review under a row lock so the old rating we subtract from the aggregates is the one actually stored.
+            review = Review.objects.select_for_update().get(id=review_id)
+            old_rating = review.rating
+            review.comment = request.POST['comment']
+            review.rating = rating
+            review.save()
+            ratings.change_rating(review.movie_id, old_rating, rating)
         return redirect('movies.show', id=id)
     else:
         return redirect('movies.show', id=id)
@@ -128,14 +177,19 @@ def edit_review(request, id, review_id):
 
 @login_required
 def delete_review(request, id, review_id):
-    review = get_object_or_404(Review, id=review_id,
-        user=request.user)
-    review.delete()
+    get_object_or_404(Review, id=review_id, user=request.user)
+    with transaction.atomic():
+        # We re-read the review under a row lock, as edit_review does, so the rating we subtract is the one stored now and not one an edit has since replaced.
+        review = Review.objects.select_for_update().filter(pk=review_id, user=request.user).first()
+        # Only adjust the aggregates if this request actually removed the row (a double-submitted delete removes nothing the second time).
+        if review is not None and Review.objects.filter(pk=review.pk).delete()[0]:
+            ratings.remove_rating(review.movie_id, review.rating)
     return redirect('movies.show', id=id)
 
 
 @login_required
 def petition_list(request):
+    # Tallies are plain columns on Petition, so showing them on the list costs no extra queries.
     petitions = Petition.objects.all()
     return render(request, "movies/petition_list.html", {"petitions": petitions})
 
@@ -157,33 +211,31 @@ def vote_petition(request, petition_id):
     petition = get_object_or_404(Petition, id=petition_id)
     if request.method == "POST":
         vote_value = request.POST.get("vote")  # should be "yes" or "no"
-        if vote_value in ("yes", "no"):
-            vote, created = PetitionVote.objects.update_or_create(
-                petition=petition,
-                user=request.user,
-                defaults={"vote": vote_value}
-            )
+        if vote_value in petitions.VOTE_COUNTERS:
+            outcome = petitions.record_vote(petition.id, request.user, vote_value)
             # Show a friendly confirmation once after voting
-            if created:
-                  messages.success(request, f"You voted {vote_value.capitalize()}!")
+            if outcome == "created":
+                messages.success(request, f"You voted {vote_value.capitalize()}!")
             else:
                 messages.success(request, f"Your vote has been updated to {vote_value.capitalize()}!")
     # Redirect back to the petition detail so counts/buttons update
     return redirect("movies.petition_detail", id=petition.id)
 def petition_detail(request, id):
     # Fetch the petition by ID or return 404 if not found
-    petition = get_object_or_404(Petition, id=id)
+    petition = get_object_or_404(Petition.objects.select_related("created_by"), id=id)
 
-    # Aggregate current vote counts
-    votes_yes = petition.votes.filter(vote="yes").count()
-    votes_no = petition.votes.filter(vote="no").count()
+    # Current vote counts are stored on the petition itself
+    votes_yes = petition.yes_count
+    votes_no = petition.no_count
 
     # Determine whether the current user has already voted (and what they chose)
     user_vote = None
     if request.user.is_authenticated:
-        existing_vote = petition.votes.filter(user=request.user).first()
-        if existing_vote:
-            user_vote = existing_vote.vote  # "yes" or "no"
+        user_vote = (
+            PetitionVote.objects.filter(petition=petition, user=request.user)
+            .values_list("vote", flat=True)
+            .first()
+        )  # "yes", "no" or None
 
     context = {
         "petition": petition,
@@ -193,70 +245,66 @@ def petition_detail(request, id):
     }
     return render(request, "movies/petition_detail.html", context)
 
+def _trends_window(request):
+    from cart import rollups
+
+    # Only the advertised windows are accepted; anything else means all time.
+    try:
+        days = int(request.GET.get('days', ''))
+    except ValueError:
+        days = None
+    return days if days in rollups.WINDOWS else None
+
+
 @login_required
 def regional_trends(request):
     """
     Display a map showing trending movies by region (city/state).
 
-    This view aggregates all purchased items (linked to orders) and groups them
-    by region (based on the Order's city/state fields). The result shows which
-    movies are most popular in each region. Each marker on the map represents
-    a movie’s popularity in that area.
+    The page itself carries no map data. As the map is panned and zoomed,
+    the browser fetches movies.regional_trends_clusters for the visible
+    area, which returns the purchases clustered on the server (see
+    cart/clusters.py), so the page stays small however many orders there
+    are. The optional ?days=7|30|90 parameter limits the map to recent
+    purchases.
     """
+    from cart import rollups
+    from cart.models import RegionalPopularity
 
-    # Import Item model from cart to access movie and order location data
-    from cart.models import Item
-
-    # Retrieve all items where the associated order has valid coordinates
-    # This ensures we only plot purchases that include geographic data.
-    items_with_location = Item.objects.filter(
-        order__latitude__isnull=False,
-        order__longitude__isnull=False
-    )
-
-    # Group by region (city/state) and movie title, counting total purchases
-    # per combination using annotate(Count(...)).
-    from django.db.models import Count
-    regional_data = (
-        items_with_location
-        .values(
-            'order__city',
-            'order__state',
-            'movie__name',
-            'movie__image',
-            'order__latitude',
-            'order__longitude',
-        )
-        .annotate(total_purchases=Count('id'))
-        .order_by('-total_purchases')
-    )
-
-    # Prepare structured data for the frontend map
-    map_data = []
-    for entry in regional_data:
-        #  Step 1: Get relative image path from the Movie model
-        image_path = entry.get("movie__image")
-
-        # Step 2: Build a full accessible URL
-        # Example: "/media/movie_images/ironman.jpg"
-        # Use settings.MEDIA_URL (which should equal '/media/')
-        full_image_url = (
-            settings.MEDIA_URL + image_path
-            if image_path
-            else None)
-        map_data.append({
-            "city": entry.get("order__city"),
-            "state": entry.get("order__state"),
-            "movie_title": entry.get("movie__name"),
-            "latitude": entry.get("order__latitude"),
-            "longitude": entry.get("order__longitude"),
-            "total_purchases": entry.get("total_purchases"),
-            "poster_url": full_image_url,  # ✅ pass the image URL
-        })
-
-    # Render the “Regional Trends” page with the prepared map data
+    days = _trends_window(request)
+
+    # Render the “Regional Trends” page; the markers are loaded by the map script
     return render(request, "movies/regional_trends.html", {
         "title": "Local Popularity Map",
-        "map_data": map_data,
+        "has_data": RegionalPopularity.objects.filter(latitude__isnull=False).exists(),
         "MAPS_JS_API_KEY": settings.MAPS_JS_API_KEY,
-    })
\ No newline at end of file
+        "days": days,
+        "windows": rollups.WINDOWS,
+    })
+
+
+@login_required
+def regional_trends_clusters(request):
+    """
+    GeoJSON FeatureCollection of purchase clusters inside a map viewport.
+
+    Takes ?bbox=west,south,east,north, ?zoom= and the same optional ?days=
+    as the page. Each feature is one cluster with its purchase count and top
+    movies. The response is streamed feature by feature as the clustered
+    rows come out of the database.
+    """
+    from cart import clusters
+
+    try:
+        bbox = clusters.parse_bbox(request.GET.get('bbox'))
+        zoom = clusters.parse_zoom(request.GET.get('zoom'))
+    except clusters.InvalidViewport as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    def features():
+        yield '{"type":"FeatureCollection","features":['
+        for index, cluster in enumerate(clusters.clusters(bbox, zoom, _trends_window(request))):
+            yield (',' if index else '') + json.dumps(clusters.as_feature(cluster), separators=(',', ':'))
+        yield ']}'
+
+    return StreamingHttpResponse(features(), content_type='application/geo+json')
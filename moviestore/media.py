@@ -0,0 +1,77 @@
+"""
+Serving uploaded media and collected static files with caching headers.
+
+Files with a content hash in their name (see moviestore/storage.py) never
+change, so they are sent with
+
+    Cache-Control: public, max-age=31536000, immutable
+
+and a browser that has them will not even ask again. Files without a hash
+(posters uploaded before hashing was introduced) get a short max-age.
+Every response carries an ETag and Last-Modified, so a revalidation with
+If-None-Match / If-Modified-Since is answered with an empty 304.
+
+In production a front-end web server can serve MEDIA_ROOT and STATIC_ROOT
+directly with the same headers; these views make the app correct without one.
+"""
+import mimetypes
+import os
+import posixpath
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .storage import is_hashed
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def file_etag(path, stat):
+    # Hashed names are their own validator; otherwise size and mtime change whenever the file does.
+    name = os.path.basename(path)
+    if is_hashed(name):
+        return f'"{name.rsplit(".", 2)[-2]}"'
+    return f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def serve_file(request, path, document_root):
+    """Return a FileResponse (or 304) for path under document_root with cache headers."""
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = Path(safe_join(document_root, path))
+    except SuspiciousFileOperation:
+        raise Http404('Not found.')
+    if not fullpath.is_file():
+        raise Http404('Not found.')
+
+    stat = fullpath.stat()
+    etag = file_etag(path, stat)
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(str(fullpath))
+        response = FileResponse(fullpath.open('rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    response.headers['ETag'] = etag
+    if is_hashed(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_MUTABLE_MAX_AGE)
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    return serve_file(request, path, settings.MEDIA_ROOT)
+
+
+@require_safe
+def serve_static(request, path):
+    return serve_file(request, path, settings.STATIC_ROOT)
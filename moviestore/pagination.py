@@ -0,0 +1,186 @@
+"""
+Keyset (a.k.a. cursor or "seek") pagination shared by the apps.
+
+Offset pagination (LIMIT n OFFSET k) makes the database walk and throw away k
+rows, so page 5000 costs 5000 times more than page 1. Keyset pagination
+instead remembers the sort key of the last row it returned and asks for the
+rows that sort after it: WHERE (name, id) > (last_name, last_id). With an
+index on those columns every page is a single index seek, no matter how deep
+the user has scrolled.
+
+Cursors are opaque URL-safe strings. They carry the sort key of the boundary
+row and the direction to move in; they are not signed because they are only
+ever used as bound query parameters.
+"""
+import base64
+import json
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    next_cursor: str | None = None
+    previous_cursor: str | None = None
+    page_size: int = DEFAULT_PAGE_SIZE
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _to_json(value):
+    # Datetimes are the only non-JSON sort keys we use; they are tagged so they decode back to datetimes.
+    if hasattr(value, 'isoformat'):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, dict) and 'dt' in value:
+        parsed = parse_datetime(value['dt'])
+        if parsed is None:
+            raise InvalidCursor('Bad datetime in cursor.')
+        return parsed
+    return value
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'k': [_to_json(v) for v in values], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields=None):
+    """
+    Return (values, direction) for a cursor string, raising InvalidCursor on garbage.
+
+    With fields (the model fields of the ordering), the cursor must carry one
+    value per field and each value is converted with field.to_python(), so a
+    well-formed cursor with values of the wrong type is rejected here instead
+    of failing in the query.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        values = [_from_json(v) for v in payload['k']]
+        direction = payload['d']
+    except InvalidCursor:
+        raise
+    except Exception as exc:
+        raise InvalidCursor('Malformed cursor.') from exc
+    if direction not in ('n', 'p') or not isinstance(values, list):
+        raise InvalidCursor('Malformed cursor.')
+    if fields is not None:
+        if len(values) != len(fields):
+            raise InvalidCursor('Cursor does not match the ordering.')
+        try:
+            values = [field.to_python(value) for field, value in zip(fields, values)]
+        except (ValidationError, TypeError, ValueError) as exc:
+            raise InvalidCursor('Cursor values do not match the ordering.') from exc
+        if any(value is None for value in values):
+            raise InvalidCursor('Cursor values do not match the ordering.')
+    return values, direction
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    # Page size usually comes straight from the query string, so anything unusable falls back to the default.
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def _seek_filter(fields, values, forward):
+    """
+    Build the lexicographic "row comes after (or before) values" condition.
+
+    For two fields this produces  a >= va AND (a > va OR b > vb)  rather than
+    the equivalent  a > va OR (a = va AND b > vb), because the leading range
+    condition lets SQLite seek straight into the composite index.
+    """
+    field_name = fields[0].lstrip('-')
+    descending = fields[0].startswith('-')
+    strict = 'gt' if forward != descending else 'lt'
+    inclusive = strict[0] + 'te'
+    if len(fields) == 1:
+        return Q(**{f'{field_name}__{strict}': values[0]})
+    return Q(**{f'{field_name}__{inclusive}': values[0]}) & (
+        Q(**{f'{field_name}__{strict}': values[0]}) | _seek_filter(fields[1:], values[1:], forward)
+    )
+
+
+def _reverse(fields):
+    return [f[1:] if f.startswith('-') else '-' + f for f in fields]
+
+
+def _key(obj, fields):
+    return [getattr(obj, f.lstrip('-')) for f in fields]
+
+
+def paginate_keyset(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return one KeysetPage of queryset sorted by ordering.
+
+    ordering is a sequence of field names (prefix '-' for descending) that
+    must end in a unique column, e.g. ('name', 'id') or ('-date', '-id'), so
+    that every row has a distinct key. An invalid cursor is treated as no
+    cursor: the first page is returned.
+    """
+    ordering = list(ordering)
+    values, direction = None, 'n'
+    if cursor:
+        fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in ordering]
+        try:
+            values, direction = decode_cursor(cursor, fields)
+        except InvalidCursor:
+            values, direction = None, 'n'
+
+    forward = direction == 'n'
+    qs = queryset
+    if values is not None:
+        qs = qs.filter(_seek_filter(ordering, values, forward))
+    qs = qs.order_by(*(ordering if forward else _reverse(ordering)))
+
+    # One extra row tells us whether there is another page in this direction without a COUNT(*).
+    rows = list(qs[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not forward:
+        rows.reverse()
+
+    return build_page(rows, ordering, page_size,
+                      has_next=has_more if forward else values is not None,
+                      has_previous=values is not None if forward else has_more)
+
+
+def build_page(rows, ordering, page_size, has_next, has_previous, key=None):
+    """Wrap already-fetched rows in a KeysetPage; key(row) defaults to reading the ordering fields."""
+    key = key or (lambda obj: _key(obj, ordering))
+    page = KeysetPage(items=rows, page_size=page_size)
+    if rows and has_next:
+        page.next_cursor = encode_cursor(key(rows[-1]), 'n')
+    if rows and has_previous:
+        page.previous_cursor = encode_cursor(key(rows[0]), 'p')
+    return page
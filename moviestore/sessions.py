@@ -0,0 +1,229 @@
+"""
+Session engine: the database session store with an in-process LRU in front.
+
+With the stock database backend every request that touches request.session
+(AuthenticationMiddleware does, on every page for signed-in users) reads the
+session row, and every cart change rewrites it. On SQLite each of those
+writes takes the database-wide write lock. This engine (SESSION_ENGINE =
+'moviestore.sessions') keeps the rows in the database, so sessions survive
+restarts and are shared by every worker, but
+
+* reads of guest sessions (carts, mostly) go through a per-process LRU of
+  recently used sessions (SESSION_LRU_SIZE entries). An entry is trusted
+  for SESSION_LRU_TTL seconds, after which the row is read again. Signed-in
+  sessions are never cached: they are read from the database on every
+  request, so a logout on one worker counts at once on all of them.
+* writes are conditional: the UPDATE only matches the row if it still holds
+  the session_data this request loaded. When another worker changed it in
+  the meantime (or this process's cached copy was stale), the current row
+  is re-read and this request's changes are applied to it key by key; if
+  both changed the same key, or the row is gone, save() raises UpdateError
+  (a 400 from SessionMiddleware) rather than overwrite the other change.
+* save() compares the serialized payload with the one that was loaded and
+  skips the UPDATE when nothing changed, unless the stored expiry is more
+  than SESSION_EXPIRY_REFRESH seconds behind; so re-adding the same
+  quantity, or a view that marks the session modified without changing it,
+  costs no write.
+* clear_expired() (`manage.py clearsessions`) deletes expired rows in
+  batches of SESSION_CLEANUP_BATCH_SIZE, each in its own short statement, so
+  cleanup never holds the write lock for long.
+
+`manage.py bench_sessions` compares it with the stock engines.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends import db
+from django.contrib.sessions.backends.base import UpdateError
+from django.core.signals import setting_changed
+from django.utils import timezone
+
+# payload: the session serialized with SESSION_SERIALIZER; expire_date and session_data: as stored in
+# the row; cached_at: time.monotonic() when the row was read or written.
+Entry = namedtuple('Entry', 'payload expire_date session_data cached_at')
+
+# How many times save() re-reads and merges a row that keeps changing under it before giving up.
+CONFLICT_RETRIES = 3
+_MISSING = object()
+
+
+class SessionCache:
+    """Thread-safe LRU of session payloads, keyed by session key."""
+
+    def __init__(self, maxsize=10000, ttl=5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is None:
+                return None
+            if now - entry.cached_at > self.ttl or entry.expire_date <= timezone.now():
+                del self._entries[session_key]
+                return None
+            self._entries.move_to_end(session_key)
+            return entry
+
+    def put(self, session_key, payload, expire_date, session_data):
+        with self._lock:
+            self._entries[session_key] = Entry(payload, expire_date, session_data, time.monotonic())
+            self._entries.move_to_end(session_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, session_key):
+        with self._lock:
+            self._entries.pop(session_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SessionCache(maxsize=settings.SESSION_LRU_SIZE, ttl=settings.SESSION_LRU_TTL)
+    return _cache
+
+
+def reset_cache(**kwargs):
+    # Drop the process-wide cache so the next request picks up new settings (and starts empty).
+    global _cache
+    if kwargs.get('setting', 'SESSION').startswith('SESSION'):
+        _cache = None
+
+
+setting_changed.connect(reset_cache)
+
+
+class SessionStore(db.SessionStore):
+    # (payload, expire_date, session_data) of the row as this store last read or wrote it; None when there
+    # is no row. session_data is the encoded column value, which guards the conditional UPDATE in save().
+    _stored = None
+    # The session_data of the row the last create_model_instance() built, for save(must_create=True).
+    _encoded = None
+
+    def _serialize(self, data):
+        return self.serializer().dumps(data)
+
+    def _remember(self, data, payload, expire_date, session_data):
+        self._stored = (payload, expire_date, session_data)
+        if SESSION_KEY in data:
+            # Signed-in sessions are always read from the database, so a logout on any worker counts at once.
+            get_cache().discard(self.session_key)
+        else:
+            get_cache().put(self.session_key, payload, expire_date, session_data)
+
+    def load(self):
+        if self.session_key is not None:
+            entry = get_cache().get(self.session_key)
+            if entry is not None:
+                self._stored = (entry.payload, entry.expire_date, entry.session_data)
+                return self.serializer().loads(entry.payload)
+        row = self._get_session_from_db()
+        if row is None:
+            self._stored = None
+            return {}
+        data = self.decode(row.session_data)
+        self._remember(data, self._serialize(data), row.expire_date, row.session_data)
+        return data
+
+    def create_model_instance(self, data):
+        instance = super().create_model_instance(data)
+        self._encoded = instance.session_data
+        return instance
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        payload = self._serialize(data)
+        expire_date = self.get_expiry_date()
+        refresh = timedelta(seconds=settings.SESSION_EXPIRY_REFRESH)
+        if (not must_create and self._stored is not None and self._stored[0] == payload
+                and self._stored[1] >= expire_date - refresh):
+            return
+        if must_create or self._stored is None:
+            super().save(must_create=must_create)
+            self._remember(data, payload, expire_date, self._encoded)
+            return
+        session_data = self.encode(data)
+        if not self._write(session_data, expire_date, self._stored[2]):
+            data, payload, session_data = self._merge(data, expire_date)
+        self._remember(data, payload, expire_date, session_data)
+
+    def _write(self, session_data, expire_date, expected):
+        # Only overwrite the row this request loaded: another worker may have changed it since,
+        # and this process may have read it from its LRU.
+        return self.model.objects.filter(session_key=self.session_key, session_data=expected).update(
+            session_data=session_data, expire_date=expire_date)
+
+    def _merge(self, data, expire_date):
+        """
+        The row changed under us: apply this request's changes to the current row and write that.
+
+        Keys this request did not change keep the current row's values. A key
+        that both this request and the other writer changed, or a row that
+        is gone (logged out), raises UpdateError, which SessionMiddleware
+        turns into a 400 instead of silently dropping either change.
+        """
+        loaded = self.serializer().loads(self._stored[0])
+        for _ in range(CONFLICT_RETRIES):
+            get_cache().discard(self.session_key)
+            row = self.model.objects.filter(session_key=self.session_key, expire_date__gt=timezone.now()).first()
+            if row is None:
+                raise UpdateError
+            current = self.decode(row.session_data)
+            merged = dict(current)
+            for key in set(loaded) | set(data):
+                ours, base = data.get(key, _MISSING), loaded.get(key, _MISSING)
+                if ours == base:
+                    continue
+                if current.get(key, _MISSING) not in (base, ours):
+                    raise UpdateError
+                if ours is _MISSING:
+                    merged.pop(key, None)
+                else:
+                    merged[key] = ours
+            session_data = self.encode(merged)
+            if self._write(session_data, expire_date, row.session_data):
+                self._session_cache = merged
+                return merged, self._serialize(merged), session_data
+        raise UpdateError
+
+    def delete(self, session_key=None):
+        session_key = session_key or self.session_key
+        if session_key is None:
+            return
+        get_cache().discard(session_key)
+        if session_key == self.session_key:
+            self._stored = None
+        super().delete(session_key)
+
+    @classmethod
+    def clear_expired(cls, batch_size=None):
+        """Delete expired sessions, batch_size rows per DELETE. Returns how many were deleted."""
+        batch_size = batch_size or settings.SESSION_CLEANUP_BATCH_SIZE
+        model = cls.get_model_class()
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(model.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:batch_size])
+            if not keys:
+                return deleted
+            deleted += model.objects.filter(session_key__in=keys).delete()[0]
@@ -54,11 +54,15 @@ INSTALLED_APPS = [
     'movies',
     'accounts',
     'cart',
+    'perf',
+    'recommendations',
     "widget_tweaks",
 ]
 
 #Middleware in Django intercepts and manages the request and response processing flow. The listed middleware is provided by Django and handles various aspects of request/response processing, including security, session management, authentication, and more.
 MIDDLEWARE = [
+    # First, so its Server-Timing "total" covers all the other middleware (see perf/timing.py).
+    'perf.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,7 +78,8 @@ ROOT_URLCONF = 'moviestore.urls'
 #Defines the configuration for Django’s template system. It includes information regarding the list of directories that the system should look in for template source files and other specific template settings.
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The standard Django backend, with render times reported to perf.middleware.ServerTimingMiddleware.
+        'BACKEND': 'perf.timing.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'moviestore/templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -99,6 +104,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Checkout writes inside transaction.atomic(). Taking the write lock when the transaction starts
+        # (rather than on its first write) lets concurrent buyers queue on the busy timeout instead of
+        # failing with "database is locked".
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -127,6 +139,48 @@ AUTH_PASSWORD_VALIDATORS = [
 
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 MAPS_JS_API_KEY = os.getenv("MAPS_JS_API_KEY")
+
+# Geocoding of shipping addresses at checkout (see cart/geocoding.py). Set GEOCODER_BACKEND to
+# 'cart.geocoding.StubGeocoder' to work offline. TTLs are in seconds.
+GEOCODER_BACKEND = os.getenv("GEOCODER_BACKEND", "cart.geocoding.GoogleMapsGeocoder")
+GEOCODE_CACHE_TTL = 30 * 24 * 60 * 60
+GEOCODE_NEGATIVE_TTL = 24 * 60 * 60
+GEOCODE_LRU_SIZE = 4096
+# Widths (in pixels) of the resized poster variants made by movies/images.py. The catalog grid shows
+# posters 220px wide, so these cover 1x, 2x and 3x screens.
+POSTER_WIDTHS = (220, 440, 660)
+# Where shopping carts are kept (see cart/store.py): SessionCartBackend, SignedCookieCartBackend or CacheCartBackend.
+CART_BACKEND = os.getenv("CART_BACKEND", "cart.store.SessionCartBackend")
+CART_COOKIE_NAME = 'cart'
+CART_MAX_AGE = 14 * 24 * 60 * 60
+# Sessions live in the database behind a per-process LRU that skips unchanged writes (see moviestore/sessions.py).
+# A cached session is re-read after SESSION_LRU_TTL seconds; an unchanged session is rewritten only to push its
+# expiry forward, at most every SESSION_EXPIRY_REFRESH seconds. `manage.py clearsessions` deletes expired rows
+# SESSION_CLEANUP_BATCH_SIZE at a time.
+SESSION_ENGINE = os.getenv("SESSION_ENGINE", "moviestore.sessions")
+SESSION_LRU_SIZE = 10000
+SESSION_LRU_TTL = 5
+SESSION_EXPIRY_REFRESH = 60 * 60
+SESSION_CLEANUP_BATCH_SIZE = 1000
+# Per-request SQL, template and view timings in a Server-Timing header, summarized per URL name (the last
+# SERVER_TIMING_WINDOW requests of each) at /admin/perf/timings/. See perf/timing.py.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+SERVER_TIMING_WINDOW = 200
+# Addresses that are not cached are geocoded after checkout by `manage.py process_geocode_jobs`;
+# a job that keeps failing is given up after this many attempts.
+GEOCODE_JOB_MAX_ATTEMPTS = 8
+# How many best-selling movies the regional trends map keeps per region and per map cluster.
+REGIONAL_TRENDS_TOP_K = 3
+# How many "customers who bought this also bought" movies are precomputed per movie (see recommendations/copurchase.py).
+COPURCHASE_NEIGHBORS = 6
+# The rating-based recommender (recommendations/als.py): where `manage.py train_recommender` writes the
+# memory-mapped model, and how many movies the home page recommends.
+RECOMMENDER_DIR = os.getenv("RECOMMENDER_DIR", os.path.join(BASE_DIR, 'var', 'recommender'))
+RECOMMENDATIONS_COUNT = 6
+# "Trending now" (movies/trending.py): purchases and reviews count half as much after this many hours,
+# and the home page lists this many movies.
+TRENDING_HALF_LIFE_HOURS = 72
+TRENDING_COUNT = 20
 LANGUAGE_CODE = 'en-us' 
 
 TIME_ZONE = 'UTC'
@@ -158,4 +212,27 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # This variable specifies the URL prefix that will be used to serve media files from the web server. In this code, it’s set to '/media/', meaning that media files uploaded to the Django application will be accessible via URLs starting with /media/. For example, if you upload an image named example.jpg, it might be accessible at a URL like http://localhost:8000/media/example.jpg.
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-MEDIA_URL = '/media/'
\ No newline at end of file
+MEDIA_URL = '/media/'
+
+# Uploaded files get a content hash in their name and, outside DEBUG, collectstatic writes hashed copies
+# of the static files (see moviestore/storage.py). Hashed files are served as immutable by moviestore/media.py;
+# unhashed media (uploaded before hashing) is cached for MEDIA_MUTABLE_MAX_AGE seconds.
+STORAGES = {
+    'default': {
+        'BACKEND': 'moviestore.storage.ContentHashedFileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'moviestore.storage.HashedStaticFilesStorage',
+    },
+}
+MEDIA_MUTABLE_MAX_AGE = 60 * 60
+
+# Number of movie cards per catalog page. Clients can ask for a different size with ?page_size= (capped at 100).
+MOVIES_PAGE_SIZE = 24
+
+# Number of reviews shown on a movie's detail page before "Load more reviews" fetches the next page.
+REVIEWS_PAGE_SIZE = 10
+
+# Number of orders per page on the order history page.
+ORDERS_PAGE_SIZE = 10
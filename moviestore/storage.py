@@ -0,0 +1,75 @@
+"""
+Content-hashed file names for static files and uploads.
+
+A file whose name contains a hash of its content can be cached by browsers
+and proxies forever: if the content changes, so does the URL. Both storages
+here produce names like
+
+    css/style.3f2a9c1b7d4e.css
+    movie_images/Avatar.9b0e4d2a61c3.jpg
+
+and serve_file() (moviestore/media.py, behind serve_media and serve_static)
+marks such names as immutable.
+
+* HashedStaticFilesStorage is ManifestStaticFilesStorage (collectstatic
+  writes the hashed copies and a manifest) that falls back to the plain name
+  for files missing from the manifest instead of raising, so a page never
+  500s because collectstatic has not been run yet.
+* ContentHashedFileSystemStorage hashes uploads as they are saved. Saving
+  the same bytes twice reuses the existing file. The hash is always
+  computed from the content: an incoming name that already looks hashed
+  (say an upload called x.0123456789ab.png) has its hash replaced, so a
+  hashed name always matches the bytes behind it.
+"""
+import hashlib
+import os
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+HASH_LENGTH = 12
+
+# name.<12 hex digits>.ext, as produced by both storages below.
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{%d}\.[^./]+$' % HASH_LENGTH)
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME_RE.search(name))
+
+
+def content_hash(content):
+    # File.chunks() rewinds before reading; we rewind again so the caller can write the content afterwards.
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+class HashedStaticFilesStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            # Not collected yet (e.g. in tests or right after a deploy); serve the unhashed name.
+            return name
+
+
+class ContentHashedFileSystemStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        root, ext = os.path.splitext(name)
+        if is_hashed(name):
+            root = os.path.splitext(root)[0]
+        name = f'{root}.{content_hash(content)}{ext}'
+        if self.exists(name):
+            # Same name means same content: nothing to write.
+            return name
+        return super().save(name, content, max_length)
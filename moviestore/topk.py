@@ -0,0 +1,45 @@
+"""
+Top-K-per-group queries with window functions.
+
+"The 3 best sellers in every region" used to mean fetching every (region,
+movie) row sorted by sales and throwing most of them away in Python, so the
+result grew with regions x catalog. top_k() instead numbers the rows of each
+partition in the database,
+
+    ROW_NUMBER() OVER (PARTITION BY region ORDER BY total DESC, movie_id)
+
+and keeps rows numbered 1..k; Django wraps the filter in a subquery because
+SQL cannot filter on a window in WHERE. The result is at most groups x k
+rows.
+
+PartitionSum and PartitionCount give every kept row the totals of its whole
+partition (e.g. a region's purchases over all movies, not just the top k),
+computed in the same query.
+"""
+from django.db.models import F, Func, IntegerField, Window
+from django.db.models.functions import RowNumber
+
+
+class PartitionSum(Func):
+    """SUM(expression) over a window; expression may be an aggregate of a grouped query."""
+    function = 'SUM'
+    window_compatible = True
+
+
+class PartitionCount(Func):
+    """COUNT(*) over a window: the number of (grouped) rows in the partition."""
+    template = 'COUNT(*)'
+    window_compatible = True
+    output_field = IntegerField()
+
+
+def top_k(queryset, partition_by, order_by, k, rank='rank'):
+    """
+    Keep the first k rows of each partition of queryset.
+
+    partition_by and order_by are expressions or field names as for Window;
+    the row's position within its partition (from 1) is annotated as rank.
+    """
+    partition_by = [F(part) if isinstance(part, str) else part for part in partition_by]
+    ranked = queryset.annotate(**{rank: Window(RowNumber(), partition_by=partition_by, order_by=order_by)})
+    return ranked.filter(**{f'{rank}__lte': k})
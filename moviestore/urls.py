@@ -14,20 +14,31 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
-from django.conf.urls.static import static
+from django.urls import path, include, re_path
 from django.conf import settings
 
+from perf import views as perf_views
+
+from . import media
+
 
 urlpatterns = [
+    #Staff-only summary of request timings (see perf/timing.py); admin_view gives it the admin's login and staff checks. It has to come before admin.site.urls, which would otherwise claim the URL.
+    path('admin/perf/timings/', admin.site.admin_view(perf_views.timings), name='perf.timings'),
     path('admin/', admin.site.urls),
     path('', include('home.urls')),
     path('movies/', include('movies.urls')),
     path('accounts/', include('accounts.urls')),
     path('cart/', include('cart.urls')),
+    path('api/v1/', include('movies.api_urls')),
 
 ]
 #With this, you can serve the media files stored in the MEDIA_ROOT directory when the MEDIA_URL URL prefix is accessed.
-urlpatterns += static(settings.MEDIA_URL,
-    document_root=settings.MEDIA_ROOT)
+#We serve them through moviestore/media.py rather than django.conf.urls.static, so that content-hashed files are sent with long-lived Cache-Control headers and revalidations get a 304 (ETag/If-None-Match). Collected static files (STATIC_ROOT) are served the same way when DEBUG is off.
+urlpatterns += [
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), media.serve_media, name='media'),
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), media.serve_static, name='static'),
+]
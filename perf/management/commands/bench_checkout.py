@@ -0,0 +1,107 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from cart import checkout, rollups
+from cart.models import Item, Order
+from movies import trending
+from movies.models import Movie
+from recommendations import copurchase
+
+BENCH_USER_PREFIX = 'bench-buyer-'
+
+
+def place_order_per_item(user, quantities):
+    """The checkout write path before it was batched: one autocommitted save per line item."""
+    movies = Movie.objects.filter(id__in=quantities)
+    order = Order(user=user, total=sum(m.price * quantities[m.id] for m in movies))
+    order.save()
+    for movie in movies:
+        Item(order=order, movie=movie, price=movie.price, quantity=quantities[movie.id]).save()
+    rollups.record_order(order, [movie.id for movie in movies])
+    return order
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure checkout throughput for large carts with several buyers checking out at once. "
+        "Writes real orders to the configured database and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=8, help="Concurrent buyers (threads).")
+        parser.add_argument('--orders', type=int, default=20, help="Orders placed by each buyer.")
+        parser.add_argument('--cart-size', type=int, default=30, help="Distinct movies in each cart.")
+        parser.add_argument('--mode', choices=['bulk', 'per-item', 'both'], default='both',
+                            help="'bulk' is the current checkout; 'per-item' replays the old one-save-per-item path.")
+        parser.add_argument('--keep', action='store_true', help="Keep the benchmark orders and users.")
+
+    def handle(self, *args, **options):
+        movie_ids = list(Movie.objects.order_by('id').values_list('id', flat=True)[:options['cart_size']])
+        if len(movie_ids) < options['cart_size']:
+            raise CommandError(f"Need at least {options['cart_size']} movies in the database, found {len(movie_ids)}.")
+        quantities = {movie_id: 1 + index % 3 for index, movie_id in enumerate(movie_ids)}
+
+        buyers = [
+            User.objects.get_or_create(username=f'{BENCH_USER_PREFIX}{n}')[0]
+            for n in range(options['buyers'])
+        ]
+        modes = ['per-item', 'bulk'] if options['mode'] == 'both' else [options['mode']]
+        try:
+            for mode in modes:
+                self.report(mode, self.run(mode, buyers, quantities, options['orders']), options)
+        finally:
+            if not options['keep']:
+                Order.objects.filter(user__in=buyers).delete()
+                User.objects.filter(id__in=[buyer.id for buyer in buyers]).delete()
+                # The rollup, the "also bought" counts and the trending scores were bumped by every benchmark
+                # order; recount them from what is left.
+                rollups.rebuild()
+                copurchase.build()
+                trending.rebuild()
+
+    def run(self, mode, buyers, quantities, orders_per_buyer):
+        place = place_order_per_item if mode == 'per-item' else checkout.place_order
+        latencies, errors, lock = [], [], threading.Lock()
+
+        def buyer_loop(user):
+            try:
+                for _ in range(orders_per_buyer):
+                    started = time.perf_counter()
+                    try:
+                        place(user, quantities)
+                    except DatabaseError as exc:
+                        with lock:
+                            errors.append(str(exc))
+                        continue
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+            finally:
+                # Each thread opened its own connection; close it so the database is not left locked.
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(buyers)) as pool:
+            list(pool.map(buyer_loop, buyers))
+        return {'wall': time.perf_counter() - started, 'latencies': latencies, 'errors': errors}
+
+    def report(self, mode, result, options):
+        latencies = sorted(result['latencies'])
+        placed = len(latencies)
+        lines = placed * options['cart_size']
+        self.stdout.write(f"{mode}: {placed} orders ({lines} line items) by {options['buyers']} buyers "
+                          f"in {result['wall']:.2f}s")
+        if placed:
+            cuts = statistics.quantiles(latencies, n=100) if placed > 1 else latencies * 99
+            self.stdout.write(f"  throughput  {placed / result['wall']:.1f} orders/s, {lines / result['wall']:.0f} items/s")
+            self.stdout.write(f"  latency     p50 {cuts[49] * 1000:.1f} ms, p95 {cuts[94] * 1000:.1f} ms, "
+                              f"max {latencies[-1] * 1000:.1f} ms")
+        if result['errors']:
+            self.stdout.write(self.style.WARNING(
+                f"  {len(result['errors'])} checkout(s) failed, e.g. {result['errors'][0]}"))
@@ -0,0 +1,182 @@
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib import error, parse, request as urlrequest
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from movies.models import Movie
+from perf import seeding
+from perf.seeding import WORDS
+
+# (label, weight, method, signed in only, path and POST data for a random request)
+MIX = [
+    ('home.index', 15, 'get', False, lambda rng, ids: (reverse('home.index'), None)),
+    ('movies.index', 15, 'get', False, lambda rng, ids: (reverse('movies.index'), None)),
+    ('movies.index[search]', 10, 'get', False,
+     lambda rng, ids: (reverse('movies.index') + '?' + parse.urlencode({'search': rng.choice(WORDS)}), None)),
+    ('movies.show', 25, 'get', False,
+     lambda rng, ids: (reverse('movies.show', args=[rng.choice(ids['movies'])]), None)),
+    ('movies.reviews', 5, 'get', False,
+     lambda rng, ids: (reverse('movies.reviews', args=[rng.choice(ids['movies'])]), None)),
+    ('api.movies', 5, 'get', False, lambda rng, ids: (reverse('api.movies'), None)),
+    ('api.movie', 5, 'get', False, lambda rng, ids: (reverse('api.movie', args=[rng.choice(ids['movies'])]), None)),
+    ('movies.regional_trends_clusters', 3, 'get', True,
+     lambda rng, ids: (reverse('movies.regional_trends_clusters') + '?bbox=-180,-85,180,85&zoom=3', None)),
+    ('movies.petition_list', 2, 'get', True, lambda rng, ids: (reverse('movies.petition_list'), None)),
+    ('cart.add', 8, 'post', False, lambda rng, ids: (reverse('cart.add', args=[rng.choice(ids['movies'])]),
+                                                     {'quantity': str(rng.randint(1, 3))})),
+    ('cart.index', 5, 'get', False, lambda rng, ids: (reverse('cart.index'), None)),
+    ('accounts.orders', 2, 'get', True, lambda rng, ids: (reverse('accounts.orders'), None)),
+]
+
+
+class InProcessTarget:
+    """Requests through Django's test client in this process: no network, no server needed."""
+
+    def __init__(self, base_url=None):
+        self.client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+
+    def login(self, username, password):
+        return self.client.login(username=username, password=password)
+
+    def request(self, method, path, data):
+        return getattr(self.client, method)(path, data or {}).status_code
+
+    def close(self):
+        # Each worker thread opened its own connection; close it so the database is not left locked.
+        connection.close()
+
+
+class _NoRedirects(urlrequest.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTarget:
+    """Requests over HTTP to a running server, with a cookie jar per worker like a browser."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = CookieJar()
+        self.opener = urlrequest.build_opener(urlrequest.HTTPCookieProcessor(self.cookies), _NoRedirects())
+
+    def _csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, method, path, data):
+        body = None
+        headers = {'Referer': self.base_url + path}
+        if method == 'post':
+            if not self._csrf_token():
+                self.request('get', reverse('accounts.login'), None)
+            body = parse.urlencode(data or {}).encode()
+            headers['X-CSRFToken'] = self._csrf_token()
+        try:
+            with self.opener.open(urlrequest.Request(self.base_url + path, data=body, headers=headers,
+                                                     method=method.upper()), timeout=30) as response:
+                response.read()
+                return response.status
+        except error.HTTPError as exc:
+            exc.read()
+            return exc.code
+
+    def login(self, username, password):
+        return self.request('post', reverse('accounts.login'), {'username': username, 'password': password}) == 302
+
+    def close(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a weighted mix of the site's pages with concurrent workers and report throughput and "
+        "p50/p95/p99 latency per endpoint. Runs in-process by default; --base-url drives a running server "
+        "instead. Meant for a database filled by `manage.py seed_data`; adding to carts writes sessions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent simulated visitors (threads).")
+        parser.add_argument('--requests', type=int, default=200, help="Measured requests per worker.")
+        parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per worker first.")
+        parser.add_argument('--anonymous', action='store_true',
+                            help="Do not sign the workers in (pages that need an account are left out).")
+        parser.add_argument('--base-url', help="e.g. http://127.0.0.1:8000 to load a running server over HTTP.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the request sequence.")
+
+    def handle(self, *args, **options):
+        ids = {'movies': list(Movie.objects.values_list('id', flat=True))}
+        if not ids['movies']:
+            raise CommandError("There are no movies; fill the database with `manage.py seed_data` first.")
+        usernames = [] if options['anonymous'] else list(
+            User.objects.filter(username__startswith='seed_user_').values_list('username', flat=True)[:options['workers']])
+        if not options['anonymous'] and not usernames:
+            raise CommandError("There are no seeded users to sign in as; run `manage.py seed_data` or pass --anonymous.")
+        mix = [entry for entry in MIX if usernames or not entry[3]]
+
+        target_class = HttpTarget if options['base_url'] else InProcessTarget
+        samples, lock = {label: [] for label, *_ in mix}, threading.Lock()
+        failures = {label: 0 for label, *_ in mix}
+
+        # Workers sign in one after another before the clock starts: logins are not part of the mix, and
+        # signing in writes a session and last_login, which would only contend with the other workers.
+        targets = [target_class(options['base_url']) for _ in range(options['workers'])]
+        for n, target in enumerate(targets):
+            if usernames and not target.login(usernames[n % len(usernames)], seeding.SEED_PASSWORD):
+                raise CommandError(f"Could not sign in as {usernames[n % len(usernames)]}.")
+
+        def worker(n):
+            rng = random.Random(options['seed'] * 10007 + n)
+            target = targets[n]
+            try:
+                for count in range(options['warmup'] + options['requests']):
+                    label, _, method, _, build = rng.choices(mix, weights=[entry[1] for entry in mix])[0]
+                    path, data = build(rng, ids)
+                    started = time.perf_counter()
+                    try:
+                        status = target.request(method, path, data)
+                    except OSError:
+                        status = None
+                    elapsed = time.perf_counter() - started
+                    if count < options['warmup']:
+                        continue
+                    with lock:
+                        if status is None or status >= 400:
+                            failures[label] += 1
+                        else:
+                            samples[label].append(elapsed)
+            finally:
+                target.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            list(pool.map(worker, range(options['workers'])))
+        self.report(samples, failures, time.perf_counter() - started, options)
+
+    def row(self, label, latencies, failed, wall):
+        latencies = sorted(latencies)
+        if not latencies:
+            return f"{label:<34} {0:>7} {failed:>6} {'-':>9}"
+        cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return (f"{label:<34} {len(latencies):>7} {failed:>6} {len(latencies) / wall:>9.1f}"
+                f" {cuts[49] * 1000:>9.1f} {cuts[94] * 1000:>9.1f} {cuts[98] * 1000:>9.1f}")
+
+    def report(self, samples, failures, wall, options):
+        target = options['base_url'] or 'in-process'
+        self.stdout.write(f"{options['workers']} workers x {options['requests']} requests against {target} "
+                          f"in {wall:.1f}s")
+        self.stdout.write(f"{'endpoint':<34} {'ok':>7} {'failed':>6} {'req/s':>9}"
+                          f" {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for label in sorted(samples):
+            self.stdout.write(self.row(label, samples[label], failures[label], wall))
+        everything = [latency for latencies in samples.values() for latency in latencies]
+        self.stdout.write(self.row('all', everything, sum(failures.values()), wall))
+        if sum(failures.values()):
+            self.stdout.write(self.style.WARNING(f"{sum(failures.values())} requests failed (status >= 400)."))
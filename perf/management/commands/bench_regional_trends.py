@@ -0,0 +1,98 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from cart import clusters, rollups
+from cart.geo import region_key
+from cart.models import RegionalPopularity
+from perf import seeding
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the full (region, movie) cross product behind the trends map with the top-K-per-region "
+        "window query, on a seeded rollup. Everything is written inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--regions', type=int, default=500, help="Synthetic regions in the rollup.")
+        parser.add_argument('--movies', type=int, default=400, help="Movies in the seeded catalog.")
+        parser.add_argument('--movies-per-region', type=int, default=150,
+                            help="Distinct movies bought in each region.")
+        parser.add_argument('--days', type=int, default=7, help="Days of history per (region, movie).")
+        parser.add_argument('--k', type=int, default=settings.REGIONAL_TRENDS_TOP_K, help="Movies kept per region.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs of each query.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options)
+                self.compare(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, options):
+        started = time.perf_counter()
+        seeded = seeding.seed(movies=options['movies'], users=1, reviews_per_movie=0, orders=0,
+                              petitions=0, votes_per_petition=0)
+        rng = random.Random(42)
+        today = timezone.now().date()
+        rows = []
+        for n in range(options['regions']):
+            city = f'Bench City {n}'
+            latitude, longitude = rng.uniform(-60, 70), rng.uniform(-180, 180)
+            for movie in rng.sample(seeded.movies, min(options['movies_per_region'], len(seeded.movies))):
+                for day in range(options['days']):
+                    rows.append(RegionalPopularity(
+                        region_key=region_key(city, '', ''), city=city, movie=movie,
+                        day=today - timedelta(days=day), purchases=rng.randint(1, 20),
+                        latitude=latitude, longitude=longitude))
+        RegionalPopularity.objects.bulk_create(rows, batch_size=2000)
+        self.stdout.write(f"Seeded {len(rows)} rollup rows ({options['regions']} regions x "
+                          f"{options['movies_per_region']} movies x {options['days']} days) "
+                          f"in {time.perf_counter() - started:.1f}s")
+
+    def time(self, label, run, repeat):
+        timings, result = [], None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = run()
+            timings.append(time.perf_counter() - started)
+        self.stdout.write(f"  {label:<28} {len(result):>8} rows   median {statistics.median(timings) * 1000:8.1f} ms"
+                          f"   best {min(timings) * 1000:8.1f} ms")
+        return result
+
+    def compare(self, options):
+        k, repeat = options['k'], options['repeat']
+        self.stdout.write(f"Top {k} movies per region, {repeat} runs each:")
+        full = self.time('full cross product', lambda: list(rollups.regional_totals()), repeat)
+        ranked = self.time('window top-k', lambda: list(rollups.top_movies_per_region(k)), repeat)
+        world = (-180, -85, 180, 85)
+        self.time('map clusters (zoom 3)', lambda: list(clusters.clusters(world, 3, top=k)), repeat)
+
+        # The old path still has to pick the leaders in Python; both must agree.
+        leaders = {}
+        for row in full:
+            picked = leaders.setdefault(row['region_key'], [])
+            if len(picked) < k:
+                picked.append(row['total_purchases'])
+        by_window = {}
+        for row in ranked:
+            by_window.setdefault(row['region_key'], []).append(row['total_purchases'])
+        if leaders == by_window:
+            self.stdout.write(self.style.SUCCESS(
+                f"Both paths agree on the top {k} of {len(by_window)} regions; the window query returned "
+                f"{len(ranked)} rows instead of {len(full)}."))
+        else:
+            self.stdout.write(self.style.ERROR("The two paths disagree on the regional leaders."))
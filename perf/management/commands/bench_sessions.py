@@ -0,0 +1,119 @@
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.contrib.sessions.backends.base import UpdateError
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from moviestore import sessions
+
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'moviestore': 'moviestore.sessions',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure session requests per second for the stock session engines and moviestore.sessions, on a "
+        "cart-heavy mix of reads, unchanged saves and cart changes. Writes real sessions to the configured "
+        "database and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=['db', 'cached_db', 'moviestore'],
+                            help="Session engines to compare.")
+        parser.add_argument('--sessions', type=int, default=200, help="Distinct visitors.")
+        parser.add_argument('--requests', type=int, default=500, help="Requests made by each thread.")
+        parser.add_argument('--threads', type=int, default=4, help="Concurrent request threads.")
+        parser.add_argument('--signed-in', type=float, default=0.2,
+                            help="Share of the visitors who are signed in (the rest are guests with a cart).")
+        parser.add_argument('--changes', type=float, default=0.2,
+                            help="Share of requests that change the cart (the rest only read the session).")
+        parser.add_argument('--rewrites', type=float, default=0.2,
+                            help="Share of requests that save the session without changing it, "
+                                 "e.g. re-adding the same quantity.")
+
+    def handle(self, *args, **options):
+        for name in options['engines']:
+            sessions.get_cache().clear()
+            engine = import_module(ENGINES[name])
+            keys = self.create_sessions(engine, options['sessions'], options['signed_in'])
+            try:
+                self.report(name, self.run(engine, keys, options), options)
+            finally:
+                for key in keys:
+                    engine.SessionStore(key).delete()
+
+    def create_sessions(self, engine, count, signed_in):
+        keys = []
+        for n in range(count):
+            store = engine.SessionStore()
+            if n < count * signed_in:
+                store['_auth_user_id'] = str(n)
+            store['cart'] = {'v': 'bench', 'l': [[1, 1, 10, 'Bench movie']]}
+            store.create()
+            keys.append(store.session_key)
+        return keys
+
+    def run(self, engine, keys, options):
+        latencies, errors, conflicts, lock = [], [], [], threading.Lock()
+
+        def request_loop(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    # What SessionMiddleware and AuthenticationMiddleware do around a view.
+                    store = engine.SessionStore(rng.choice(keys))
+                    try:
+                        store.get('_auth_user_id')
+                        roll = rng.random()
+                        if roll < options['changes']:
+                            store['cart'] = {'v': 'bench', 'l': [[1, rng.randint(1, 99), 10, 'Bench movie']]}
+                        elif roll < options['changes'] + options['rewrites']:
+                            store['cart'] = store.get('cart')
+                        if store.modified:
+                            store.save()
+                    except UpdateError:
+                        # Two requests changed the same session at once; moviestore.sessions refuses the second.
+                        with lock:
+                            conflicts.append(1)
+                        continue
+                    except DatabaseError as exc:
+                        with lock:
+                            errors.append(str(exc))
+                        continue
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+            finally:
+                # Each thread opened its own connection; close it so the database is not left locked.
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(request_loop, range(options['threads'])))
+        return {'wall': time.perf_counter() - started, 'latencies': latencies, 'errors': errors,
+                'conflicts': len(conflicts)}
+
+    def report(self, name, result, options):
+        latencies = sorted(result['latencies'])
+        served = len(latencies)
+        self.stdout.write(f"{name}: {served} requests over {options['sessions']} sessions by "
+                          f"{options['threads']} threads in {result['wall']:.2f}s")
+        if served:
+            cuts = statistics.quantiles(latencies, n=100) if served > 1 else latencies * 99
+            self.stdout.write(f"  throughput  {served / result['wall']:.0f} requests/s")
+            self.stdout.write(f"  latency     p50 {cuts[49] * 1000:.2f} ms, p95 {cuts[94] * 1000:.2f} ms, "
+                              f"max {latencies[-1] * 1000:.2f} ms")
+        if result['conflicts']:
+            self.stdout.write(f"  {result['conflicts']} concurrent change(s) to the same session refused")
+        if result['errors']:
+            self.stdout.write(self.style.WARNING(
+                f"  {len(result['errors'])} request(s) failed, e.g. {result['errors'][0]}"))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from perf import seeding
+from recommendations import copurchase
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic dataset for load testing: movies, users with profiles, reviews, "
+        "orders with line items and coordinates, petitions and votes, all written with batched bulk_create. "
+        f"Every seeded user's password is '{seeding.SEED_PASSWORD}'. Use a scratch database: the rows are added "
+        "to whatever is there."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--reviews-per-movie', type=int, default=10)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--petitions', type=int, default=50)
+        parser.add_argument('--votes-per-petition', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1234, help="Random seed; the same seed gives the same data.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per bulk INSERT.")
+        parser.add_argument('--skip-copurchases', action='store_true',
+                            help="Do not rebuild the \"also bought\" lists from the seeded orders.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = seeding.seed(
+            movies=options['movies'], users=options['users'], reviews_per_movie=options['reviews_per_movie'],
+            orders=options['orders'], items_per_order=options['items_per_order'], petitions=options['petitions'],
+            votes_per_petition=options['votes_per_petition'], random_seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        seeded = time.perf_counter() - started
+        self.stdout.write(', '.join(f"{count} {name}" for name, count in result.counts.items()) +
+                          f" in {seeded:.1f}s")
+
+        if not options['skip_copurchases']:
+            # The orders were bulk-inserted behind checkout's back, so "also bought" is rebuilt from them.
+            started = time.perf_counter()
+            pairs, movies = copurchase.build(batch_size=options['batch_size'])
+            self.stdout.write(f"{pairs} co-purchase pairs for {movies} movies in {time.perf_counter() - started:.1f}s")
+        self.stdout.write(self.style.SUCCESS("Seeded. Run `manage.py bench_load` to drive traffic at it."))
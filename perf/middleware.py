@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+
+from . import timing
+
+
+class ServerTimingMiddleware:
+    """
+    Measure every request (see perf/timing.py) and report it in a Server-Timing header.
+
+    Put it first in MIDDLEWARE so "total" covers the other middleware too.
+    "view" runs from the view being called to its response coming back here,
+    so it includes the response phase of the middleware below this one (the
+    session save, for instance). The body of a streamed response is produced
+    after the header has gone out; its queries and time are added to the
+    summary when the stream ends. SERVER_TIMING = False turns it all off.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SERVER_TIMING:
+            return self.get_response(request)
+        with timing.measure() as timings:
+            response = self.get_response(request)
+            view_started = getattr(request, '_perf_view_started', None)
+            if view_started is not None:
+                timings.view = time.perf_counter() - view_started
+        response['Server-Timing'] = timings.header()
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match else '<unresolved>'
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.stream(response.streaming_content, timings, name)
+        else:
+            timing.summaries.record(name, timings)
+        return response
+
+    def stream(self, content, timings, name):
+        # Runs while the server sends the body; closing the response (or the client going away) ends it too.
+        try:
+            with timing.measure(timings):
+                yield from content
+        finally:
+            timing.summaries.record(name, timings)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._perf_view_started = time.perf_counter()
@@ -0,0 +1,151 @@
+"""
+Synthetic data for performance tests and benchmarks.
+
+seed() fills the database with a catalog, users (with profiles), reviews,
+orders with line items and geocoordinates, and petitions with votes, all
+through bulk_create so that even large volumes load quickly. The data is
+deterministic for a given random seed, which keeps query counts and timings
+comparable between runs.
+"""
+import random
+from dataclasses import dataclass, field
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from accounts.models import Profile
+from cart import rollups
+from cart.models import Item, Order
+from movies import trending
+from movies.models import Movie, Petition, PetitionVote, Review
+from movies.ratings import compute_aggregates, AGGREGATE_FIELDS
+
+# A handful of real places so orders cluster the way real shipping addresses do.
+CITIES = [
+    ('Atlanta', 'GA', 'USA', 33.749, -84.388),
+    ('New York', 'NY', 'USA', 40.7128, -74.006),
+    ('Chicago', 'IL', 'USA', 41.8781, -87.6298),
+    ('Austin', 'TX', 'USA', 30.2672, -97.7431),
+    ('Seattle', 'WA', 'USA', 47.6062, -122.3321),
+    ('Miami', 'FL', 'USA', 25.7617, -80.1918),
+    ('Toronto', 'ON', 'Canada', 43.6532, -79.3832),
+    ('London', '', 'UK', 51.5074, -0.1278),
+    ('Madrid', '', 'Spain', 40.4168, -3.7038),
+    ('Mexico City', 'CDMX', 'Mexico', 19.4326, -99.1332),
+]
+
+POSTERS = ['Avatar.jpg', 'DespicableMe.jpg', 'FastFurious1.jpg', 'IT.jpg', 'LionKing.jpg', 'Minecraft.jpg']
+
+WORDS = ('space lion heist robot love war ocean city ghost dragon king night '
+         'summer family secret journey storm island detective galaxy').split()
+
+# Every seeded user shares one precomputed hash; hashing thousands of passwords would dominate seeding time.
+SEED_PASSWORD = 'seed-password-123'
+
+
+@dataclass
+class SeedResult:
+    movies: list = field(default_factory=list)
+    users: list = field(default_factory=list)
+    orders: list = field(default_factory=list)
+    petitions: list = field(default_factory=list)
+    counts: dict = field(default_factory=dict)
+
+
+def _title(rng, i):
+    return ' '.join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 3))) + f' {i}'
+
+
+def seed(movies=200, users=40, reviews_per_movie=5, orders=150, items_per_order=3,
+         petitions=20, votes_per_petition=10, random_seed=1234, batch_size=500):
+    rng = random.Random(random_seed)
+    result = SeedResult()
+
+    with transaction.atomic():
+        result.movies = Movie.objects.bulk_create([
+            Movie(
+                name=_title(rng, i),
+                description=' '.join(rng.choice(WORDS) for _ in range(25)),
+                price=rng.randint(5, 40),
+                image='movie_images/' + rng.choice(POSTERS),
+            )
+            for i in range(movies)
+        ], batch_size=batch_size)
+
+        password = make_password(SEED_PASSWORD)
+        start = User.objects.count()
+        result.users = User.objects.bulk_create([
+            User(username=f'seed_user_{start + i}', password=password)
+            for i in range(users)
+        ], batch_size=batch_size)
+        Profile.objects.bulk_create([
+            Profile(user=user, security_question='fav_color', security_answer='blue')
+            for user in result.users
+        ], batch_size=batch_size)
+
+        reviews = []
+        per_movie = min(reviews_per_movie, len(result.users))
+        for movie in result.movies:
+            for user in rng.sample(result.users, per_movie):
+                reviews.append(Review(movie=movie, user=user, rating=rng.randint(1, 5),
+                                      comment=' '.join(rng.choice(WORDS) for _ in range(8))))
+        Review.objects.bulk_create(reviews, batch_size=batch_size)
+
+        # bulk_create skips the review views, so the rating aggregates on Movie are filled in here.
+        aggregates = compute_aggregates([m.pk for m in result.movies])
+        for movie in result.movies:
+            for name, value in aggregates[movie.pk].items():
+                setattr(movie, name, value)
+        Movie.objects.bulk_update(result.movies, AGGREGATE_FIELDS, batch_size=batch_size)
+
+        order_rows, item_rows = [], []
+        for _ in range(orders):
+            city, state, country, lat, lng = rng.choice(CITIES)
+            lines = rng.sample(result.movies, min(items_per_order, len(result.movies)))
+            quantities = [rng.randint(1, 3) for _ in lines]
+            order = Order(
+                user=rng.choice(result.users),
+                total=sum(m.price * q for m, q in zip(lines, quantities)),
+                city=city, state=state, country=country,
+                latitude=lat + rng.uniform(-0.05, 0.05),
+                longitude=lng + rng.uniform(-0.05, 0.05),
+            )
+            # bulk_create skips Order.save(), which is where the geohash and region key are normally set.
+            order.update_geo_keys()
+            order_rows.append(order)
+            item_rows.append(list(zip(lines, quantities)))
+        result.orders = Order.objects.bulk_create(order_rows, batch_size=batch_size)
+        Item.objects.bulk_create([
+            Item(order=order, movie=movie, price=movie.price, quantity=quantity)
+            for order, lines in zip(result.orders, item_rows)
+            for movie, quantity in lines
+        ], batch_size=batch_size)
+
+        result.petitions = Petition.objects.bulk_create([
+            Petition(title=f'Add {_title(rng, i)}', description='Please add this movie.',
+                     created_by=rng.choice(result.users))
+            for i in range(petitions)
+        ], batch_size=batch_size)
+        votes = []
+        per_petition = min(votes_per_petition, len(result.users))
+        for petition in result.petitions:
+            for user in rng.sample(result.users, per_petition):
+                votes.append(PetitionVote(petition=petition, user=user, vote=rng.choice(('yes', 'no'))))
+        PetitionVote.objects.bulk_create(votes, batch_size=batch_size)
+
+        # Orders and reviews were bulk-inserted behind checkout's back, so the regional rollup and the
+        # trending scores are rebuilt from them.
+        rollups.rebuild(batch_size=batch_size)
+        trending.rebuild(batch_size=batch_size)
+
+    result.counts = {
+        'movies': len(result.movies),
+        'users': len(result.users),
+        'reviews': len(reviews),
+        'orders': len(result.orders),
+        'items': sum(len(lines) for lines in item_rows),
+        'petitions': len(result.petitions),
+        'votes': len(votes),
+    }
+    return result
@@ -0,0 +1,153 @@
+"""
+Query-count budgets and timing baselines for view tests.
+
+ViewBudgetTestCase seeds a realistic dataset once per test class (see
+perf.seeding) and provides assertViewBudget(), which requests a URL through
+the test client and checks two things:
+
+* the number of SQL queries is within the budget given by the test, and
+* the median wall-clock time is not much worse than the recorded baseline in
+  perf/baselines/view_timings.json.
+
+Timings are machine dependent, so the check is deliberately loose: a view
+fails only when it is slower than baseline * (1 + PERF_TOLERANCE) plus
+PERF_SLACK_MS milliseconds (defaults 2.0 and 50).
+
+Run the suite with PERF_UPDATE_BASELINE=1 to record the views that are new
+or whose query count changed; the other entries are left alone, so a change
+to one view does not rewrite every timing in the file. Set it to a comma-
+separated list of keys to re-record those as well, or to 'all' to re-record
+the whole baseline on the current machine.
+"""
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import seeding
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baselines' / 'view_timings.json'
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def baseline_updates(measurements, baseline, mode):
+    """The measurements PERF_UPDATE_BASELINE=mode should write over baseline."""
+    if mode == 'all':
+        return dict(measurements)
+    keys = {key.strip() for key in mode.split(',')}
+    return {
+        key: measured for key, measured in measurements.items()
+        if key in keys or key not in baseline or baseline[key].get('queries') != measured['queries']
+    }
+
+
+def save_baseline(measurements, path=BASELINE_PATH, mode='1'):
+    # Merge rather than overwrite, so running a single app's tests only refreshes that app's entries.
+    baseline = load_baseline(path)
+    updates = baseline_updates(measurements, baseline, mode)
+    if not updates:
+        return
+    baseline.update(updates)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as fh:
+        json.dump(dict(sorted(baseline.items())), fh, indent=2)
+        fh.write('\n')
+
+
+# Fast hashing keeps login/signup timings about the view rather than about PBKDF2, checkout
+# geocodes against the local stub instead of the network, and a recommender model trained on
+# the developer's own database is never picked up (tests that need one train it themselves).
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    GEOCODER_BACKEND='cart.geocoding.StubGeocoder',
+    RECOMMENDER_DIR=os.path.join(tempfile.gettempdir(), 'moviestore-tests-no-recommender'),
+)
+class ViewBudgetTestCase(TestCase):
+    # Volumes passed to perf.seeding.seed(); subclasses can raise or lower them.
+    seed_options = {}
+    # GET requests are repeated and the median kept; non-GET requests usually change state, so they run once.
+    timing_repeats = 3
+
+    @classmethod
+    def setUpClass(cls):
+        cls.measurements = {}
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seeding.seed(**cls.seed_options)
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.environ.get('PERF_UPDATE_BASELINE') and cls.measurements:
+            save_baseline(cls.measurements, mode=os.environ['PERF_UPDATE_BASELINE'])
+        super().tearDownClass()
+
+    def assertViewBudget(self, key, max_queries, path, method='get', data=None, status=None, repeats=None, **extra):
+        """
+        Request path and enforce the query budget and timing baseline for key.
+
+        key names the measurement in the baseline file (e.g. 'movies.show').
+        Pass repeats=1 for GET views that change state (e.g. a delete link).
+        Returns the last response so callers can make further assertions.
+        """
+        send = getattr(self.client, method)
+        if repeats is None:
+            repeats = self.timing_repeats if method == 'get' else 1
+        timings, response, queries = [], None, None
+        for _ in range(repeats):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = send(path, data, **extra)
+                if getattr(response, 'streaming', False):
+                    # A streamed body runs its queries while it is consumed, so that has to happen inside the capture.
+                    body = b''.join(response.streaming_content)
+                    response.streaming_content = [body]
+                timings.append(time.perf_counter() - started)
+            queries = captured.captured_queries
+
+        if status is not None:
+            self.assertEqual(response.status_code, status, f'{key}: unexpected status code')
+        self.assertLessEqual(
+            len(queries), max_queries,
+            f'{key} ran {len(queries)} queries (budget {max_queries}):\n'
+            + '\n'.join(q['sql'] for q in queries),
+        )
+
+        seconds = statistics.median(timings)
+        self.measurements[key] = {'queries': len(queries), 'seconds': round(seconds, 5)}
+        if not os.environ.get('PERF_UPDATE_BASELINE'):
+            recorded = load_baseline().get(key)
+            if recorded:
+                limit = recorded['seconds'] * (1 + _env_float('PERF_TOLERANCE', 2.0)) \
+                    + _env_float('PERF_SLACK_MS', 50) / 1000
+                self.assertLessEqual(
+                    seconds, limit,
+                    f'{key} took {seconds * 1000:.1f} ms, baseline {recorded["seconds"] * 1000:.1f} ms',
+                )
+        return response
+
+    def login(self, user=None):
+        user = user or self.seeded.users[0]
+        self.client.force_login(user)
+        return user
@@ -0,0 +1,126 @@
+import re
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Profile
+from cart.models import Item, Order
+from movies import trending
+from movies.models import Movie, Review, TrendingEpoch
+from recommendations.models import CoPurchase, MovieNeighbors
+
+from . import testing, timing
+from .management.commands.bench_load import MIX
+
+
+class BaselineUpdateTests(SimpleTestCase):
+    baseline = {'a': {'queries': 2, 'seconds': 0.01}, 'b': {'queries': 3, 'seconds': 0.02}}
+    measured = {'a': {'queries': 2, 'seconds': 0.015}, 'b': {'queries': 4, 'seconds': 0.02},
+                'c': {'queries': 1, 'seconds': 0.001}}
+
+    def test_only_new_and_changed_views_are_recorded_by_default(self):
+        self.assertEqual(set(testing.baseline_updates(self.measured, self.baseline, '1')), {'b', 'c'})
+
+    def test_named_keys_and_all_are_re_recorded(self):
+        self.assertEqual(set(testing.baseline_updates(self.measured, self.baseline, 'a')), {'a', 'b', 'c'})
+        self.assertEqual(testing.baseline_updates(self.measured, self.baseline, 'all'), self.measured)
+
+
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        timing.summaries.clear()
+
+    def metrics(self, response):
+        return {name: float(duration) for name, duration in re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing'])}
+
+    def test_header_reports_queries_templates_and_view(self):
+        response = self.client.get(reverse('home.index'))
+        metrics = self.metrics(response)
+        self.assertEqual(set(metrics), {'db', 'tpl', 'view', 'total'})
+        self.assertGreater(metrics['tpl'], 0)
+        self.assertLessEqual(metrics['view'], metrics['total'])
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    def test_summary_is_staff_only(self):
+        for _ in range(3):
+            self.client.get(reverse('home.index'))
+        self.client.get(reverse('movies.index'))
+        [home] = [row for row in timing.summaries.rows() if row['name'] == 'home.index']
+        self.assertEqual((home['requests'], home['queries'], home['max_queries']), (3, 1, 1))
+
+        self.client.force_login(User.objects.create_user('shopper'))
+        self.assertRedirects(self.client.get(reverse('perf.timings')),
+                             reverse('admin:login') + '?next=' + reverse('perf.timings'))
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        response = self.client.get(reverse('perf.timings'))
+        self.assertContains(response, '<td>home.index</td>', html=True)
+        self.assertContains(response, '<td>movies.index</td>', html=True)
+
+    def test_streamed_bodies_are_measured_to_the_end(self):
+        self.client.force_login(User.objects.create_user('mapper'))
+        url = reverse('movies.regional_trends_clusters') + '?bbox=-180,-85,180,85&zoom=3'
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+            b''.join(response.streaming_content)
+            response.close()
+        [row] = [row for row in timing.summaries.rows() if row['name'] == 'movies.regional_trends_clusters']
+        self.assertEqual(row['max_queries'], len(captured))
+
+    @override_settings(SERVER_TIMING=False)
+    def test_can_be_turned_off(self):
+        response = self.client.get(reverse('home.index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(timing.summaries.rows(), [])
+
+
+class SeedDataCommandTests(TestCase):
+    def test_seeds_the_requested_volumes(self):
+        out = StringIO()
+        call_command('seed_data', '--movies', 12, '--users', 6, '--reviews-per-movie', 2, '--orders', 9,
+                     '--items-per-order', 2, '--petitions', 1, '--votes-per-petition', 3, stdout=out)
+        self.assertEqual((Movie.objects.count(), Profile.objects.count(), Review.objects.count()), (12, 6, 24))
+        self.assertEqual((Order.objects.exclude(geohash='').count(), Item.objects.count()), (9, 18))
+        self.assertTrue(MovieNeighbors.objects.exists())
+        self.assertIn('12 movies', out.getvalue())
+
+
+class BenchLoadCommandTests(TransactionTestCase):
+    # The workers are threads with their own database connections, so the seeded rows have to be committed.
+
+    def test_small_run_reports_every_endpoint_without_failures(self):
+        call_command('seed_data', '--movies', 20, '--users', 4, '--reviews-per-movie', 2, '--orders', 10,
+                     '--petitions', 2, '--votes-per-petition', 2, stdout=StringIO())
+        out = StringIO()
+        call_command('bench_load', '--workers', 2, '--requests', 5, '--warmup', 0, stdout=out)
+        rows = {line.split()[0]: line.split() for line in out.getvalue().splitlines()[2:] if line.strip()}
+        self.assertEqual(set(rows), {label for label, *_ in MIX} | {'all'})
+        self.assertEqual(rows['all'][1:3], ['10', '0'])
+        self.assertNotIn('failed (status >= 400)', out.getvalue())
+
+
+class BenchCheckoutCommandTests(TransactionTestCase):
+    # Buyers are threads with their own connections, so the seeded rows have to be committed.
+
+    def setUp(self):
+        call_command('seed_data', '--movies', 10, '--users', 3, '--reviews-per-movie', 1, '--orders', 6,
+                     '--petitions', 0, stdout=StringIO())
+
+    def trending_now(self):
+        epoch = TrendingEpoch.objects.get().epoch
+        return {movie_id: round(trending.decayed(score, epoch), 3)
+                for movie_id, score in Movie.objects.values_list('id', 'trending_score')}
+
+    def test_cleanup_restores_what_checkout_updated(self):
+        scores = self.trending_now()
+        pairs = set(CoPurchase.objects.values_list('movie_id', 'other_id', 'orders'))
+        neighbors = dict(MovieNeighbors.objects.values_list('movie_id', 'movie_ids'))
+        call_command('bench_checkout', '--buyers', 2, '--orders', 2, '--cart-size', 4, '--mode', 'bulk',
+                     stdout=StringIO())
+        self.assertEqual(set(CoPurchase.objects.values_list('movie_id', 'other_id', 'orders')), pairs)
+        self.assertEqual(dict(MovieNeighbors.objects.values_list('movie_id', 'movie_ids')), neighbors)
+        self.assertEqual(self.trending_now(), scores)
@@ -0,0 +1,174 @@
+"""
+Where a request's time goes: SQL, template rendering and the view.
+
+perf.middleware.ServerTimingMiddleware starts a RequestTimings for every
+request and makes it current (a context variable, so threads and async
+tasks each have their own). While it is current,
+
+* every SQL statement on any database connection is counted and timed by a
+  connection execute_wrapper (one function call and two clock reads per
+  query), and
+* every top-level template render is timed by the template backend below
+  (TEMPLATES BACKEND 'perf.timing.DjangoTemplates'); {% include %} and
+  templates rendered from inside another template count once, as part of
+  the outer render.
+
+At the end of the request the middleware adds a Server-Timing header
+(visible in the browser's network panel) and records the request in
+summaries, a per-process rolling window of the last SERVER_TIMING_WINDOW
+requests of every URL name, which the staff page at /admin/perf/timings/
+shows. A streamed response sends its headers before its body is produced,
+so the header only covers the work done until then; the body is measured
+while it is sent and the request is recorded when it ends, so the summary
+has the full query count and time. Recording is a deque append under a lock; percentiles are only
+computed when the page is viewed.
+"""
+import contextvars
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends import django as django_backend
+from django.template.exceptions import TemplateDoesNotExist
+
+_current = contextvars.ContextVar('perf_request_timings', default=None)
+
+
+class RequestTimings:
+    """Counters for one request; times are in seconds."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.view = 0.0
+        self.total = 0.0
+        self._rendering = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # The execute_wrapper: time the statement and pass it on unchanged.
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def header(self):
+        """The Server-Timing header value, durations in milliseconds."""
+        return ', '.join([
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template * 1000:.1f}',
+            f'view;dur={self.view * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ])
+
+
+@contextmanager
+def measure(timings=None):
+    """
+    Make timings current for the block and instrument every database connection.
+
+    A new RequestTimings is started by default; passing one that was already
+    measured carries on adding to it (a streamed body, after the view).
+    """
+    timings = timings or RequestTimings()
+    token = _current.set(timings)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings))
+            yield timings
+    finally:
+        timings.total = time.perf_counter() - timings.started
+        _current.reset(token)
+
+
+def current():
+    """The RequestTimings of the request being handled, or None outside a measured request."""
+    return _current.get()
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return super().render(context, request)
+        timings._rendering += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings._rendering -= 1
+            if not timings._rendering:
+                timings.template += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The standard Django template backend, with rendering timed for the current request."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+class Summaries:
+    """Rolling per-URL-name windows of request timings, for this process."""
+
+    def __init__(self, window=None):
+        self.window = window
+        self._windows = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, timings):
+        sample = (timings.total, timings.view, timings.db, timings.queries, timings.template)
+        with self._lock:
+            samples = self._windows.get(name)
+            if samples is None:
+                samples = self._windows[name] = deque(maxlen=self.window or settings.SERVER_TIMING_WINDOW)
+            samples.append(sample)
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def rows(self):
+        """One dict per URL name, slowest p95 first; times in milliseconds."""
+        with self._lock:
+            windows = {name: list(samples) for name, samples in self._windows.items()}
+            counts = dict(self._counts)
+        rows = []
+        for name, samples in windows.items():
+            totals = sorted(sample[0] for sample in samples)
+            cuts = statistics.quantiles(totals, n=100) if len(totals) > 1 else totals * 99
+            rows.append({
+                'name': name,
+                'requests': counts[name],
+                'window': len(samples),
+                'p50': cuts[49] * 1000,
+                'p95': cuts[94] * 1000,
+                'max': totals[-1] * 1000,
+                'view': statistics.fmean(sample[1] for sample in samples) * 1000,
+                'db': statistics.fmean(sample[2] for sample in samples) * 1000,
+                'queries': statistics.fmean(sample[3] for sample in samples),
+                'max_queries': max(sample[3] for sample in samples),
+                'template': statistics.fmean(sample[4] for sample in samples) * 1000,
+            })
+        rows.sort(key=lambda row: row['p95'], reverse=True)
+        return rows
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+            self._counts.clear()
+
+
+summaries = Summaries()
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.contrib import admin
+from django.shortcuts import render
+
+from . import timing
+
+
+def timings(request):
+    #Staff-only (the URL wraps it in admin.site.admin_view): the rolling per-URL-name summary of request timings collected by perf.middleware.ServerTimingMiddleware in this server process.
+    context = admin.site.each_context(request)
+    context.update({
+        'title': 'Request timings',
+        'rows': timing.summaries.rows(),
+        'window': settings.SERVER_TIMING_WINDOW,
+        'enabled': settings.SERVER_TIMING,
+    })
+    return render(request, 'perf/timings.html', context)
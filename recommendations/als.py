@@ -0,0 +1,213 @@
+"""
+"Recommended for you": matrix factorization of the review ratings.
+
+Review.rating is explicit feedback, one 1-5 rating per (user, movie). train()
+factors the user x movie rating matrix R (mean-centred) into user factors U
+and movie factors V, R ~ U V^T, by alternating least squares: holding V
+fixed, every user's row of U is the solution of a small k x k linear system,
+and all of those systems are built and solved at once with NumPy (then the
+same for V with U fixed). Regularization is weighted by each row's number of
+ratings, so prolific reviewers are not over-fitted.
+
+The trained model is written by `manage.py train_recommender` as plain .npy
+files under RECOMMENDER_DIR/<version>/, and RECOMMENDER_DIR/CURRENT names
+the version in use; it is replaced atomically, so web workers never read a
+half-written model. Workers open the arrays with np.load(mmap_mode='r'):
+the file pages are shared through the OS page cache instead of being copied
+into every worker's heap, and only the pages a request touches are read.
+
+Scoring a user is one matrix-vector product, V @ u, over the whole catalog;
+movies the user already rated are skipped using the CSR index stored with
+the model (no database query).
+"""
+import json
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.utils import timezone
+
+from movies.models import Movie, Review
+
+CURRENT = 'CURRENT'
+ARRAYS = ('user_ids', 'user_factors', 'movie_ids', 'item_factors', 'rated_indptr', 'rated_indices')
+
+
+def _grams(np, fixed, rows, cols, values, n_rows, block_cells):
+    """
+    Per-row normal equations of the least-squares problem: A[r] = sum f f^T and b[r] = sum value * f
+    over the fixed-side factors f of row r's ratings (rows must be sorted).
+
+    Only the ratings themselves are visited: the outer products f f^T are formed for a chunk of
+    ratings at a time and summed per row with np.add.reduceat, so time and memory grow with the
+    number of ratings, not with users x movies. A chunk holds at most block_cells floats of outer
+    products; a row split across two chunks is simply added to twice.
+    """
+    k = fixed.shape[1]
+    grams = np.zeros((n_rows, k, k))
+    targets = np.zeros((n_rows, k))
+    step = max(1, block_cells // (k * k))
+    for lo in range(0, len(rows), step):
+        hi = min(lo + step, len(rows))
+        chunk = rows[lo:hi]
+        factors = fixed[cols[lo:hi]]
+        starts = np.flatnonzero(np.r_[True, chunk[1:] != chunk[:-1]])
+        present = chunk[starts]
+        grams[present] += np.add.reduceat(factors[:, :, None] * factors[:, None, :], starts)
+        targets[present] += np.add.reduceat(factors * values[lo:hi, None], starts)
+    return grams, targets
+
+
+def _solve(np, fixed, rows, cols, values, n_rows, regularization, block_cells):
+    grams, targets = _grams(np, fixed, rows, cols, values, n_rows, block_cells)
+    counts = np.bincount(rows, minlength=n_rows)
+    # Weighted-lambda regularization; rows with no ratings solve to zero.
+    grams += (regularization * np.maximum(counts, 1))[:, None, None] * np.eye(fixed.shape[1])
+    return np.linalg.solve(grams, targets[..., None])[..., 0]
+
+
+def train(factors=32, iterations=10, regularization=0.1, random_seed=0, block_cells=100_000, callback=None):
+    """
+    Fit U and V on every review. Returns a dict of arrays ready for save().
+
+    callback(iteration, rmse) is called after each iteration with the
+    training RMSE, for progress reporting.
+    """
+    import numpy as np
+
+    ratings = np.array(list(Review.objects.values_list('user_id', 'movie_id', 'rating')),
+                       dtype=np.int64).reshape(-1, 3)
+    user_ids, users = np.unique(ratings[:, 0], return_inverse=True)
+    movie_ids, items = np.unique(ratings[:, 1], return_inverse=True)
+    mean = float(ratings[:, 2].mean()) if len(ratings) else 0.0
+    values = ratings[:, 2] - mean
+
+    rng = np.random.default_rng(random_seed)
+    user_factors = np.zeros((len(user_ids), factors))
+    item_factors = rng.normal(scale=0.1, size=(len(movie_ids), factors))
+    by_user = np.lexsort((items, users))
+    by_item = np.lexsort((users, items))
+
+    for iteration in range(1, iterations + 1):
+        user_factors = _solve(np, item_factors, users[by_user], items[by_user], values[by_user],
+                              len(user_ids), regularization, block_cells)
+        item_factors = _solve(np, user_factors, items[by_item], users[by_item], values[by_item],
+                              len(movie_ids), regularization, block_cells)
+        if callback is not None and len(ratings):
+            errors = values - np.einsum('ij,ij->i', user_factors[users], item_factors[items])
+            callback(iteration, float(np.sqrt(np.mean(errors ** 2))))
+
+    # Which movies each user rated, as CSR over the dense indexes, so scoring can skip them.
+    rated_indptr = np.r_[0, np.cumsum(np.bincount(users, minlength=len(user_ids)))]
+    return {
+        'user_ids': user_ids,
+        'user_factors': user_factors.astype(np.float32),
+        'movie_ids': movie_ids,
+        'item_factors': item_factors.astype(np.float32),
+        'rated_indptr': rated_indptr.astype(np.int64),
+        'rated_indices': items[by_user].astype(np.int32),
+        'meta': {'factors': factors, 'iterations': iterations, 'regularization': regularization,
+                 'mean': mean, 'ratings': int(len(ratings))},
+    }
+
+
+def save(model, directory=None, keep=2):
+    """Write model as a new version and make it current. Returns the version name."""
+    import numpy as np
+
+    directory = directory or settings.RECOMMENDER_DIR
+    version = timezone.now().strftime('%Y%m%d%H%M%S%f')
+    target = os.path.join(directory, version)
+    os.makedirs(target)
+    for name in ARRAYS:
+        np.save(os.path.join(target, f'{name}.npy'), model[name])
+    with open(os.path.join(target, 'meta.json'), 'w') as fh:
+        json.dump({**model['meta'], 'trained_at': timezone.now().isoformat()}, fh)
+
+    # os.replace is atomic, so a worker sees either the old version or the new one.
+    pointer = os.path.join(directory, CURRENT + '.tmp')
+    with open(pointer, 'w') as fh:
+        fh.write(version)
+    os.replace(pointer, os.path.join(directory, CURRENT))
+
+    versions = sorted(name for name in os.listdir(directory) if name.isdigit())
+    for old in versions[:-keep]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return version
+
+
+@dataclass
+class Model:
+    version: str
+    user_ids: object
+    user_factors: object
+    movie_ids: object
+    item_factors: object
+    rated_indptr: object
+    rated_indices: object
+
+    def recommend(self, user_id, count):
+        """Ids of the count best-scoring movies the user has not rated, best first."""
+        import numpy as np
+
+        row = int(np.searchsorted(self.user_ids, user_id))
+        if row >= len(self.user_ids) or self.user_ids[row] != user_id:
+            return []
+        scores = self.item_factors @ self.user_factors[row]
+        scores[self.rated_indices[self.rated_indptr[row]:self.rated_indptr[row + 1]]] = -np.inf
+        count = min(count, int(np.isfinite(scores).sum()))
+        if count <= 0:
+            return []
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return self.movie_ids[best].tolist()
+
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def current_version(directory=None):
+    try:
+        with open(os.path.join(directory or settings.RECOMMENDER_DIR, CURRENT)) as fh:
+            return fh.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load(directory=None):
+    """The current model, memory-mapped, or None before the first training run."""
+    import numpy as np
+
+    directory = directory or settings.RECOMMENDER_DIR
+    version = current_version(directory)
+    if version is None:
+        return None
+    key = (directory, version)
+    model = _loaded.get(key)
+    if model is None:
+        with _lock:
+            model = _loaded.get(key)
+            if model is None:
+                path = os.path.join(directory, version)
+                model = Model(version, **{
+                    name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in ARRAYS})
+                # Only the newest model of each directory stays open.
+                for stale in [k for k in _loaded if k[0] == directory]:
+                    del _loaded[stale]
+                _loaded[key] = model
+    return model
+
+
+def recommended_for(user, count=None):
+    """Movies recommended to user, best first; empty for users the model has not seen."""
+    model = load()
+    if model is None or not user.is_authenticated:
+        return []
+    ids = model.recommend(user.id, count or settings.RECOMMENDATIONS_COUNT)
+    if not ids:
+        return []
+    movies = Movie.objects.only('id', 'name', 'image', 'image_variants', 'price').in_bulk(ids)
+    return [movies[pk] for pk in ids if pk in movies]
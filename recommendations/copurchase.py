@@ -0,0 +1,152 @@
+"""
+"Customers who bought this also bought": item-to-item co-purchase counts.
+
+Two movies are neighbours when they appear in the same order. The pair
+counts live in CoPurchase (both directions) and the COPURCHASE_NEIGHBORS
+best neighbours of every movie are kept, ranked, in one MovieNeighbors row.
+
+* record_order() is called by checkout for each new order. It bumps the
+  order's pairs and re-ranks the neighbours of the movies in it, in a fixed
+  number of queries however big the cart is.
+* build() recomputes everything from the Item table. The pair counts are
+  the sparse product X^T X of the order x movie incidence matrix X; NumPy
+  builds it from the (order, movie) pairs without materializing X, a chunk
+  of orders at a time, and ranks neighbours with one lexsort.
+* also_bought() is what the movie page calls: one primary-key lookup for
+  the ranked ids and one query for those movies.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from cart.models import Item
+from movies.models import Movie
+from moviestore.topk import top_k
+
+from .models import CoPurchase, MovieNeighbors
+
+
+def record_order(movie_ids):
+    """Count one co-purchase for every pair of distinct movies in an order and re-rank their neighbours."""
+    movie_ids = sorted(set(movie_ids))
+    if len(movie_ids) < 2:
+        return
+    # One statement for all n * (n - 1) pairs: the pairs come from a self-join of the catalog, new ones are
+    # inserted with a count of 1 and existing ones are incremented (INSERT ... ON CONFLICT DO UPDATE).
+    table = connection.ops.quote_name(CoPurchase._meta.db_table)
+    movies = connection.ops.quote_name(Movie._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(movie_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (movie_id, other_id, orders) "
+            f"SELECT a.id, b.id, 1 FROM {movies} a, {movies} b "
+            f"WHERE a.id IN ({placeholders}) AND b.id IN ({placeholders}) AND a.id <> b.id "
+            f"ON CONFLICT (movie_id, other_id) DO UPDATE SET orders = {table}.orders + 1",
+            movie_ids + movie_ids,
+        )
+    refresh_neighbors(movie_ids)
+
+
+def refresh_neighbors(movie_ids, k=None):
+    """Re-rank the neighbours of movie_ids from CoPurchase with one window query, and upsert them."""
+    k = k or settings.COPURCHASE_NEIGHBORS
+    ranked = top_k(
+        CoPurchase.objects.filter(movie_id__in=movie_ids).values('movie_id', 'other_id', 'orders'),
+        ['movie_id'], (F('orders').desc(), F('other_id').asc()), k,
+    ).order_by('movie_id', 'rank')
+    neighbors = {}
+    for row in ranked:
+        entry = neighbors.setdefault(row['movie_id'], MovieNeighbors(movie_id=row['movie_id']))
+        entry.movie_ids.append(row['other_id'])
+        entry.counts.append(row['orders'])
+    MovieNeighbors.objects.bulk_create(
+        neighbors.values(), update_conflicts=True, unique_fields=['movie'],
+        update_fields=['movie_ids', 'counts', 'updated_at'])
+
+
+def also_bought(movie_id):
+    """Movies most often bought together with movie_id, best first."""
+    ids = MovieNeighbors.objects.filter(movie_id=movie_id).values_list('movie_ids', flat=True).first()
+    if not ids:
+        return []
+    movies = Movie.objects.only('id', 'name', 'image', 'image_variants').in_bulk(ids)
+    return [movies[pk] for pk in ids if pk in movies]
+
+
+def _pair_counts(np, order_ids, movie_index, size):
+    """
+    Co-purchase counts for one chunk of (order, movie) rows sorted by order.
+
+    Returns (keys, counts) with key = a * size + b for every ordered pair
+    a != b of dense movie indexes that share an order.
+    """
+    starts = np.flatnonzero(np.r_[True, order_ids[1:] != order_ids[:-1]])
+    sizes = np.diff(np.r_[starts, len(order_ids)])
+    group = np.repeat(np.arange(len(starts)), sizes)
+    # Pair every row with every row of its own order: row i is repeated once per row in its order.
+    per_row = sizes[group]
+    left = np.repeat(np.arange(len(order_ids)), per_row)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+    right = np.repeat(starts[group], per_row) + offsets
+    keep = left != right
+    keys = movie_index[left[keep]].astype(np.int64) * size + movie_index[right[keep]]
+    return np.unique(keys, return_counts=True)
+
+
+def _merge(np, keys, counts, more_keys, more_counts):
+    keys, inverse = np.unique(np.concatenate([keys, more_keys]), return_inverse=True)
+    return keys, np.bincount(inverse, weights=np.concatenate([counts, more_counts])).astype(np.int64)
+
+
+def build(k=None, chunk_orders=5000, batch_size=2000):
+    """
+    Rebuild CoPurchase and MovieNeighbors from every order. Returns (pairs, movies with neighbours).
+
+    Meant for the first deployment and for repairs; day to day, checkout
+    keeps both tables current through record_order().
+    """
+    import numpy as np
+
+    k = k or settings.COPURCHASE_NEIGHBORS
+    rows = np.array(list(Item.objects.order_by('order_id', 'movie_id').distinct()
+                         .values_list('order_id', 'movie_id')), dtype=np.int64).reshape(-1, 2)
+    if not len(rows):
+        with transaction.atomic():
+            CoPurchase.objects.all().delete()
+            MovieNeighbors.objects.all().delete()
+        return 0, 0
+    movie_ids, movie_index = np.unique(rows[:, 1], return_inverse=True)
+    size = len(movie_ids)
+
+    keys, counts = np.empty(0, np.int64), np.empty(0, np.int64)
+    order_starts = np.flatnonzero(np.r_[True, rows[1:, 0] != rows[:-1, 0]])
+    for first in range(0, len(order_starts), chunk_orders):
+        begin = order_starts[first]
+        end = order_starts[first + chunk_orders] if first + chunk_orders < len(order_starts) else len(rows)
+        chunk_keys, chunk_counts = _pair_counts(np, rows[begin:end, 0], movie_index[begin:end], size)
+        keys, counts = _merge(np, keys, counts, chunk_keys, chunk_counts)
+
+    pair_movie, pair_other = keys // size, keys % size
+    # Sort by movie, then most shared orders, then other id; the first k rows of each movie are its neighbours.
+    order = np.lexsort((movie_ids[pair_other], -counts, pair_movie))
+    movie, other, ranked_counts = pair_movie[order], pair_other[order], counts[order]
+    group_start = np.flatnonzero(np.r_[True, movie[1:] != movie[:-1]]) if len(movie) else np.empty(0, np.int64)
+    rank = np.arange(len(movie)) - np.repeat(group_start, np.diff(np.r_[group_start, len(movie)]))
+    top = rank < k
+
+    neighbors = {}
+    for a, b, count in zip(movie_ids[movie[top]].tolist(), movie_ids[other[top]].tolist(),
+                           ranked_counts[top].tolist()):
+        entry = neighbors.setdefault(a, MovieNeighbors(movie_id=a))
+        entry.movie_ids.append(b)
+        entry.counts.append(count)
+
+    with transaction.atomic():
+        CoPurchase.objects.all().delete()
+        CoPurchase.objects.bulk_create((
+            CoPurchase(movie_id=a, other_id=b, orders=count)
+            for a, b, count in zip(movie_ids[pair_movie].tolist(), movie_ids[pair_other].tolist(), counts.tolist())
+        ), batch_size=batch_size)
+        MovieNeighbors.objects.all().delete()
+        MovieNeighbors.objects.bulk_create(neighbors.values(), batch_size=batch_size)
+    return len(keys), len(neighbors)
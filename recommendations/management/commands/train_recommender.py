@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recommendations import als
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the rating-based recommender (alternating least squares over every review) and publish it "
+        "as a memory-mapped model in RECOMMENDER_DIR. Running web workers pick it up on their next request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=32, help="Latent factors per user and movie.")
+        parser.add_argument('--iterations', type=int, default=10, help="ALS sweeps (users, then movies).")
+        parser.add_argument('--regularization', type=float, default=0.1,
+                            help="L2 penalty, scaled by each user's or movie's number of ratings.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the initial movie factors.")
+        parser.add_argument('--keep', type=int, default=2, help="Model versions kept on disk, the current one included.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def report(iteration, rmse):
+            if options['verbosity'] > 1 or iteration == options['iterations']:
+                self.stdout.write(f"  iteration {iteration}: training RMSE {rmse:.4f}")
+
+        model = als.train(factors=options['factors'], iterations=options['iterations'],
+                          regularization=options['regularization'], random_seed=options['seed'], callback=report)
+        version = als.save(model, keep=options['keep'])
+        meta = model['meta']
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained on {meta['ratings']} ratings from {len(model['user_ids'])} users and "
+            f"{len(model['movie_ids'])} movies in {time.perf_counter() - started:.1f}s; "
+            f"published version {version} in {settings.RECOMMENDER_DIR}."))
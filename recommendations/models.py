@@ -0,0 +1,47 @@
+from django.db import models
+
+from movies.models import Movie
+
+
+class CoPurchase(models.Model):
+    """
+    How many orders contained both movie and other.
+
+    Every pair is stored in both directions, so "what was bought with X" is
+    a range scan on (movie, orders). Checkout bumps the pairs of each new
+    order; `manage.py build_copurchases` rebuilds the table from all Items.
+    """
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+
+    #orders: number of orders that included both movies.
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'other'], name='copurchase_unique_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['movie', '-orders'], name='copurchase_movie_orders_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.movie_id} + {self.other_id}: {self.orders}'
+
+
+class MovieNeighbors(models.Model):
+    """
+    The COPURCHASE_NEIGHBORS movies most often bought together with a movie, precomputed.
+
+    One row per movie holding the ranked ids, so the movie page reads its
+    "also bought" list with a single primary-key lookup.
+    """
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='+')
+
+    #movie_ids: neighbour movie ids, most co-purchased first; counts holds the matching number of shared orders.
+    movie_ids = models.JSONField(default=list)
+    counts = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Neighbours of {self.movie_id}'
@@ -0,0 +1,135 @@
+import shutil
+import tempfile
+from io import StringIO
+
+import numpy as np
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+
+from cart import checkout
+from movies.models import Review
+from perf.testing import ViewBudgetTestCase
+
+from . import als, copurchase
+from .models import CoPurchase, MovieNeighbors
+
+
+class CoPurchaseTests(ViewBudgetTestCase):
+    seed_options = {'movies': 8, 'users': 2, 'orders': 0}
+
+    def setUp(self):
+        self.buyer = self.seeded.users[0]
+        self.m = self.seeded.movies
+
+    def buy(self, *movies):
+        checkout.place_order(self.buyer, {movie.id: 1 for movie in movies})
+
+    def neighbors(self, movie):
+        return MovieNeighbors.objects.get(movie_id=movie.id)
+
+    def test_checkout_updates_pairs_and_neighbours(self):
+        self.buy(self.m[0], self.m[1], self.m[2])
+        self.buy(self.m[0], self.m[2])
+        self.buy(self.m[3])
+        self.assertEqual(CoPurchase.objects.get(movie_id=self.m[0].id, other_id=self.m[2].id).orders, 2)
+        self.assertEqual(CoPurchase.objects.get(movie_id=self.m[2].id, other_id=self.m[0].id).orders, 2)
+        self.assertEqual(CoPurchase.objects.count(), 6)
+        neighbors = self.neighbors(self.m[0])
+        self.assertEqual((neighbors.movie_ids, neighbors.counts), ([self.m[2].id, self.m[1].id], [2, 1]))
+        self.assertFalse(MovieNeighbors.objects.filter(movie_id=self.m[3].id).exists())
+
+    def test_neighbour_lists_are_capped(self):
+        with self.settings(COPURCHASE_NEIGHBORS=2):
+            self.buy(*self.m[:5])
+        self.assertEqual(len(self.neighbors(self.m[0]).movie_ids), 2)
+
+    def test_batch_build_matches_incremental_updates(self):
+        baskets = [self.m[:4], self.m[2:6], self.m[::2], [self.m[1], self.m[7]], self.m[3:5], self.m[:2]]
+        for basket in baskets:
+            self.buy(*basket)
+        incremental_pairs = set(CoPurchase.objects.values_list('movie_id', 'other_id', 'orders'))
+        incremental = {n.movie_id: (n.movie_ids, n.counts) for n in MovieNeighbors.objects.all()}
+
+        out = StringIO()
+        # Small chunks make the build merge counts across chunks.
+        call_command('build_copurchases', '--chunk-orders', '2', stdout=out)
+        self.assertIn(f'Counted {len(incremental_pairs)} co-purchased pairs', out.getvalue())
+        self.assertEqual(set(CoPurchase.objects.values_list('movie_id', 'other_id', 'orders')), incremental_pairs)
+        self.assertEqual({n.movie_id: (n.movie_ids, n.counts) for n in MovieNeighbors.objects.all()}, incremental)
+
+    def test_movie_page_shows_also_bought(self):
+        self.buy(self.m[0], self.m[1])
+        response = self.client.get(reverse('movies.show', args=[self.m[0].id]))
+        self.assertEqual(response.context['template_data']['also_bought'], [self.m[1]])
+        self.assertContains(response, 'Customers who bought this also bought')
+        self.assertContains(response, reverse('movies.show', args=[self.m[1].id]))
+        self.assertEqual(copurchase.also_bought(self.m[5].id), [])
+
+
+class RecommenderTests(ViewBudgetTestCase):
+    seed_options = {'movies': 40, 'users': 30, 'reviews_per_movie': 12, 'orders': 0}
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.enterContext(override_settings(RECOMMENDER_DIR=directory))
+
+    def train(self, *args):
+        out = StringIO()
+        call_command('train_recommender', '--factors', '8', '--iterations', '8', *args, stdout=out)
+        return out.getvalue()
+
+    def test_training_fits_the_ratings_and_publishes_a_memory_mapped_model(self):
+        output = self.train()
+        self.assertIn(f'Trained on {Review.objects.count()} ratings', output)
+        rmse = float(output.split('training RMSE ')[1].split()[0])
+        ratings = np.array(list(Review.objects.values_list('rating', flat=True)))
+        # Better than always predicting the mean rating.
+        self.assertLess(rmse, ratings.std())
+
+        model = als.load()
+        self.assertIsInstance(model.item_factors, np.memmap)
+        self.assertEqual(model.item_factors.shape, (Review.objects.values('movie').distinct().count(), 8))
+        self.assertIs(als.load(), model)
+
+    def test_normal_equations_only_visit_the_ratings(self):
+        rng = np.random.default_rng(0)
+        fixed = rng.normal(size=(50, 4))
+        rows = np.array([0, 0, 0, 2, 2, 3, 3, 3, 3])
+        cols = np.array([1, 7, 9, 0, 49, 2, 3, 5, 8])
+        values = rng.normal(size=len(rows))
+        # block_cells=32 puts two ratings in a chunk, so rows 0 and 3 are split across chunks.
+        grams, targets = als._grams(np, fixed, rows, cols, values, 4, block_cells=32)
+        for row in range(4):
+            f = fixed[cols[rows == row]]
+            np.testing.assert_allclose(grams[row], f.T @ f)
+            np.testing.assert_allclose(targets[row], values[rows == row] @ f)
+
+    def test_recommendations_skip_rated_movies(self):
+        self.train()
+        user = self.seeded.users[0]
+        rated = set(Review.objects.filter(user=user).values_list('movie_id', flat=True))
+        ids = als.load().recommend(user.id, 100)
+        self.assertEqual(len(ids) + len(rated), Review.objects.values('movie').distinct().count())
+        self.assertFalse(rated & set(ids))
+        self.assertEqual(als.load().recommend(-1, 5), [])
+
+    def test_retraining_swaps_the_current_version(self):
+        self.train()
+        first = als.load()
+        self.train('--keep', '1')
+        second = als.load()
+        self.assertNotEqual(first.version, second.version)
+        self.assertEqual(als.current_version(), second.version)
+
+    def test_home_page_recommends_for_signed_in_users(self):
+        self.train()
+        user = self.login()
+        # One extra query over the plain home page: the recommended movies themselves.
+        self.assertViewBudget('home.index[recommended]', 4, reverse('home.index'), status=200)
+        response = self.client.get(reverse('home.index'))
+        recommended = response.context['template_data']['recommended']
+        self.assertEqual(len(recommended), 6)
+        self.assertEqual([movie.id for movie in recommended], als.load().recommend(user.id, 6))
+        self.assertContains(response, 'Recommended for you')